@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,15 +39,22 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
-    ]
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'clients.pagination.KeysetPagination',
+    'DEFAULT_FILTER_BACKENDS': [
+        'clients.filters.IndexedFilter',
+        'clients.filters.IndexedOrderingFilter',
+    ],
 }
 
 MIDDLEWARE = [
+    'clients.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'clients.replica.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -82,9 +90,75 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Соединение переживает запрос и проверяется перед повторным использованием
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Транзакция сразу берет блокировку записи и ждет ее по busy_timeout,
+            # а не падает с "database is locked" при первой записи после чтения
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+}
+
+# Реплика для чтения (clients/replica.py): безопасные запросы к вьюсетам API
+# читают из нее. Локально - копия db.sqlite3, которую обновляет команда
+# sync_replica (с --interval - периодически, имитируя отставание)
+READ_REPLICA = False
+REPLICA_DATABASE = 'replica'
+if READ_REPLICA:
+    DATABASES[REPLICA_DATABASE] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['clients.replica.ReplicaRouter']
+
+# Прагмы SQLite для каждого соединения (clients/sqlite.py): 'production' - WAL
+# и настройки для одновременных чтения и записи, 'default' - умолчания SQLite.
+# WAL меняет формат файла базы, поэтому включается только при развертывании
+# (переменная окружения SQLITE_PROFILE=production), а не для базы в репозитории
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'default')
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Кэш ответов справочников API (clients/cache.py)
+API_RESPONSE_CACHE_ALIAS = 'default'
+API_RESPONSE_CACHE_TIMEOUT = 60 * 60
+
+# Наибольшее число строк в каждом наборе /api/bootstrap/ (clients/bootstrap.py)
+BOOTSTRAP_ROW_LIMIT = 1000
+
+# Наибольшее (и по умолчанию) число пар в ответе /api/lookups/<набор>/ (clients/lookups.py)
+LOOKUP_MAX_LIMIT = 1000
+
+# Наибольшее число вложенных запросов в одном пакете /api/batch/ (clients/batch.py)
+BATCH_MAX_REQUESTS = 20
+
+# Адреса и сети, которым отвечает /metrics (clients/metrics.py); сеть сборщика
+# Prometheus добавляется в настройках развертывания
+METRICS_ALLOWED_NETWORKS = ['127.0.0.1/32', '::1/128']
+
+# Журнал медленных SQL-запросов (clients/slowlog.py): порог в секундах и файл,
+# из которого команда slow_queries собирает сводку. Выключен; включается в
+# настройках развертывания, например SLOW_QUERY_THRESHOLD = 0.1 и
+# SLOW_QUERY_LOG = '/var/log/app/slow_queries.log' (None - только лог clients.slowlog)
+SLOW_QUERY_THRESHOLD = None
+SLOW_QUERY_LOG = None
+
+# Миниатюры изображений (clients/thumbnails.py): наибольшая сторона в пикселях
+# и число потоков пула; 0 - строить сразу, без пула
+THUMBNAIL_SIZE = 128
+THUMBNAIL_WORKERS = 2
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
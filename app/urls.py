@@ -1,12 +1,13 @@
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 
 from clients import views
+from clients.async_api import async_urls
+from clients.batch import batch_view
 from rest_framework.routers import DefaultRouter
 from debug_toolbar.toolbar import debug_toolbar_urls
 
 from django.conf import settings
-from django.conf.urls.static import static
 
 from clients.api import ClientsViewset, ProjectsViewset, FavoursViewset, EmployeesViewset, ProjectServiceViewSet, ReviewViewSet, UserViewSet,UserProfileViewSet
 
@@ -22,6 +23,17 @@ router.register("user-profiles", UserProfileViewSet, basename="user-profiles")
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('api/user-directory/', views.user_directory, name='user-directory'),
+    path('api/search/', views.search_view, name='search'),
+    path('api/bootstrap/', views.bootstrap_view, name='bootstrap'),
+    path('api/lookups/<slug:resource>/', views.lookup_view, name='lookups'),
+    path('api/async/', include(async_urls(router.registry))),
+    path('api/batch/', batch_view(router), name='batch'),
     path('api/', include(router.urls)),
-    path('api/users/', views.user_list, name='user-list'),  # Добавьте эту строку
-] + debug_toolbar_urls() + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+] + debug_toolbar_urls()
+
+if settings.DEBUG:
+    # В продакшене загруженные файлы отдает веб-сервер (правило для заголовков - в clients/storage.py)
+    urlpatterns.append(
+        re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.*)$", views.media_view, name='media'))
@@ -0,0 +1,33 @@
+import axios from "axios"
+
+// Все страницы списка API: курсорная пагинация отдает по page_size строк и ссылку next,
+// поэтому идем по next до конца, а не читаем только первую страницу
+export async function fetchAllPages(url, params = {}) {
+  let r = await axios.get(url, { params: { page_size: 1000, ...params } });
+  const rows = [...r.data.results];
+  while (r.data.next) {
+    r = await axios.get(r.data.next);
+    rows.push(...r.data.results);
+  }
+  return rows;
+}
+
+// Справочные таблицы для первой загрузки страницы одним запросом (/api/bootstrap/).
+// Сервер отдает столбцы и строки-массивы; здесь они превращаются в списки объектов.
+// truncated - имена таблиц, которые сервер обрезал по BOOTSTRAP_ROW_LIMIT: об этом надо сказать пользователю.
+export async function fetchBootstrap(include) {
+  const r = await axios.get("/api/bootstrap/", { params: { include: include.join(",") } });
+  const tables = {};
+  const truncated = [];
+  for (const [name, table] of Object.entries(r.data)) {
+    tables[name] = table.rows.map(row => Object.fromEntries(table.columns.map((column, i) => [column, row[i]])));
+    if (table.truncated) truncated.push(name);
+  }
+  return { tables, truncated };
+}
+
+// Пары [id, подпись] для выпадающего списка (/api/lookups/<набор>/) как объекты { id, label }
+export async function fetchLookup(resource, params = {}) {
+  const r = await axios.get(`/api/lookups/${resource}/`, { params });
+  return r.data.map(([id, label]) => ({ id, label }));
+}
@@ -1,8 +1,36 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from django.db.models import Q
 
 from clients.models import Client, Project, Favour, Employee, ProjectService, Review
+from clients.search import search_condition
+
+
+class FullTextSearchMixin:
+    """Поиск админки через индекс FTS5 вместо LIKE '%...%' по JOIN
+
+    ``search_index = {'тип документа': 'путь к id'}`` связывает найденные
+    документы clients.search с объектами списка. ``search_fields``, если есть,
+    остаются для коротких полей вне индекса и ищут по началу строки.
+    """
+    search_index = {}
+
+    def get_search_fields(self, request):
+        # Без search_fields Django не показывает строку поиска
+        return super().get_search_fields(request) or ['pk']
+
+    def get_search_results(self, request, queryset, search_term):
+        condition = search_condition(search_term, self.search_index)
+        if condition is None:
+            if not self.search_fields and search_term.strip():
+                return queryset.none(), False
+            return super().get_search_results(request, queryset, search_term)
+        if not self.search_fields:
+            return queryset.filter(condition), False
+        found, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        return queryset.filter(condition | Q(pk__in=found.values('pk'))), False
+
 
 # Расширяем стандартную админку User
 class ClientInline(admin.StackedInline):
@@ -32,44 +60,48 @@ admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 
 @admin.register(Client)
-class ClientAdmin(admin.ModelAdmin):
+class ClientAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['user_info', 'sphere', 'company_name']
-    search_fields = ['user__username', 'user__userprofile__fio', 'company_name', 'sphere']
+    search_fields = ['^user__username', '^company_name', '^sphere']
+    search_index = {'user': 'user'}
     
     def user_info(self, obj):
         return obj.user.userprofile.fio or obj.user.username
     user_info.short_description = "Клиент"
 
 @admin.register(Project)
-class ProjectAdmin(admin.ModelAdmin):
+class ProjectAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['name', 'client_info', 'deadline', 'status', 'budget']
     list_filter = ['status', 'start_date']
-    search_fields = ['name', 'client_user__userprofile__fio', 'client_user__username']
+    search_fields = ['^client_user__username']
+    search_index = {'project': 'pk', 'user': 'client_user'}
     
     def client_info(self, obj):
         return obj.client_user.userprofile.fio or obj.client_user.username
     client_info.short_description = "Клиент"
 
 @admin.register(Favour)
-class FavourAdmin(admin.ModelAdmin):
+class FavourAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['name', 'category', 'price']
-    search_fields = ['name', 'category']
+    search_fields = ['^category']
+    search_index = {'favour': 'pk'}
     list_filter = ['category']
 
 @admin.register(Employee)
-class EmployeeAdmin(admin.ModelAdmin):
+class EmployeeAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['user_info', 'position', 'start_work_date']
-    search_fields = ['user__username', 'user__userprofile__fio', 'position']
+    search_fields = ['^user__username', '^position']
+    search_index = {'user': 'user'}
     
     def user_info(self, obj):
         return obj.user.userprofile.fio or obj.user.username
     user_info.short_description = "Сотрудник"
 
 @admin.register(ProjectService)
-class ProjectServiceAdmin(admin.ModelAdmin):
+class ProjectServiceAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['project', 'favour', 'employee_info', 'status', 'hours_spent']
     list_filter = ['status', 'start_date']
-    search_fields = ['project__name', 'favour__name', 'employee_user__userprofile__fio']
+    search_index = {'service': 'pk', 'project': 'project', 'favour': 'favour', 'user': 'employee_user'}
     
     def employee_info(self, obj):
         if obj.employee_user:
@@ -78,10 +110,10 @@ class ProjectServiceAdmin(admin.ModelAdmin):
     employee_info.short_description = "Сотрудник"
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['project', 'client_info', 'rating', 'created_at']
     list_filter = ['rating', 'created_at']
-    search_fields = ['project__name', 'feedback']
+    search_index = {'review': 'pk', 'project': 'project'}
     
     def client_info(self, obj):
         return obj.project.client_user.userprofile.fio or obj.project.client_user.username
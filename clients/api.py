@@ -1,13 +1,143 @@
+from django.db import transaction
 from rest_framework.viewsets import GenericViewSet
-from rest_framework import mixins, viewsets
+from rest_framework import mixins, viewsets, status, serializers
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
 from clients.models import Client, Project, Favour, Employee, ProjectService, Review
 from django.contrib.auth.models import User
 from general.models import UserProfile
-from clients.serializers import ClientSerializer, ProjectSerializer, FavourSerializer, EmployeeSerializer, ProjectServiceSerializer, ReviewSerializer, UserSerializer, UserProfileSerializer
+from clients.stats import rebuild_project_stats
+from clients.cache import ResponseCacheMixin, favours_cache
+from clients.metrics import serializer_timer
+from clients.readplan import read_plan
+from clients.search import index_objects
+from clients.versions import bump_versions, etag_matches, make_etag, not_modified, related_models
+from clients.serializers import ClientSerializer, ProjectSerializer, FavourSerializer, EmployeeSerializer, ProjectServiceSerializer, ReviewSerializer, UserSerializer, UserProfileSerializer, ProjectServiceBulkSerializer, ProjectDashboardSerializer
 
 
-class ClientsViewset(mixins.CreateModelMixin,
+class EagerLoadingViewSetMixin:
+    """Подгружает связи, объявленные сериализатором, одним запросом
+
+    На чтение принимает ``?fields=id,name`` и ``?omit=description``: выборка
+    сужает и вывод, и список столбцов запроса. Запись всегда идет полным набором.
+    """
+
+    def get_sparse_fields(self):
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = None
+            serializer_class = self.get_serializer_class()
+            if self.request is not None and self.request.method in ('GET', 'HEAD') \
+                    and hasattr(serializer_class, 'select_fields'):
+                params = self.request.query_params
+                fields, omit = (
+                    [name for name in params[key].split(',') if name] if key in params else None
+                    for key in ('fields', 'omit')
+                )
+                self._sparse_fields = serializer_class.select_fields(fields, omit)
+        return self._sparse_fields
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset, fields=self.get_sparse_fields())
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+
+class ValuesListMixin:
+    """list через план чтения из values() вместо обхода моделей сериализатором
+
+    Вывод совпадает с сериализатором; если план для сериализатора построить
+    нельзя или ``values_list`` выключен, list работает как обычно.
+    """
+    values_list = True
+
+    def get_read_plan(self, queryset):
+        if not self.values_list:
+            return None
+        return read_plan(self.get_serializer_class(), self.get_sparse_fields(), queryset)
+
+    def list_rows(self, queryset, plan):
+        """values() для списка: столбцы плана и столбцы порядка постраничного вывода"""
+        paths = list(plan.paths)
+        if self.paginator is not None and hasattr(self.paginator, 'get_ordering'):
+            # Курсор берет позицию из строки, поэтому столбцы порядка тоже читаем
+            ordering = self.paginator.get_ordering(self.request, queryset, self)
+            paths.extend(name.lstrip('-') for name in ordering if name.lstrip('-') not in paths)
+        return queryset.prefetch_related(None).values(*paths)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        plan = self.get_read_plan(queryset)
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        rows = self.list_rows(queryset, plan)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            with serializer_timer():
+                data = plan.render(page, self.get_serializer_context())
+            return self.get_paginated_response(data)
+        rows = list(rows)
+        with serializer_timer():
+            data = plan.render(rows, self.get_serializer_context())
+        return Response(data)
+
+
+class ReplicaReadMixin:
+    """Безопасные запросы к вьюсету читают из реплики, если она настроена (clients/replica.py)"""
+    replica_reads = True
+
+
+class ConditionalGetMixin:
+    """ETag для list/retrieve из версий таблиц и ответ 304 без обращения к данным
+
+    Отслеживаются модель вьюсета и модели связей, объявленных сериализатором;
+    дополнительные таблицы перечисляются в ``etag_models``.
+    """
+    etag_models = ()
+
+    def get_etag_models(self):
+        serializer_class = self.get_serializer_class()
+        paths = [
+            *getattr(serializer_class, 'select_related_fields', ()),
+            *getattr(serializer_class, 'prefetch_related_fields', ()),
+        ]
+        return related_models(self.queryset.model, paths) | set(self.etag_models)
+
+    def conditional_response(self, etag, make_response):
+        if etag_matches(self.request, etag):
+            return not_modified(etag)
+        return self.set_etag(make_response(), etag)
+
+    def set_etag(self, response, etag):
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+            response['Cache-Control'] = 'no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        etag = make_etag(self.get_etag_models(), 'list')
+        return self.conditional_response(etag, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        etag = make_etag(self.get_etag_models(), 'detail', kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+        return self.conditional_response(
+            etag, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
+
+
+class ClientsViewset(ConditionalGetMixin,
+                     ReplicaReadMixin,
+                     EagerLoadingViewSetMixin,
+                     ValuesListMixin,
+                     mixins.CreateModelMixin,
                      mixins.ListModelMixin, 
                      mixins.UpdateModelMixin, 
                      mixins.RetrieveModelMixin, 
@@ -16,7 +146,11 @@ class ClientsViewset(mixins.CreateModelMixin,
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
 
-class ProjectsViewset(mixins.CreateModelMixin,
+class ProjectsViewset(ConditionalGetMixin,
+                     ReplicaReadMixin,
+                     EagerLoadingViewSetMixin,
+                     ValuesListMixin,
+                     mixins.CreateModelMixin,
                      mixins.ListModelMixin, 
                      mixins.UpdateModelMixin, 
                      mixins.RetrieveModelMixin, 
@@ -24,8 +158,31 @@ class ProjectsViewset(mixins.CreateModelMixin,
                      GenericViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
+    filter_fields = {
+        'status': ('status', serializers.CharField()),
+        'client_user': ('client_user', serializers.IntegerField()),
+        'deadline_from': ('deadline__gte', serializers.DateField()),
+        'deadline_to': ('deadline__lte', serializers.DateField()),
+    }
+    ordering_fields = ('id', 'deadline', 'start_date')
 
-class FavoursViewset(mixins.CreateModelMixin,
+    @action(detail=False, methods=['get'])
+    def dashboard(self, request):
+        """Сводка по проектам из предрасчитанной статистики: часы, стоимость, статусы услуг, отзывы"""
+        queryset = self.filter_queryset(
+            ProjectDashboardSerializer.setup_eager_loading(Project.objects.defer('description'))
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(ProjectDashboardSerializer(page, many=True).data)
+        return Response(ProjectDashboardSerializer(queryset, many=True).data)
+
+class FavoursViewset(ResponseCacheMixin,
+                     ConditionalGetMixin,
+                     ReplicaReadMixin,
+                     EagerLoadingViewSetMixin,
+                     ValuesListMixin,
+                     mixins.CreateModelMixin,
                      mixins.ListModelMixin, 
                      mixins.UpdateModelMixin, 
                      mixins.RetrieveModelMixin, 
@@ -33,8 +190,22 @@ class FavoursViewset(mixins.CreateModelMixin,
                      GenericViewSet):
     queryset = Favour.objects.all()
     serializer_class = FavourSerializer
+    filter_fields = {
+        'category': ('category', serializers.CharField()),
+    }
+    ordering_fields = ('id', 'category')
+    response_cache = favours_cache
+
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        """Счетчики попаданий и промахов кэша ответов"""
+        return Response(self.response_cache.stats())
 
-class EmployeesViewset(mixins.CreateModelMixin,
+class EmployeesViewset(ConditionalGetMixin,
+                     ReplicaReadMixin,
+                     EagerLoadingViewSetMixin,
+                     ValuesListMixin,
+                     mixins.CreateModelMixin,
                      mixins.ListModelMixin, 
                      mixins.UpdateModelMixin, 
                      mixins.RetrieveModelMixin, 
@@ -43,7 +214,11 @@ class EmployeesViewset(mixins.CreateModelMixin,
     queryset = Employee.objects.all()
     serializer_class = EmployeeSerializer
 
-class ProjectServiceViewSet(mixins.CreateModelMixin,
+class ProjectServiceViewSet(ConditionalGetMixin,
+                     ReplicaReadMixin,
+                     EagerLoadingViewSetMixin,
+                     ValuesListMixin,
+                     mixins.CreateModelMixin,
                      mixins.ListModelMixin, 
                      mixins.UpdateModelMixin, 
                      mixins.RetrieveModelMixin, 
@@ -51,24 +226,79 @@ class ProjectServiceViewSet(mixins.CreateModelMixin,
                      GenericViewSet):
     queryset = ProjectService.objects.all()
     serializer_class = ProjectServiceSerializer
+    filter_fields = {
+        'status': ('status', serializers.CharField()),
+        'project': ('project', serializers.IntegerField()),
+        'employee_user': ('employee_user', serializers.IntegerField()),
+    }
+    ordering_fields = ('id', 'start_date')
+    bulk_max_length = 1000
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """Создание и обновление списка услуг одним запросом и одной транзакцией"""
+        serializer = ProjectServiceBulkSerializer(data=request.data, many=True, max_length=self.bulk_max_length)
+        serializer.is_valid(raise_exception=True)
+        # bulk_create/bulk_update не вызывают сигналы: статистику затронутых проектов и поиск обновляем сами
+        project_ids = {item['project'].pk for item in serializer.validated_data}
+        project_ids.update(instance.project_id for instance in serializer.existing.values())
+        with transaction.atomic():
+            instances = serializer.save()
+            rebuild_project_stats(project_ids)
+            bump_versions(ProjectService)
+            index_objects(ProjectService, instances)
+
+        ids = [instance.pk for instance in instances]
+        saved = self.get_queryset().in_bulk(ids)
+        data = ProjectServiceSerializer([saved[pk] for pk in ids], many=True).data
+        return Response(data, status=status.HTTP_201_CREATED)
 
-class ReviewViewSet(mixins.CreateModelMixin,
+class ReviewViewSet(ConditionalGetMixin,
+                     ReplicaReadMixin,
+                     EagerLoadingViewSetMixin,
+                     ValuesListMixin,
+                     mixins.CreateModelMixin,
                      mixins.ListModelMixin, 
                      mixins.UpdateModelMixin, 
                      mixins.RetrieveModelMixin, 
                      mixins.DestroyModelMixin, 
                      GenericViewSet):
-    queryset = Review.objects.all()
+    queryset = Review.objects.with_client()
     serializer_class = ReviewSerializer
+    cursor_ordering = ('created_at', 'id')
+    filter_fields = {
+        'rating': ('rating', serializers.IntegerField()),
+        'created_from': ('created_at__gte', serializers.DateTimeField()),
+        'created_to': ('created_at__lte', serializers.DateTimeField()),
+    }
+    ordering_fields = ('id', 'created_at', 'rating')
+    etag_models = (Project, User, UserProfile)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.reload_instance(serializer)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.reload_instance(serializer)
+
+    def reload_instance(self, serializer):
+        """Имена проекта и клиента есть только в аннотированной выборке: после записи читаем отзыв заново"""
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
 
-class UserViewSet(mixins.CreateModelMixin,
+class UserViewSet(ConditionalGetMixin,
+                  ReplicaReadMixin,
+                  EagerLoadingViewSetMixin,
+                  ValuesListMixin,
+                  mixins.CreateModelMixin,
                   mixins.ListModelMixin,
                   mixins.RetrieveModelMixin,
                   GenericViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
-class UserProfileViewSet(mixins.UpdateModelMixin,
+class UserProfileViewSet(EagerLoadingViewSetMixin,
+                        mixins.UpdateModelMixin,
                         GenericViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
\ No newline at end of file
@@ -5,3 +5,8 @@ class ClientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clients'
 
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from clients import cache, lookups, metrics, search, slowlog, sqlite, stats, thumbnails, versions  # noqa: F401  подключают обработчики сигналов
+        post_migrate.connect(search.create_table_on_migrate, sender=self)
@@ -0,0 +1,136 @@
+"""Асинхронные list/retrieve для вьюсетов со списком через план чтения
+
+Под ASGI синхронная вьюха занимает поток на все время запроса. Здесь чтение
+идет через асинхронный ORM (``aiterator``/``aget``), а фильтры, выборка
+полей, курсор, ETag и вывод берутся у того же вьюсета, поэтому ответ
+совпадает с ``/api/<ресурс>/``. Аутентификация и проверка прав
+(``initial`` вьюсета) выполняются синхронно, как и весь запрос, если план
+чтения для него построить нельзя.
+
+Маршруты ``/api/async/<ресурс>/`` и ``/api/async/<ресурс>/<pk>/`` строит
+``async_urls`` из реестра роутера. Кэш ответов (``ResponseCacheMixin``)
+используется только синхронными вьюхами.
+"""
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.http import Http404, HttpResponse
+from django.urls import re_path
+from django.views.decorators.http import require_safe
+from rest_framework.permissions import BasePermission
+from rest_framework.response import Response
+
+from clients.api import ConditionalGetMixin, ValuesListMixin
+from clients.metrics import serializer_timer
+from clients.versions import amake_etag, etag_matches, not_modified
+
+
+def _supported(viewset, plan):
+    if plan is None:
+        return False
+    if viewset.action == 'retrieve':
+        # Объектные права проверяются на модели, а план читает словари
+        return all(
+            type(permission).has_object_permission is BasePermission.has_object_permission
+            for permission in viewset.get_permissions()
+        )
+    return viewset.paginator is None or hasattr(viewset.paginator, 'apaginate_queryset')
+
+
+async def _etag(viewset, *parts):
+    if isinstance(viewset, ConditionalGetMixin):
+        return await amake_etag(viewset.get_etag_models(), *parts)
+    return None
+
+
+async def _list(viewset, queryset, plan):
+    etag = await _etag(viewset, 'list')
+    if etag and etag_matches(viewset.request, etag):
+        return not_modified(etag)
+    rows = viewset.list_rows(queryset, plan)
+    context = viewset.get_serializer_context()
+    page = None
+    if viewset.paginator is not None:
+        page = await viewset.paginator.apaginate_queryset(rows, viewset.request, view=viewset)
+    if page is None:
+        rows = [row async for row in rows.aiterator()]
+        with serializer_timer():
+            response = Response(plan.render(rows, context))
+    else:
+        with serializer_timer():
+            data = plan.render(page, context)
+        response = viewset.get_paginated_response(data)
+    return viewset.set_etag(response, etag) if etag else response
+
+
+async def _retrieve(viewset, queryset, plan):
+    lookup_url_kwarg = viewset.lookup_url_kwarg or viewset.lookup_field
+    lookup = viewset.kwargs[lookup_url_kwarg]
+    etag = await _etag(viewset, 'detail', lookup)
+    if etag and etag_matches(viewset.request, etag):
+        return not_modified(etag)
+    rows = queryset.prefetch_related(None).values(*plan.paths)
+    try:
+        row = await rows.aget(**{viewset.lookup_field: lookup})
+    except ObjectDoesNotExist:
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+    except (TypeError, ValueError, ValidationError):
+        raise Http404
+    with serializer_timer():
+        response = Response(plan.render([row], viewset.get_serializer_context())[0])
+    return viewset.set_etag(response, etag) if etag else response
+
+
+def _plain(response):
+    """Отрисованный ответ DRF -> HttpResponse, который обработчик не будет рендерить в потоке"""
+    response.render()
+    plain = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        plain[header] = value
+    return plain
+
+
+def async_read_view(viewset_class, action):
+    """Асинхронная вьюха list или retrieve вьюсета; без плана чтения - синхронная вьюха в потоке"""
+    actions = {'get': action, 'head': action}
+    sync_view = sync_to_async(viewset_class.as_view(actions))
+    handler = _retrieve if action == 'retrieve' else _list
+
+    @require_safe
+    async def view(request, *args, **kwargs):
+        viewset = viewset_class()
+        viewset.action_map = actions
+        for method, name in actions.items():
+            setattr(viewset, method, getattr(viewset, name))
+        viewset.args, viewset.kwargs = args, kwargs
+        viewset.headers = viewset.default_response_headers
+        viewset.request = viewset.initialize_request(request, *args, **kwargs)
+        try:
+            await sync_to_async(viewset.initial)(viewset.request, *args, **kwargs)
+            queryset = viewset.filter_queryset(viewset.get_queryset())
+            plan = viewset.get_read_plan(queryset)
+            if not _supported(viewset, plan):
+                return await sync_view(request, *args, **kwargs)
+            response = await handler(viewset, queryset, plan)
+        except Exception as exc:
+            response = viewset.handle_exception(exc)
+        return _plain(viewset.finalize_response(viewset.request, response, *args, **kwargs))
+    # Как у DRF: по классу middleware узнают настройки вьюсета
+    view.cls = viewset_class
+    return view
+
+
+def async_urls(registry):
+    """Маршруты асинхронного чтения для вьюсетов роутера, выводящих список через план"""
+    patterns = []
+    for prefix, viewset_class, basename in registry:
+        if not issubclass(viewset_class, ValuesListMixin):
+            continue
+        patterns.append(re_path(
+            rf'^{prefix}/$', async_read_view(viewset_class, 'list'), name=f'async-{basename}-list'))
+        if hasattr(viewset_class, 'retrieve'):
+            lookup_url_kwarg = viewset_class.lookup_url_kwarg or viewset_class.lookup_field
+            lookup_value = getattr(viewset_class, 'lookup_value_regex', '[^/.]+')
+            patterns.append(re_path(
+                rf'^{prefix}/(?P<{lookup_url_kwarg}>{lookup_value})/$',
+                async_read_view(viewset_class, 'retrieve'), name=f'async-{basename}-detail'))
+    return patterns
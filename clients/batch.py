@@ -0,0 +1,172 @@
+"""Пакет запросов к API одним HTTP-запросом
+
+``POST /api/batch/`` принимает упорядоченный список вложенных запросов к
+маршрутам роутера и выполняет их по очереди в том же процессе, потоке и
+соединении с базой, минуя повторный разбор HTTP и цепочку middleware:
+
+    {"atomic": true, "requests": [
+        {"method": "POST", "path": "/api/projects/", "body": {...}},
+        {"method": "POST", "path": "/api/project-services/", "body": {"project": "{{0.id}}", ...}},
+        {"method": "GET", "path": "/api/project-services/?project={{0.id}}"}
+    ]}
+
+Строка ``{{N.поле}}`` в пути или теле подставляет значение из тела ответа
+N-го запроса пакета (``{{0.results.0.id}}`` - вложенное); если строка целиком
+состоит из подстановки, тип значения сохраняется. С ``atomic`` пакет идет в
+одной транзакции: первый ответ с ошибкой (4xx/5xx) откатывает все изменения
+пакета, следующие запросы не выполняются.
+
+Вложенные запросы выполняются от имени пользователя пакета; CSRF проверяется
+один раз, для самого пакета. Ответ - статус, заголовки ETag/Location и тело
+каждого выполненного запроса.
+"""
+import json
+import logging
+import re
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from clients.serializers import BatchSerializer
+
+
+logger = logging.getLogger(__name__)
+
+# Заголовки внешнего запроса, которые получают вложенные запросы
+INHERITED_META = (
+    'SERVER_NAME', 'SERVER_PORT', 'REMOTE_ADDR', 'HTTP_HOST', 'HTTP_AUTHORIZATION', 'HTTP_COOKIE',
+    'HTTP_ACCEPT_LANGUAGE', 'HTTP_X_FORWARDED_PROTO', 'HTTP_X_FORWARDED_HOST',
+)
+RESPONSE_HEADERS = ('ETag', 'Location')
+
+_REFERENCE = re.compile(r'\{\{(\d+)((?:\.[\w-]+)+)\}\}')
+
+
+class BatchReferenceError(Exception):
+    pass
+
+
+def get_max_requests():
+    return getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+
+
+def _resolve_reference(match, results):
+    index, path = int(match.group(1)), match.group(2)[1:].split('.')
+    if index >= len(results):
+        raise BatchReferenceError(f"{match.group(0)}: запрос {index} еще не выполнен")
+    value = results[index]['body']
+    for key in path:
+        try:
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise BatchReferenceError(f"{match.group(0)}: в ответе запроса {index} нет значения")
+    return value
+
+
+def substitute(value, results):
+    """Подставляет ``{{N.поле}}`` из тел предыдущих ответов в строки, списки и словари"""
+    if isinstance(value, dict):
+        return {key: substitute(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [substitute(item, results) for item in value]
+    if not isinstance(value, str):
+        return value
+    match = _REFERENCE.fullmatch(value)
+    if match:
+        return _resolve_reference(match, results)
+    return _REFERENCE.sub(lambda match: str(_resolve_reference(match, results)), value)
+
+
+def _sub_request(request, method, path, body):
+    """HTTP-запрос для вьюхи: заголовки, пользователь и сессия берутся у запроса пакета"""
+    path, _, query = path.partition('?')
+    content = b'' if body is None else json.dumps(body).encode()
+    environ = {name: request.META[name] for name in INHERITED_META if name in request.META}
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': BytesIO(content),
+        'wsgi.url_scheme': request.scheme,
+    })
+    sub_request = WSGIRequest(environ)
+    sub_request.user = request.user
+    if hasattr(request._request, 'session'):
+        sub_request.session = request._request.session
+    # CSRF уже проверен для самого пакета
+    sub_request._dont_enforce_csrf_checks = True
+    return sub_request
+
+
+def _error(status_code, detail):
+    return {'status': status_code, 'headers': {}, 'body': {'detail': detail}}
+
+
+def _run(request, operation, results, url_names):
+    try:
+        path = substitute(operation['path'], results)
+        body = substitute(operation.get('body'), results)
+    except BatchReferenceError as exc:
+        return _error(status.HTTP_400_BAD_REQUEST, str(exc))
+    try:
+        match = resolve(path.partition('?')[0])
+    except Resolver404:
+        match = None
+    # Только маршруты роутера: у асинхронных вьюх того же вьюсета другие имена
+    if match is None or match.namespace or match.url_name not in url_names:
+        return _error(status.HTTP_404_NOT_FOUND, f"Маршрут не найден среди ресурсов API: {path}")
+
+    sub_request = _sub_request(request, operation['method'], path, body)
+    sub_request.resolver_match = match
+    try:
+        response = match.func(sub_request, *match.args, **match.kwargs)
+    except Exception:
+        # Ошибка одного запроса не должна терять ответы уже выполненных
+        logger.exception("Ошибка запроса пакета %s %s", operation['method'], path)
+        return _error(status.HTTP_500_INTERNAL_SERVER_ERROR, "Внутренняя ошибка сервера")
+    return {
+        'status': response.status_code,
+        'headers': {name: response[name] for name in RESPONSE_HEADERS if response.has_header(name)},
+        'body': getattr(response, 'data', None),
+    }
+
+
+def execute(request, operations, url_names, atomic=False):
+    """Выполняет запросы пакета по порядку; ``atomic`` - в одной транзакции до первой ошибки"""
+    results = []
+    if not atomic:
+        for operation in operations:
+            results.append(_run(request, operation, results, url_names))
+        return results, False
+
+    with transaction.atomic():
+        for operation in operations:
+            results.append(_run(request, operation, results, url_names))
+            if results[-1]['status'] >= status.HTTP_400_BAD_REQUEST:
+                transaction.set_rollback(True)
+                return results, True
+    return results, False
+
+
+def batch_view(router):
+    """Вьюха пакета для маршрутов роутера"""
+    url_names = {pattern.name for pattern in router.urls if pattern.name and pattern.name != router.root_view_name}
+
+    @api_view(['POST'])
+    def view(request):
+        """Упорядоченный список запросов к API одним запросом (clients/batch.py)"""
+        serializer = BatchSerializer(data=request.data, context={'max_requests': get_max_requests()})
+        serializer.is_valid(raise_exception=True)
+        atomic = serializer.validated_data['atomic']
+        results, rolled_back = execute(request, serializer.validated_data['requests'], url_names, atomic)
+        return Response({'atomic': atomic, 'rolled_back': rolled_back, 'responses': results})
+    return view
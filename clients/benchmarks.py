@@ -0,0 +1,536 @@
+"""Бенчмарк REST-эндпоинтов: бюджет запросов и время ответа
+
+Бюджеты запросов (QUERY_BUDGETS) на небольшом наборе данных проверяет
+обычный прогон тестов (QueryBudgetTestCase в clients/tests.py). Замеры
+времени на полном объеме в него не входят и запускаются явно:
+
+    python -m pytest clients/benchmarks.py -s
+
+Объем данных и число повторов задаются переменными окружения
+BENCHMARK_ROWS (по умолчанию 10000) и BENCHMARK_REPEAT (по умолчанию 20).
+Если задан BENCHMARK_REPORT, результаты дополнительно пишутся туда в JSON.
+
+Пропускная способность вывода списков сериализатором и планом чтения
+(clients.readplan) меряется на всей таблице; для сравнения на 50k строк:
+
+    BENCHMARK_ROWS=50000 python -m pytest clients/benchmarks.py -s -k throughput
+
+Одновременные читатели: BENCHMARK_CONCURRENCY запросов списка сразу к
+синхронному WSGI-пути (пул из BENCHMARK_WSGI_THREADS потоков, как у
+потокового сервера), к синхронным вьюсетам под ASGI и к /api/async/:
+
+    BENCHMARK_CONCURRENCY=100 python -m pytest clients/benchmarks.py -s -k concurrent
+
+Профили SQLite (clients/sqlite.py): BENCHMARK_SQLITE_READERS читателей и
+BENCHMARK_SQLITE_WRITERS писателей на отдельном файле базы в течение
+BENCHMARK_SQLITE_SECONDS секунд с профилем 'default' и 'production':
+
+    python -m pytest clients/benchmarks.py -s -k sqlite
+"""
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import OperationalError, connection, connections, transaction
+from django.test import AsyncClient, Client as HttpClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from app.urls import router
+from clients import metrics
+from clients.models import Client, Project, Favour, Employee, ProjectService, Review, TableVersion
+from clients.readplan import read_plan
+from clients.sqlite import PROFILES
+from clients.stats import rebuild_project_stats
+from clients.versions import TRACKED_MODELS, table_label
+from general.models import UserProfile
+
+
+ROWS = int(os.environ.get('BENCHMARK_ROWS', 10000))
+REPEAT = int(os.environ.get('BENCHMARK_REPEAT', 20))
+REPORT = os.environ.get('BENCHMARK_REPORT')
+CONCURRENCY = int(os.environ.get('BENCHMARK_CONCURRENCY', 50))
+WSGI_THREADS = int(os.environ.get('BENCHMARK_WSGI_THREADS', 8))
+SQLITE_READERS = int(os.environ.get('BENCHMARK_SQLITE_READERS', 8))
+SQLITE_WRITERS = int(os.environ.get('BENCHMARK_SQLITE_WRITERS', 4))
+SQLITE_SECONDS = float(os.environ.get('BENCHMARK_SQLITE_SECONDS', 3))
+
+# Бюджет запросов на одно действие. Превышение означает, что в сериализатор
+# или вьюсет пробрался N+1 или лишняя проверка. Чтение включает запрос версий
+# таблиц для ETag, запись - увеличение этих версий и обновление поискового
+# индекса. Запись услуг и отзывов дополнительно обновляет ProjectStats, а ответ
+# на запись отзыва перечитывает его с названием проекта и именем клиента;
+# удаление услуги каталога удаляет связанные услуги проектов пачками, поэтому
+# его бюджет с запасом на размер.
+QUERY_BUDGETS = {
+    'clients': {'list': 2, 'retrieve': 2, 'create': 5, 'update': 3, 'delete': 3},
+    'projects': {'list': 2, 'retrieve': 2, 'create': 6, 'update': 4, 'delete': 14},
+    'favours': {'list': 2, 'retrieve': 2, 'create': 3, 'update': 7, 'delete': 19},
+    'employees': {'list': 2, 'retrieve': 2, 'create': 4, 'update': 3, 'delete': 3},
+    'project-services': {'list': 2, 'retrieve': 2, 'create': 10, 'update': 6, 'delete': 7},
+    'reviews': {'list': 2, 'retrieve': 2, 'create': 7, 'update': 8, 'delete': 6},
+    'users': {'list': 2, 'retrieve': 2, 'create': 6},
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def seed(rows):
+    """Заполняет базу: rows услуг в проектах и отзывов, пропорционально остальное"""
+    password = make_password(None)
+    client_count = max(rows // 20, 1)
+    employee_count = max(rows // 100, 1)
+    project_count = max(rows // 5, 1)
+
+    users = User.objects.bulk_create(
+        [User(username=f'bench_client{i}', email=f'client{i}@example.com', password=password)
+         for i in range(client_count)]
+        + [User(username=f'bench_employee{i}', password=password) for i in range(employee_count)]
+    )
+    UserProfile.objects.bulk_create([UserProfile(user=user, fio=f'ФИО {user.username}') for user in users])
+    client_users, employee_users = users[:client_count], users[client_count:]
+
+    Client.objects.bulk_create([
+        Client(user=user, sphere='IT', company_name=f'Компания {i}')
+        for i, user in enumerate(client_users)
+    ])
+    Employee.objects.bulk_create([
+        Employee(user=user, position='Разработчик', start_work_date=date.today())
+        for user in employee_users
+    ])
+    favours = Favour.objects.bulk_create([
+        Favour(name=f'Услуга {i}', description='Описание услуги', price=1000 + i, category=f'Категория {i % 5}')
+        for i in range(50)
+    ])
+    projects = Project.objects.bulk_create([
+        Project(
+            name=f'Проект {i}',
+            client_user=client_users[i % client_count],
+            deadline=date.today() + timedelta(days=i % 365),
+            budget=100000,
+            status=('В работе', 'Завершен', 'Планирование')[i % 3],
+            description='Описание проекта ' * 20,
+        )
+        for i in range(project_count)
+    ])
+    ProjectService.objects.bulk_create([
+        ProjectService(
+            project=projects[i % project_count],
+            favour=favours[i % len(favours)],
+            employee_user=employee_users[i % employee_count],
+            status=('in_progress', 'completed')[i % 2],
+            hours_spent=i % 40,
+            notes='Примечание ' * 10,
+        )
+        for i in range(rows)
+    ])
+    Review.objects.bulk_create([
+        Review(project=projects[i % project_count], rating=i % 5 + 1, feedback='Отзыв о работе ' * 10)
+        for i in range(rows)
+    ])
+    rebuild_project_stats()
+    TableVersion.objects.bulk_create(
+        [TableVersion(label=table_label(model)) for model in TRACKED_MODELS], ignore_conflicts=True)
+
+
+class EndpointQueriesMixin:
+    """Действия REST-эндпоинтов на данных ``seed(rows)`` с проверкой QUERY_BUDGETS
+
+    Каждое действие выполняется ``repeat`` раз. Без замеров времени входит в
+    обычный прогон тестов (clients/tests.py) на небольшом наборе данных.
+    """
+    rows = 200
+    repeat = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(cls.rows)
+        cls.admin = User.objects.create_user(username='bench_admin', password='bench')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+        self.counter = 0
+
+    def new_user(self):
+        self.counter += 1
+        return User.objects.create_user(username=f'bench_new{self.counter}')
+
+    def any_id(self, model):
+        return model.objects.order_by('-id').values_list('id', flat=True).first()
+
+    def payload(self, prefix):
+        project_id = self.any_id(Project)
+        return {
+            'clients': lambda: {'user': self.new_user().id, 'sphere': 'IT', 'company_name': 'Новая'},
+            'projects': lambda: {
+                'name': 'Новый проект', 'client_user': self.any_id(User),
+                'deadline': date.today().isoformat(), 'budget': 1000, 'status': 'Планирование',
+            },
+            'favours': lambda: {'name': 'Новая услуга', 'price': 100, 'category': 'Дизайн'},
+            'employees': lambda: {
+                'user': self.new_user().id, 'position': 'Тестировщик',
+                'start_work_date': date.today().isoformat(),
+            },
+            'project-services': lambda: {
+                'project': project_id, 'favour': self.any_id(Favour),
+                'employee_user': self.any_id(User), 'status': 'in_progress', 'hours_spent': 1,
+            },
+            'reviews': lambda: {'project': project_id, 'rating': 4, 'feedback': 'Новый отзыв'},
+            'users': lambda: {'username': f'bench_api{time.monotonic_ns()}', 'password': 'secret'},
+        }[prefix]()
+
+    def patch_payload(self, prefix):
+        return {
+            'clients': {'sphere': 'Маркетинг'},
+            'projects': {'status': 'Завершен'},
+            'favours': {'price': 200},
+            'employees': {'position': 'Аналитик'},
+            'project-services': {'status': 'completed'},
+            'reviews': {'rating': 3},
+        }[prefix]
+
+    def viewset(self, prefix):
+        for registered_prefix, viewset, basename in router.registry:
+            if registered_prefix == prefix:
+                return viewset
+        raise LookupError(prefix)
+
+    def model(self, prefix):
+        return self.viewset(prefix).queryset.model
+
+    def run_action(self, prefix, action, make_request):
+        """Время ответов, наибольшее число запросов и время сериализации (из метрик запроса)"""
+        budget = QUERY_BUDGETS[prefix][action]
+        timings, serialize_timings = [], []
+        max_queries = 0
+        for _ in range(self.repeat):
+            prepare = make_request()
+            before = metrics.snapshot()
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = prepare()
+                timings.append(time.perf_counter() - started)
+            self.assertLess(response.status_code, 300, response.content[:500])
+            max_queries = max(max_queries, len(ctx.captured_queries))
+            self.assertLessEqual(
+                len(ctx.captured_queries), budget,
+                f"{prefix} {action}: {len(ctx.captured_queries)} запросов при бюджете {budget}\n"
+                + '\n'.join(q['sql'] for q in ctx.captured_queries)
+            )
+            key = (metrics.route_name(response.wsgi_request), response.wsgi_request.method)
+            serialized = metrics.snapshot()[key][metrics.SERIALIZER_SECONDS]
+            if key in before:
+                serialized -= before[key][metrics.SERIALIZER_SECONDS]
+            serialize_timings.append(serialized)
+        return timings, max_queries, serialize_timings
+
+    def actions(self, action):
+        return [prefix for prefix, budgets in QUERY_BUDGETS.items() if action in budgets]
+
+    def record(self, prefix, action, timings, queries, serialize_timings):
+        pass
+
+    def test_list(self):
+        for prefix in self.actions('list'):
+            with self.subTest(prefix):
+                timings, queries, serialize_timings = self.run_action(
+                    prefix, 'list', lambda: lambda: self.client.get(f'/api/{prefix}/'))
+                self.record(prefix, 'list', timings, queries, serialize_timings)
+
+    def test_retrieve(self):
+        for prefix in self.actions('retrieve'):
+            with self.subTest(prefix):
+                pk = self.any_id(self.model(prefix))
+                timings, queries, serialize_timings = self.run_action(
+                    prefix, 'retrieve', lambda: lambda: self.client.get(f'/api/{prefix}/{pk}/'))
+                self.record(prefix, 'retrieve', timings, queries, serialize_timings)
+
+    def test_create(self):
+        for prefix in self.actions('create'):
+            with self.subTest(prefix):
+                def make_request():
+                    data = self.payload(prefix)
+                    return lambda: self.client.post(f'/api/{prefix}/', data, format='json')
+                timings, queries, serialize_timings = self.run_action(prefix, 'create', make_request)
+                self.record(prefix, 'create', timings, queries, serialize_timings)
+
+    def test_update(self):
+        for prefix in self.actions('update'):
+            with self.subTest(prefix):
+                pk = self.any_id(self.model(prefix))
+                data = self.patch_payload(prefix)
+                timings, queries, serialize_timings = self.run_action(
+                    prefix, 'update',
+                    lambda: lambda: self.client.patch(f'/api/{prefix}/{pk}/', data, format='json'))
+                self.record(prefix, 'update', timings, queries, serialize_timings)
+
+    def test_delete(self):
+        for prefix in self.actions('delete'):
+            with self.subTest(prefix):
+                ids = list(self.model(prefix).objects.order_by('-id').values_list('id', flat=True)[:self.repeat])
+                def make_request():
+                    pk = ids.pop()
+                    return lambda: self.client.delete(f'/api/{prefix}/{pk}/')
+                timings, queries, serialize_timings = self.run_action(prefix, 'delete', make_request)
+                self.record(prefix, 'delete', timings, queries, serialize_timings)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EndpointBenchmark(EndpointQueriesMixin, TestCase):
+    rows = ROWS
+    repeat = REPEAT
+
+    results = {}
+    throughput = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        print()
+        print(f"{'endpoint':<30}{'queries':>8}{'p50 ms':>10}{'p95 ms':>10}{'ser p50':>10}{'ser p95':>10}")
+        for name, row in sorted(cls.results.items()):
+            serialize = [f"{row[key]:>10.2f}" if key in row else f"{'n/a':>10}"
+                         for key in ('serialize_p50', 'serialize_p95')]
+            print(f"{name:<30}{row['queries']:>8}{row['p50']:>10.2f}{row['p95']:>10.2f}{''.join(serialize)}")
+        if cls.throughput:
+            print()
+            print(f"{'list throughput':<30}{'rows':>8}{'ser r/s':>12}{'plan r/s':>12}{'gain':>8}")
+            for name, row in sorted(cls.throughput.items()):
+                print(f"{name:<30}{row['rows']:>8}{row['serializer']:>12.0f}{row['plan']:>12.0f}"
+                      f"{row['plan'] / row['serializer']:>8.1f}")
+        if REPORT:
+            with open(REPORT, 'w') as f:
+                json.dump({'rows': ROWS, 'repeat': REPEAT, 'results': cls.results,
+                           'throughput': cls.throughput}, f, indent=2)
+
+    def record(self, prefix, action, timings, queries, serialize_timings):
+        row = {
+            'queries': queries,
+            'p50': percentile(timings, 50) * 1000,
+            'p95': percentile(timings, 95) * 1000,
+        }
+        # Ответ без тела (удаление) не сериализуется: время не выводится вовсе, а не как 0
+        if any(serialize_timings):
+            row['serialize_p50'] = percentile(serialize_timings, 50) * 1000
+            row['serialize_p95'] = percentile(serialize_timings, 95) * 1000
+        self.results[f'{prefix} {action}'] = row
+
+    def list_view(self, prefix):
+        view = self.viewset(prefix)()
+        view.action = 'list'
+        view.args, view.kwargs, view.format_kwarg = (), {}, None
+        view.request = Request(APIRequestFactory().get(f'/api/{prefix}/'))
+        return view
+
+    def test_list_throughput(self):
+        """Строк в секунду на всей таблице: чтение и вывод сериализатором против плана"""
+        for prefix in self.actions('list'):
+            with self.subTest(prefix):
+                view = self.list_view(prefix)
+                plan = read_plan(view.get_serializer_class(), queryset=view.get_queryset())
+                self.assertIsNotNone(plan)
+                context = view.get_serializer_context()
+
+                serializer_timings, plan_timings = [], []
+                for _ in range(min(self.repeat, 5)):
+                    started = time.perf_counter()
+                    expected = view.get_serializer(list(view.get_queryset().order_by('pk')), many=True).data
+                    serializer_timings.append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    actual = plan.render(view.get_queryset().order_by('pk').values(*plan.paths), context)
+                    plan_timings.append(time.perf_counter() - started)
+
+                self.assertEqual(json.dumps(actual, cls=DjangoJSONEncoder), json.dumps(expected, cls=DjangoJSONEncoder))
+                rows = len(actual)
+                self.throughput[prefix] = {
+                    'rows': rows,
+                    'serializer': rows / percentile(serializer_timings, 50),
+                    'plan': rows / percentile(plan_timings, 50),
+                }
+
+
+class ConcurrentReadBenchmark(TransactionTestCase):
+    """Списки при CONCURRENCY одновременных клиентах: WSGI-потоки, ASGI с синхронной и с асинхронной вьюхой
+
+    Данные фиксируются в базе, чтобы их видели соединения потоков WSGI.
+    """
+
+    def wsgi_round(self, url):
+        def get(submitted):
+            try:
+                response = HttpClient().get(url)
+                return response.status_code, time.perf_counter() - submitted
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=WSGI_THREADS) as executor:
+            futures = [executor.submit(get, time.perf_counter()) for _ in range(CONCURRENCY)]
+            return [future.result() for future in futures]
+
+    async def asgi_round(self, url):
+        client = AsyncClient()
+
+        async def get():
+            started = time.perf_counter()
+            response = await client.get(url)
+            return response.status_code, time.perf_counter() - started
+
+        return await asyncio.gather(*(get() for _ in range(CONCURRENCY)))
+
+    def test_concurrent_list(self):
+        seed(ROWS)
+        results = {}
+        for prefix, viewset, basename in router.registry:
+            if prefix not in QUERY_BUDGETS:
+                continue
+            rounds = {
+                'wsgi': lambda: self.wsgi_round(f'/api/{prefix}/'),
+                'asgi sync': lambda: asyncio.run(self.asgi_round(f'/api/{prefix}/')),
+                'asgi async': lambda: asyncio.run(self.asgi_round(f'/api/async/{prefix}/')),
+            }
+            for name, run in rounds.items():
+                timings, elapsed = [], 0
+                for _ in range(max(REPEAT // 5, 1)):
+                    started = time.perf_counter()
+                    responses = run()
+                    elapsed += time.perf_counter() - started
+                    self.assertEqual({status for status, timing in responses}, {200})
+                    timings.extend(timing for status, timing in responses)
+                results[f'{prefix} {name}'] = {
+                    'rps': len(timings) / elapsed,
+                    'p50': percentile(timings, 50) * 1000,
+                    'p95': percentile(timings, 95) * 1000,
+                }
+
+        print()
+        print(f"{'concurrent list':<34}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}   clients: {CONCURRENCY}")
+        for name, row in results.items():
+            print(f"{name:<34}{row['rps']:>10.0f}{row['p50']:>10.2f}{row['p95']:>10.2f}")
+        if REPORT:
+            with open(REPORT, 'w') as f:
+                json.dump({'rows': ROWS, 'concurrency': CONCURRENCY, 'wsgi_threads': WSGI_THREADS,
+                           'concurrent': results}, f, indent=2)
+
+
+class SQLiteProfileBenchmark(SimpleTestCase):
+    """Одновременные чтение и запись в файл SQLite: умолчания против профиля 'production'
+
+    Писатель в транзакции сначала читает строку, потом меняет ее - так же, как
+    сохранение модели после выборки. Ошибки "database is locked" считаются.
+    """
+    table_rows = 10000
+    databases = {f'sqlite_bench_{profile}' for profile in PROFILES}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        for profile in PROFILES:
+            alias = f'sqlite_bench_{profile}'
+            options = {'transaction_mode': 'IMMEDIATE'} if profile == 'production' else {}
+            connections.settings[alias] = connections.configure_settings({'default': {}, alias: {
+                'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': options,
+                'NAME': os.path.join(cls.directory.name, f'{profile}.sqlite3'),
+            }})[alias]
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.databases:
+            connections[alias].close()
+            del connections.settings[alias]
+        cls.directory.cleanup()
+
+    def prepare(self, alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute('CREATE TABLE bench_rows (id INTEGER PRIMARY KEY, counter INTEGER, payload TEXT)')
+            cursor.executemany('INSERT INTO bench_rows (counter, payload) VALUES (%s, %s)',
+                               [(0, 'x' * 200) for _ in range(self.table_rows)])
+        connections[alias].close()
+
+    def read(self, alias):
+        start = random.randint(1, self.table_rows - 500)
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT count(*), sum(counter) FROM bench_rows WHERE id BETWEEN %s AND %s',
+                           [start, start + 500])
+            cursor.fetchone()
+
+    def write(self, alias):
+        row_id = random.randint(1, self.table_rows)
+        with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+            cursor.execute('SELECT counter FROM bench_rows WHERE id = %s', [row_id])
+            cursor.fetchone()
+            cursor.execute('UPDATE bench_rows SET counter = counter + 1 WHERE id = %s', [row_id])
+
+    def run_workers(self, alias):
+        stop = threading.Event()
+        counts = {'read': 0, 'write': 0, 'read_locked': 0, 'write_locked': 0}
+        lock = threading.Lock()
+
+        def worker(kind):
+            done = locked = 0
+            try:
+                while not stop.is_set():
+                    try:
+                        getattr(self, kind)(alias)
+                        done += 1
+                    except OperationalError as exc:
+                        if 'locked' not in str(exc):
+                            raise
+                        locked += 1
+            finally:
+                connections[alias].close()
+                with lock:
+                    counts[kind] += done
+                    counts[f'{kind}_locked'] += locked
+
+        threads = [threading.Thread(target=worker, args=('read',)) for _ in range(SQLITE_READERS)]
+        threads += [threading.Thread(target=worker, args=('write',)) for _ in range(SQLITE_WRITERS)]
+        for thread in threads:
+            thread.start()
+        time.sleep(SQLITE_SECONDS)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return counts
+
+    def test_sqlite_profiles(self):
+        results = {}
+        for profile in PROFILES:
+            with self.subTest(profile), override_settings(SQLITE_PROFILE=profile):
+                alias = f'sqlite_bench_{profile}'
+                self.prepare(alias)
+                counts = self.run_workers(alias)
+                results[profile] = {
+                    'reads/s': counts['read'] / SQLITE_SECONDS,
+                    'writes/s': counts['write'] / SQLITE_SECONDS,
+                    'read locked': counts['read_locked'],
+                    'write locked': counts['write_locked'],
+                }
+        self.assertEqual(results['production']['write locked'], 0)
+
+        print()
+        print(f"{'sqlite profile':<16}{'reads/s':>10}{'writes/s':>10}{'read locked':>13}{'write locked':>14}"
+              f"   readers: {SQLITE_READERS}, writers: {SQLITE_WRITERS}")
+        for profile, row in results.items():
+            print(f"{profile:<16}{row['reads/s']:>10.0f}{row['writes/s']:>10.0f}"
+                  f"{row['read locked']:>13}{row['write locked']:>14}")
+        if REPORT:
+            with open(REPORT, 'w') as f:
+                json.dump({'readers': SQLITE_READERS, 'writers': SQLITE_WRITERS, 'sqlite': results}, f, indent=2)
@@ -0,0 +1,124 @@
+"""Справочные таблицы для первой загрузки страниц одним запросом
+
+``/api/bootstrap/?include=projects,favours`` возвращает перечисленные наборы
+(по умолчанию все) компактными таблицами: имена столбцов и строки-массивы.
+Каждый набор читается одним запросом ``values_list`` с нужными JOIN, поэтому
+ответ стоит ``1 + число наборов`` запросов независимо от числа строк. ETag
+строится из версий всех таблиц, которые читают выбранные наборы: при
+совпадении If-None-Match ответ 304 стоит одного запроса к TableVersion.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models
+
+from clients.models import Employee, Favour, Project, ProjectService
+from clients.versions import related_models
+
+
+class Dataset:
+    """Набор: выборка и столбцы ``(имя в ответе, путь ORM)``"""
+
+    def __init__(self, queryset, columns):
+        self.queryset = queryset
+        self.columns = columns
+
+    @property
+    def names(self):
+        return [name for name, path in self.columns]
+
+    @property
+    def paths(self):
+        return [path for name, path in self.columns]
+
+    def models(self):
+        model = self.queryset.model
+        return related_models(model, {path.rsplit('__', 1)[0] for path in self.paths if '__' in path})
+
+    def converters(self):
+        """Decimal выводится строкой, как в сериализаторах API; остальное кодирует рендерер"""
+        return [
+            str if isinstance(_model_field(self.queryset.model, path), models.DecimalField) else None
+            for path in self.paths
+        ]
+
+    def rows(self, limit):
+        """Строки набора, не больше ``limit``, и признак, что строк было больше"""
+        rows = list(self.queryset.values_list(*self.paths)[:limit + 1])
+        truncated = len(rows) > limit
+        del rows[limit:]
+        converters = [(index, convert) for index, convert in enumerate(self.converters()) if convert is not None]
+        if converters:
+            rows = [list(row) for row in rows]
+            for row in rows:
+                for index, convert in converters:
+                    if row[index] is not None:
+                        row[index] = convert(row[index])
+        return rows, truncated
+
+
+def _model_field(model, path):
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+DATASETS = {
+    'project-services': Dataset(ProjectService.objects.order_by('id'), (
+        ('id', 'id'),
+        ('project', 'project_id'),
+        ('favour', 'favour_id'),
+        ('employee_user', 'employee_user_id'),
+        ('status', 'status'),
+        ('start_date', 'start_date'),
+        ('end_date', 'end_date'),
+        ('hours_spent', 'hours_spent'),
+        ('notes', 'notes'),
+    )),
+    'projects': Dataset(Project.objects.order_by('id'), (
+        ('id', 'id'),
+        ('name', 'name'),
+        ('status', 'status'),
+        ('client_user', 'client_user_id'),
+        ('client_user_username', 'client_user__username'),
+    )),
+    'favours': Dataset(Favour.objects.order_by('id'), (
+        ('id', 'id'),
+        ('name', 'name'),
+        ('category', 'category'),
+        ('price', 'price'),
+    )),
+    'employees': Dataset(Employee.objects.order_by('id'), (
+        ('id', 'id'),
+        ('user', 'user_id'),
+        ('user_username', 'user__username'),
+        ('fio', 'user__userprofile__fio'),
+        ('position', 'position'),
+    )),
+    'users': Dataset(User.objects.order_by('id'), (
+        ('id', 'id'),
+        ('username', 'username'),
+        ('email', 'email'),
+        ('fio', 'userprofile__fio'),
+    )),
+}
+
+
+def get_row_limit():
+    return getattr(settings, 'BOOTSTRAP_ROW_LIMIT', 1000)
+
+
+def bootstrap_models(names):
+    """Модели, версии которых входят в ETag ответа с наборами ``names``"""
+    return set().union(*(DATASETS[name].models() for name in names))
+
+
+def build_bootstrap(names):
+    """{набор: {'columns': [...], 'rows': [[...]], 'truncated': bool}} по одному запросу на набор"""
+    limit = get_row_limit()
+    data = {}
+    for name in names:
+        dataset = DATASETS[name]
+        rows, truncated = dataset.rows(limit)
+        data[name] = {'columns': dataset.names, 'rows': rows, 'truncated': truncated}
+    return data
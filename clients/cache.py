@@ -0,0 +1,119 @@
+"""Кэш ответов API для редко меняющихся справочников
+
+Ключ записи содержит поколение кэша: любое сохранение или удаление
+отслеживаемой модели заменяет поколение, и все прежние записи перестают
+находиться. Поколение меняется сразу и повторно после фиксации транзакции,
+чтобы запрос, прочитавший данные до фиксации, не оставил в кэше старый ответ.
+Ответ для кэша строится по основной базе, а не по реплике (clients/replica.py):
+отставшая реплика сохранила бы под новым поколением ответ до записи.
+
+Бэкенд и время жизни задаются настройками API_RESPONSE_CACHE_ALIAS и
+API_RESPONSE_CACHE_TIMEOUT. При нескольких процессах нужен общий бэкенд
+(Redis, Memcached): локальный кэш процесса не увидит сброс из соседнего.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from rest_framework import status
+from rest_framework.response import Response
+
+from clients.models import Favour
+from clients.replica import primary_reads
+from clients.versions import etag_matches, not_modified
+
+
+class ResponseCache:
+    def __init__(self, prefix, models):
+        self.prefix = prefix
+        for model in models:
+            uid = f'response_cache_{prefix}_{model._meta.label_lower}'
+            post_save.connect(self.on_change, sender=model, dispatch_uid=f'{uid}_save')
+            post_delete.connect(self.on_change, sender=model, dispatch_uid=f'{uid}_delete')
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'API_RESPONSE_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'API_RESPONSE_CACHE_TIMEOUT', 60 * 60)
+
+    def generation(self):
+        key = f'{self.prefix}:generation'
+        generation = self.cache.get(key)
+        if generation is None:
+            # Начальное значение от времени: после вытеснения ключа старые записи не оживут
+            generation = time.time_ns()
+            self.cache.add(key, generation, None)
+            generation = self.cache.get(key, generation)
+        return generation
+
+    def invalidate(self):
+        self.cache.set(f'{self.prefix}:generation', time.time_ns(), None)
+
+    def on_change(self, sender, **kwargs):
+        self.invalidate()
+        transaction.on_commit(self.invalidate)
+
+    def key(self, request):
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return f'{self.prefix}:{self.generation()}:{path}'
+
+    def count(self, name):
+        key = f'{self.prefix}:{name}'
+        self.cache.add(key, 0, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, None)
+
+    def respond(self, request, make_response):
+        """Ответ из кэша по пути запроса; иначе make_response() по основной базе, и ответ 200 сохраняется"""
+        key = self.key(request)
+        cached = self.cache.get(key)
+        if cached is None:
+            self.count('misses')
+            with primary_reads():
+                response = make_response()
+            if response.status_code == status.HTTP_200_OK:
+                self.cache.set(key, (response.data, response.get('ETag')), self.timeout)
+            return response
+
+        self.count('hits')
+        data, etag = cached
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response = Response(data)
+        if etag:
+            response['ETag'] = etag
+            response['Cache-Control'] = 'no-cache'
+        return response
+
+    def stats(self):
+        values = self.cache.get_many([f'{self.prefix}:hits', f'{self.prefix}:misses'])
+        return {
+            'hits': values.get(f'{self.prefix}:hits', 0),
+            'misses': values.get(f'{self.prefix}:misses', 0),
+        }
+
+
+class ResponseCacheMixin:
+    """Отдает list/retrieve из ``response_cache``, проверяя If-None-Match по сохраненному ETag"""
+    response_cache = None
+
+    def cached_response(self, request, make_response):
+        return self.response_cache.respond(request, make_response)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(ResponseCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(ResponseCacheMixin, self).retrieve(request, *args, **kwargs))
+
+
+favours_cache = ResponseCache('favours', models=[Favour])
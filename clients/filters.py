@@ -0,0 +1,47 @@
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+
+class IndexedFilter(BaseFilterBackend):
+    """Фильтры из query-параметров по ``filter_fields`` вьюсета
+
+    ``filter_fields = {'параметр': ('lookup', поле DRF)}``: значение проверяется
+    полем и передается в ``filter(lookup=...)``. Каждый lookup должен опираться
+    на индекс, неизвестные параметры игнорируются, неверные значения дают 400.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        lookups, errors = {}, {}
+        for param, (lookup, field) in getattr(view, 'filter_fields', {}).items():
+            if param not in request.query_params:
+                continue
+            try:
+                lookups[lookup] = field.run_validation(request.query_params[param])
+            except serializers.ValidationError as exc:
+                errors[param] = exc.detail
+        if errors:
+            raise serializers.ValidationError(errors)
+        return queryset.filter(**lookups) if lookups else queryset
+
+
+class IndexedOrderingFilter(OrderingFilter):
+    """``?ordering=`` только по ``ordering_fields`` вьюсета
+
+    Порядок дополняется ``id`` в направлении последнего ключа: курсор
+    постраничного вывода сравнивает все ключи, и ``id`` делает позицию
+    уникальной для строк с одинаковым ключом. Поле вне списка дает 400.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if not params:
+            return self.get_default_ordering(view)
+        ordering = [param.strip() for param in params.split(',') if param.strip()]
+        allowed = getattr(view, 'ordering_fields', ('id',))
+        unknown = [term for term in ordering if term.lstrip('-') not in allowed]
+        if unknown:
+            raise serializers.ValidationError(
+                {self.ordering_param: [f"Сортировка недоступна: {', '.join(unknown)}"]})
+        if ordering and not any(term.lstrip('-') in ('id', 'pk') for term in ordering):
+            ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+        return tuple(ordering) or self.get_default_ordering(view)
@@ -0,0 +1,67 @@
+"""Пары ``[id, подпись]`` для выпадающих списков форм
+
+``/api/lookups/<набор>/`` отдает только идентификатор и подпись, которая
+совпадает с ``__str__`` модели, но считается в SQL: одна выборка
+``values_list`` с нужными JOIN вместо полного сериализатора со связями.
+``?q=`` оставляет подписи, начинающиеся с подстроки (без учета регистра),
+``?limit=`` ограничивает число пар.
+
+Ответы кэшируются (``lookups_cache``) до изменения любой из таблиц, из
+которых строятся подписи, и отдаются с ETag.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Coalesce, Concat, NullIf
+
+from clients.cache import ResponseCache
+from clients.models import Client, Employee, Favour, Project
+from clients.versions import related_models
+from general.models import UserProfile
+
+
+def _fio_or_username(prefix=''):
+    """``fio or username`` из профиля пользователя, как в ``Client.__str__``"""
+    return Coalesce(NullIf(F(f'{prefix}userprofile__fio'), Value('')), F(f'{prefix}username'),
+                    output_field=CharField())
+
+
+class Lookup:
+    """Набор: выборка, выражение подписи и связи, через которые оно читает"""
+
+    def __init__(self, queryset, label, related=()):
+        self.queryset = queryset
+        self.label = label
+        self.related = related
+
+    def models(self):
+        return related_models(self.queryset.model, self.related)
+
+    def pairs(self, prefix='', limit=None):
+        queryset = self.queryset.annotate(label=self.label)
+        if prefix:
+            queryset = queryset.filter(label__istartswith=prefix)
+        queryset = queryset.order_by('pk').values_list('pk', 'label')
+        if limit is not None:
+            queryset = queryset[:limit]
+        return [list(pair) for pair in queryset]
+
+
+LOOKUPS = {
+    'clients': Lookup(Client.objects.all(), _fio_or_username('user__'), related=('user__userprofile',)),
+    'projects': Lookup(Project.objects.all(), F('name')),
+    'favours': Lookup(Favour.objects.all(), F('name')),
+    'employees': Lookup(
+        Employee.objects.all(),
+        Concat(_fio_or_username('user__'), Value(' ('), F('position'), Value(')'), output_field=CharField()),
+        related=('user__userprofile',),
+    ),
+    'users': Lookup(User.objects.all(), _fio_or_username(), related=('userprofile',)),
+}
+
+
+def get_max_limit():
+    return getattr(settings, 'LOOKUP_MAX_LIMIT', 1000)
+
+
+lookups_cache = ResponseCache('lookups', models=[Client, Project, Favour, Employee, User, UserProfile])
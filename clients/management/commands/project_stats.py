@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.stats import find_stats_drift, rebuild_project_stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает статистику проектов с нуля или проверяет ее расхождение с данными"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Только проверить, ничего не меняя")
+        parser.add_argument('--project', type=int, action='append', dest='projects',
+                            help="Ограничиться проектом с этим id (можно указать несколько раз)")
+
+    def handle(self, *args, check=False, projects=None, **options):
+        if not check:
+            count = rebuild_project_stats(projects)
+            self.stdout.write(self.style.SUCCESS(f"Пересчитана статистика {count} проектов"))
+            return
+
+        drift = find_stats_drift(projects)
+        for project_id, fields in sorted(drift.items()):
+            for name, (stored, expected) in fields.items():
+                self.stdout.write(f"Проект {project_id}: {name} = {stored}, ожидается {expected}")
+        if drift:
+            raise CommandError(f"Статистика расходится у {len(drift)} проектов")
+        self.stdout.write(self.style.SUCCESS("Статистика проектов совпадает с данными"))
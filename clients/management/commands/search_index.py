@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from clients.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Заполняет полнотекстовый индекс поиска заново из проектов, услуг, отзывов и профилей"
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано документов: {count}"))
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.slowlog import read_log, top_queries
+
+
+class Command(BaseCommand):
+    help = "Самые дорогие формы SQL-запросов из журнала медленных запросов (SLOW_QUERY_LOG)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help="Сколько форм запросов показать")
+        parser.add_argument('--sort', choices=('total', 'count', 'max'), default='total',
+                            help="Порядок: суммарное время, число запросов или наибольшее время")
+        parser.add_argument('--log', default=None, help="Файл журнала вместо SLOW_QUERY_LOG")
+
+    def handle(self, *args, top=10, sort='total', log=None, **options):
+        path = log or getattr(settings, 'SLOW_QUERY_LOG', None)
+        try:
+            shapes = top_queries(read_log(path), sort, top) if path else None
+        except FileNotFoundError:
+            shapes = None
+        if shapes is None:
+            raise CommandError(f"Журнал медленных запросов не найден: {path}")
+        if not shapes:
+            self.stdout.write("Медленных запросов нет")
+            return
+
+        for shape in shapes:
+            views = ', '.join(f'{view} x{count}' for view, count in sorted(shape['views'].items()))
+            self.stdout.write(self.style.WARNING(
+                f"[{shape['shape']}] {shape['count']} раз, всего {shape['total'] * 1000:.1f} мс, "
+                f"макс. {shape['max'] * 1000:.1f} мс; {views}"))
+            self.stdout.write(f"  {shape['sql']}")
+            for line in shape['plan']:
+                self.stdout.write(f"  план: {line}")
+            for frame in shape['stack']:
+                self.stdout.write(f"  из: {frame}")
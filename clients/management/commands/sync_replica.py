@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from clients.replica import copy_to_replica
+
+
+class Command(BaseCommand):
+    help = "Копирует основную базу в реплику для чтения; с --interval повторяет копирование, имитируя отставание"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Секунд между копиями; 0 - скопировать один раз")
+
+    def handle(self, *args, **options):
+        while True:
+            copy_to_replica()
+            self.stdout.write(self.style.SUCCESS(f"Реплика обновлена: {time.strftime('%H:%M:%S')}"))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
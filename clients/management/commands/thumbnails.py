@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from clients.thumbnails import THUMBNAIL_FIELDS, build_thumbnail, thumbnail_name
+
+
+class Command(BaseCommand):
+    help = "Строит недостающие миниатюры изображений клиентов, сотрудников и отзывов"
+
+    def handle(self, *args, **options):
+        count = 0
+        for model, (field_name, thumbnail_field_name) in THUMBNAIL_FIELDS.items():
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for pk, name, thumbnail in rows.values_list('pk', field_name, thumbnail_field_name).iterator():
+                if thumbnail != thumbnail_name(name) and build_thumbnail(model, pk, name):
+                    count += 1
+        self.stdout.write(self.style.SUCCESS(f"Построено миниатюр: {count}"))
@@ -0,0 +1,278 @@
+"""Метрики запросов по маршрутам в текстовом формате Prometheus (``/metrics``)
+
+``MetricsMiddleware`` записывает для каждой пары (имя маршрута, метод)
+гистограмму времени ответа, число и время запросов к базе, время
+сериализации и объем ответа. Запросы к базе считает обертка, которая
+ставится на каждое соединение при его создании; время сериализации
+добавляют сериализаторы и планы чтения через ``serializer_timer``.
+
+Счетчики копятся без блокировок: у каждого потока свой набор, который
+меняет только он, а ``/metrics`` складывает наборы всех потоков процесса.
+Когда поток завершается, его набор переносится в общий итог завершенных
+потоков, поэтому число наборов не растет у серверов с потоком на запрос.
+При нескольких процессах Prometheus собирает метрики с каждого.
+
+``/metrics`` отвечает только адресам из METRICS_ALLOWED_NETWORKS (по
+умолчанию localhost); за обратным прокси адрес сборщика должен доходить
+до приложения в REMOTE_ADDR.
+"""
+import ipaddress
+import threading
+import weakref
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Счетчики серии: число запросов, суммы времени ответа, запросов к базе,
+# времени базы, времени сериализации и байт ответа; дальше - корзины гистограммы
+COUNT, DURATION, DB_QUERIES, DB_SECONDS, SERIALIZER_SECONDS, RESPONSE_BYTES = range(6)
+BUCKETS_OFFSET = 6
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class RequestStats:
+    __slots__ = ('request', 'db_queries', 'db_seconds', 'serializer_seconds', 'serializing')
+
+    def __init__(self, request=None):
+        self.request = request
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+
+_current = ContextVar('request_metrics', default=None)
+_local = threading.local()
+_shards = []
+# Счетчики завершившихся потоков; _lock защищает его и состав _shards
+_retired = {}
+_lock = threading.RLock()
+
+DEFAULT_ALLOWED_NETWORKS = ('127.0.0.1/32', '::1/128')
+
+
+def get_buckets():
+    return tuple(getattr(settings, 'METRICS_LATENCY_BUCKETS', DEFAULT_BUCKETS))
+
+
+class _ThreadShard:
+    """Набор счетчиков потока в его threading.local; исчезает вместе с потоком"""
+    __slots__ = ('series', '__weakref__')
+
+    def __init__(self):
+        self.series = {}
+
+
+def _shard():
+    try:
+        return _local.shard.series
+    except AttributeError:
+        shard = _local.shard = _ThreadShard()
+        with _lock:
+            _shards.append(shard.series)
+        # Данные threading.local освобождаются при завершении потока
+        weakref.finalize(shard, _retire, shard.series)
+        return shard.series
+
+
+def _add(totals, shard):
+    for key, series in list(shard.items()):
+        series = list(series)
+        total = totals.get(key)
+        if total is None:
+            totals[key] = series
+        else:
+            for index, value in enumerate(series):
+                total[index] += value
+
+
+def _retire(series):
+    """Переносит счетчики завершившегося потока в общий итог"""
+    with _lock:
+        _shards.remove(series)
+        _add(_retired, series)
+
+
+def record(route, method, duration, stats, response_bytes):
+    buckets = get_buckets()
+    shard = _shard()
+    series = shard.get((route, method))
+    if series is None:
+        series = shard[(route, method)] = [0] * (BUCKETS_OFFSET + len(buckets) + 1)
+    series[COUNT] += 1
+    series[DURATION] += duration
+    series[DB_QUERIES] += stats.db_queries
+    series[DB_SECONDS] += stats.db_seconds
+    series[SERIALIZER_SECONDS] += stats.serializer_seconds
+    series[RESPONSE_BYTES] += response_bytes
+    series[BUCKETS_OFFSET + bisect_left(buckets, duration)] += 1
+
+
+def _add_bytes(route, method, size):
+    series = _shard().get((route, method))
+    if series is not None:
+        series[RESPONSE_BYTES] += size
+
+
+def snapshot():
+    """Сумма счетчиков всех потоков: {(маршрут, метод): [счетчики серии]}"""
+    totals = {}
+    with _lock:
+        for shard in (_retired, *_shards):
+            _add(totals, shard)
+    return totals
+
+
+def allowed(request):
+    """Адрес клиента входит в METRICS_ALLOWED_NETWORKS"""
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    networks = getattr(settings, 'METRICS_ALLOWED_NETWORKS', DEFAULT_ALLOWED_NETWORKS)
+    return any(address in ipaddress.ip_network(network) for network in networks)
+
+
+def _labels(route, method, **extra):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    pairs = {'route': route, 'method': method, **extra}
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs.items()) + '}'
+
+
+COUNTERS = (
+    ('http_request_db_queries_total', "Запросы к базе", DB_QUERIES),
+    ('http_request_db_seconds_total', "Время запросов к базе, с", DB_SECONDS),
+    ('http_request_serializer_seconds_total', "Время сериализации ответа, с", SERIALIZER_SECONDS),
+    ('http_response_bytes_total', "Объем тела ответа, байт", RESPONSE_BYTES),
+)
+
+
+def render():
+    """Метрики процесса в текстовом формате Prometheus"""
+    buckets = get_buckets()
+    series = sorted(snapshot().items())
+    lines = [
+        '# HELP http_request_duration_seconds Время обработки запроса, с',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (route, method), values in series:
+        cumulative = 0
+        for bound, count in zip((*buckets, '+Inf'), values[BUCKETS_OFFSET:]):
+            cumulative += count
+            lines.append(f'http_request_duration_seconds_bucket{_labels(route, method, le=bound)} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{_labels(route, method)} {values[DURATION]}')
+        lines.append(f'http_request_duration_seconds_count{_labels(route, method)} {values[COUNT]}')
+    for name, help_text, index in COUNTERS:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for (route, method), values in series:
+            lines.append(f'{name}{_labels(route, method)} {values[index]}')
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def serializer_timer():
+    """Добавляет время блока к времени сериализации запроса; вложенные блоки не считаются дважды"""
+    stats = _current.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_seconds += time.perf_counter() - started
+        stats.serializing = False
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_install_query_counter, dispatch_uid='metrics_query_counter')
+
+
+def current_request():
+    """HTTP-запрос, который сейчас обрабатывается в этом контексте, или None"""
+    stats = _current.get()
+    return stats.request if stats is not None else None
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.view_name or match.route
+
+
+def _counted_stream(content, route, method):
+    for chunk in content:
+        _add_bytes(route, method, len(chunk))
+        yield chunk
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, started = RequestStats(request), time.perf_counter()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats, started = RequestStats(request), time.perf_counter()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, started)
+
+    def finish(self, request, response, stats, started):
+        route, method = route_name(request), request.method
+        if not response.streaming:
+            size = len(response.content)
+        else:
+            size = 0
+            if not response.is_async:
+                # Потоковый ответ отдается после записи метрик: байты досчитываются при отправке
+                response.streaming_content = _counted_stream(response.streaming_content, route, method)
+        record(route, method, time.perf_counter() - started, stats, size)
+        return response
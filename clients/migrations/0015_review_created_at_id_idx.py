@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0014_employee_picture_review_picture'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at', 'id'], name='review_created_at_id_idx'),
+        ),
+    ]
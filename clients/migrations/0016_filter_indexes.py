@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0015_review_created_at_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['status', 'start_date'], name='project_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['start_date'], name='project_start_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectservice',
+            index=models.Index(fields=['status', 'start_date'], name='service_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectservice',
+            index=models.Index(fields=['start_date'], name='service_start_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectservice',
+            index=models.Index(fields=['project', 'status'], name='service_project_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['rating', 'created_at'], name='review_rating_created_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_project_stats(apps, schema_editor):
+    Project = apps.get_model('clients', 'Project')
+    ProjectService = apps.get_model('clients', 'ProjectService')
+    Review = apps.get_model('clients', 'Review')
+    ProjectStats = apps.get_model('clients', 'ProjectStats')
+    ProjectStatusStats = apps.get_model('clients', 'ProjectStatusStats')
+
+    stats = {project_id: ProjectStats(project_id=project_id) for project_id in Project.objects.values_list('id', flat=True)}
+    services = ProjectService.objects.order_by().values('project_id').annotate(
+        hours=Sum('hours_spent'), cost=Sum('favour__price'), count=Count('id'))
+    for row in services:
+        stats[row['project_id']].total_hours = row['hours'] or 0
+        stats[row['project_id']].cost = row['cost'] or 0
+        stats[row['project_id']].services_total = row['count']
+    reviews = Review.objects.order_by().values('project_id').annotate(count=Count('id'), rating=Sum('rating'))
+    for row in reviews:
+        stats[row['project_id']].reviews_count = row['count']
+        stats[row['project_id']].rating_sum = row['rating'] or 0
+    ProjectStats.objects.bulk_create(stats.values())
+
+    statuses = ProjectService.objects.order_by().values('project_id', 'status').annotate(count=Count('id'))
+    ProjectStatusStats.objects.bulk_create([
+        ProjectStatusStats(stats_id=row['project_id'], status=row['status'], count=row['count'])
+        for row in statuses
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0016_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectStats',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='clients.project', verbose_name='Проект')),
+                ('total_hours', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Всего часов')),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Стоимость услуг')),
+                ('services_total', models.IntegerField(default=0, verbose_name='Количество услуг')),
+                ('reviews_count', models.IntegerField(default=0, verbose_name='Количество отзывов')),
+                ('rating_sum', models.IntegerField(default=0, verbose_name='Сумма оценок')),
+            ],
+            options={
+                'verbose_name': 'Статистика проекта',
+                'verbose_name_plural': 'Статистика проектов',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectStatusStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=50, verbose_name='Статус выполнения')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество услуг')),
+                ('stats', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statuses', to='clients.projectstats', verbose_name='Статистика проекта')),
+            ],
+            options={
+                'verbose_name': 'Услуги проекта по статусу',
+                'verbose_name_plural': 'Услуги проектов по статусам',
+                'constraints': [models.UniqueConstraint(fields=('stats', 'status'), name='project_status_stats_unique')],
+            },
+        ),
+        migrations.RunPython(fill_project_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+TRACKED_LABELS = [
+    'clients.client', 'clients.project', 'clients.favour', 'clients.employee', 'clients.projectservice',
+    'clients.review', 'clients.projectstats', 'auth.user', 'general.userprofile',
+]
+
+
+def create_table_versions(apps, schema_editor):
+    TableVersion = apps.get_model('clients', 'TableVersion')
+    TableVersion.objects.bulk_create([TableVersion(label=label) for label in TRACKED_LABELS], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0017_project_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('label', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Модель')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия таблицы',
+                'verbose_name_plural': 'Версии таблиц',
+            },
+        ),
+        migrations.RunPython(create_table_versions, migrations.RunPython.noop),
+    ]
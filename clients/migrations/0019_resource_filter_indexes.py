@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0018_table_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favour',
+            index=models.Index(fields=['category'], name='favour_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['deadline'], name='project_deadline_idx'),
+        ),
+    ]
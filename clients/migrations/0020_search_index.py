@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0019_resource_filter_indexes'),
+        ('general', '0004_auto_20251103_0312'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE VIRTUAL TABLE IF NOT EXISTS clients_search USING fts5("
+                "title, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+                # rowid = id * 8 + код типа, см. clients.search.SOURCES
+                "INSERT INTO clients_search (rowid, title, body) "
+                "SELECT id * 8 + 1, name, description FROM clients_project",
+                "INSERT INTO clients_search (rowid, title, body) "
+                "SELECT id * 8 + 2, name, description FROM clients_favour",
+                "INSERT INTO clients_search (rowid, title, body) "
+                "SELECT id * 8 + 3, '', feedback FROM clients_review WHERE feedback != ''",
+                "INSERT INTO clients_search (rowid, title, body) "
+                "SELECT id * 8 + 4, '', notes FROM clients_projectservice WHERE notes != ''",
+                "INSERT INTO clients_search (rowid, title, body) "
+                "SELECT user_id * 8 + 5, fio, '' FROM general_userprofile WHERE fio IS NOT NULL AND fio != ''",
+            ],
+            reverse_sql="DROP TABLE IF EXISTS clients_search",
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0020_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='picture_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='clients', verbose_name='Миниатюра'),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='picture_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='clients', verbose_name='Миниатюра'),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='picture_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='clients', verbose_name='Миниатюра'),
+        ),
+    ]
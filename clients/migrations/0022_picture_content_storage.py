@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:37
+
+import clients.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0021_picture_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='client',
+            name='picture',
+            field=models.ImageField(null=True, storage=clients.storage.ContentHashStorage(), upload_to='clients', verbose_name='Изображение'),
+        ),
+        migrations.AlterField(
+            model_name='employee',
+            name='picture',
+            field=models.ImageField(blank=True, null=True, storage=clients.storage.ContentHashStorage(), upload_to='clients', verbose_name='Фото сотрудника'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='picture',
+            field=models.ImageField(blank=True, null=True, storage=clients.storage.ContentHashStorage(), upload_to='clients', verbose_name='Изображение'),
+        ),
+    ]
@@ -1,8 +1,12 @@
 from django.db import models
+from django.db.models import Avg, Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from clients.storage import picture_storage
+
 @receiver(post_save, sender=User)
 def create_user_profiles(sender, instance, created, **kwargs):
     """При создании пользователя создаем UserProfile"""
@@ -21,7 +25,8 @@ class Client(models.Model):
     )
     sphere = models.CharField("Сфера деятельности", max_length=100)
     company_name = models.CharField("Название компании", max_length=200, blank=True)
-    picture = models.ImageField("Изображение", null=True, upload_to="clients")
+    picture = models.ImageField("Изображение", null=True, upload_to="clients", storage=picture_storage)
+    picture_thumbnail = models.ImageField("Миниатюра", null=True, blank=True, editable=False, upload_to="clients")
     
     class Meta:
         verbose_name = "Клиент"
@@ -30,6 +35,35 @@ class Client(models.Model):
     def __str__(self) -> str:
         return self.user.userprofile.fio or self.user.username
 
+def _services_subquery(aggregate, output_field, **filters):
+    """Агрегат по услугам проекта коррелированным подзапросом, без размножения строк JOIN-ом"""
+    services = (
+        ProjectService.objects
+        .filter(project=OuterRef('pk'), **filters)
+        .order_by()
+        .values('project')
+        .annotate(value=aggregate)
+        .values('value')
+    )
+    return Coalesce(Subquery(services, output_field=output_field), Value(0), output_field=output_field)
+
+
+class ProjectQuerySet(models.QuerySet):
+    def with_dashboard(self):
+        """Часы, стоимость услуг и отзывы каждого проекта, посчитанные в базе одним запросом"""
+        money = DecimalField(max_digits=14, decimal_places=2)
+        reviews = Review.objects.filter(project=OuterRef('pk')).order_by().values('project')
+        return self.annotate(
+            total_hours=_services_subquery(Sum('hours_spent'), money),
+            cost=_services_subquery(Sum('favour__price'), money),
+            services_total=_services_subquery(Count('pk'), models.IntegerField()),
+            reviews_count=Coalesce(Subquery(reviews.annotate(value=Count('pk')).values('value')), Value(0)),
+            rating_sum=Coalesce(Subquery(reviews.annotate(value=Sum('rating')).values('value')), Value(0)),
+            avg_rating=Subquery(reviews.annotate(value=Avg('rating')).values('value'),
+                                output_field=models.FloatField()),
+        )
+
+
 class Project(models.Model):
     name = models.CharField("Название проекта", max_length=200)
     client_user = models.ForeignKey(
@@ -45,9 +79,16 @@ class Project(models.Model):
     status = models.CharField("Статус", max_length=50)  # Text choices - просто текст
     description = models.TextField("Описание проекта", blank=True)
 
+    objects = ProjectQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Проект"
         verbose_name_plural = "Проекты"
+        indexes = [
+            models.Index(fields=['status', 'start_date'], name='project_status_start_idx'),
+            models.Index(fields=['start_date'], name='project_start_date_idx'),
+            models.Index(fields=['deadline'], name='project_deadline_idx'),
+        ]
     
     def __str__(self) -> str:
         return self.name
@@ -61,6 +102,9 @@ class Favour(models.Model):
     class Meta:
         verbose_name = "Услуга"
         verbose_name_plural = "Услуги"
+        indexes = [
+            models.Index(fields=['category'], name='favour_category_idx'),
+        ]
     
     def __str__(self) -> str:
         return self.name
@@ -77,7 +121,8 @@ class Employee(models.Model):
     )
     position = models.CharField("Должность", max_length=50)
     start_work_date = models.DateField("Дата приёма на работу")
-    picture = models.ImageField("Фото сотрудника", null=True, blank=True, upload_to="clients") 
+    picture = models.ImageField("Фото сотрудника", null=True, blank=True, upload_to="clients", storage=picture_storage)
+    picture_thumbnail = models.ImageField("Миниатюра", null=True, blank=True, editable=False, upload_to="clients")
     
     class Meta:
         verbose_name = "Сотрудник"
@@ -119,11 +164,30 @@ class ProjectService(models.Model):
     class Meta:
         verbose_name = "Услуга в проекте"
         verbose_name_plural = "Услуги в проектах"
+        indexes = [
+            models.Index(fields=['status', 'start_date'], name='service_status_start_idx'),
+            models.Index(fields=['start_date'], name='service_start_date_idx'),
+            models.Index(fields=['project', 'status'], name='service_project_status_idx'),
+        ]
     
     def __str__(self) -> str:
         return f"{self.favour.name} - {self.project.name}"
     
 
+class ReviewQuerySet(models.QuerySet):
+    def with_client(self):
+        """Название проекта, имя и почта клиента через JOIN в том же запросе"""
+        return self.annotate(
+            project_name=F('project__name'),
+            client_name=Coalesce(
+                NullIf('project__client_user__userprofile__fio', Value('')),
+                'project__client_user__username',
+                output_field=models.CharField(),
+            ),
+            client_email=F('project__client_user__email'),
+        )
+
+
 class Review(models.Model):
     project = models.ForeignKey(
         'Project', 
@@ -134,11 +198,18 @@ class Review(models.Model):
     rating = models.IntegerField("Оценка", default=5)  # Убрали choices
     feedback = models.TextField("Текст отзыва")
     created_at = models.DateTimeField("Дата отзыва", auto_now_add=True)
-    picture = models.ImageField("Изображение", null=True, blank=True, upload_to="clients")
+    picture = models.ImageField("Изображение", null=True, blank=True, upload_to="clients", storage=picture_storage)
+    picture_thumbnail = models.ImageField("Миниатюра", null=True, blank=True, editable=False, upload_to="clients")
+
+    objects = ReviewQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='review_created_at_id_idx'),
+            models.Index(fields=['rating', 'created_at'], name='review_rating_created_idx'),
+        ]
     
     def __str__(self) -> str:
         return f"Отзыв на {self.project.name}"
@@ -146,4 +217,65 @@ class Review(models.Model):
     @property
     def client_user(self):
         """Клиент, оставивший отзыв"""
-        return self.project.client_user
\ No newline at end of file
+        return self.project.client_user
+
+
+class ProjectStats(models.Model):
+    """Агрегаты проекта, которые поддерживаются приращениями при изменении услуг и отзывов"""
+    project = models.OneToOneField(
+        'Project',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name="Проект",
+        related_name='stats'
+    )
+    total_hours = models.DecimalField("Всего часов", max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField("Стоимость услуг", max_digits=14, decimal_places=2, default=0)
+    services_total = models.IntegerField("Количество услуг", default=0)
+    reviews_count = models.IntegerField("Количество отзывов", default=0)
+    rating_sum = models.IntegerField("Сумма оценок", default=0)
+
+    class Meta:
+        verbose_name = "Статистика проекта"
+        verbose_name_plural = "Статистика проектов"
+
+    def __str__(self) -> str:
+        return f"Статистика {self.project_id}"
+
+    @property
+    def avg_rating(self):
+        return self.rating_sum / self.reviews_count if self.reviews_count else None
+
+
+class ProjectStatusStats(models.Model):
+    stats = models.ForeignKey(
+        'ProjectStats',
+        on_delete=models.CASCADE,
+        verbose_name="Статистика проекта",
+        related_name='statuses'
+    )
+    status = models.CharField("Статус выполнения", max_length=50)
+    count = models.IntegerField("Количество услуг", default=0)
+
+    class Meta:
+        verbose_name = "Услуги проекта по статусу"
+        verbose_name_plural = "Услуги проектов по статусам"
+        constraints = [
+            models.UniqueConstraint(fields=['stats', 'status'], name='project_status_stats_unique'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.status}: {self.count}"
+
+
+class TableVersion(models.Model):
+    """Счетчик изменений таблицы, из которого строятся ETag ответов API"""
+    label = models.CharField("Модель", max_length=100, primary_key=True)
+    version = models.BigIntegerField("Версия", default=0)
+
+    class Meta:
+        verbose_name = "Версия таблицы"
+        verbose_name_plural = "Версии таблиц"
+
+    def __str__(self) -> str:
+        return f"{self.label}: {self.version}"
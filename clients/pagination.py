@@ -0,0 +1,125 @@
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class KeysetPagination(CursorPagination):
+    """Постраничный вывод по ключу: без OFFSET и без COUNT(*)
+
+    Порядок берется из атрибута ``cursor_ordering`` вьюсета и должен
+    опираться на индекс, иначе каждая страница будет сканировать таблицу.
+    Курсор хранит значения всех ключей порядка, а следующая страница
+    выбирается сравнением ``(ключ1, ключ2, ...) > (v1, v2, ...)``, поэтому
+    порядок должен заканчиваться уникальным ключом (``id``): строки с
+    одинаковым первым ключом не пропускаются через OFFSET.
+    Страница строится в два шага - запрос и разбор прочитанных строк, -
+    чтобы асинхронные вьюхи читали ее через ``apaginate_queryset``.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = ('id',)
+
+    def get_ordering(self, request, queryset, view):
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.paginate_results(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.paginate_results([row async for row in page_queryset])
+
+    def page_queryset(self, queryset, request, view=None):
+        """Запрос страницы с одной лишней строкой, как в CursorPagination.paginate_queryset"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, self.reverse, self.current_position = 0, False, None
+        else:
+            offset, self.reverse, self.current_position = self.cursor
+
+        if self.reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if self.current_position is not None:
+            queryset = queryset.filter(self.keyset_condition(self.current_position))
+
+        self.offset = offset
+        return queryset[offset:offset + self.page_size + 1]
+
+    def keyset_condition(self, position):
+        """Строки после позиции курсора: лексикографическое сравнение по всем ключам порядка"""
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        condition, first = None, None
+        for order, value in reversed(list(zip(self.ordering, values))):
+            name = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') != self.cursor.reverse else 'gt'
+            after = Q(**{f'{name}__{lookup}': value})
+            condition = after if condition is None else after | (Q(**{name: value}) & condition)
+            first = Q(**{f'{name}__{lookup}e': value})
+        # Нестрогое условие по первому ключу дает диапазон по индексу
+        return first & condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        names = [order.lstrip('-') for order in ordering]
+        if isinstance(instance, dict):
+            values = [instance[name] for name in names]
+        else:
+            values = [getattr(instance, name) for name in names]
+        return json.dumps([str(value) for value in values])
+
+    def paginate_results(self, results):
+        """Страница из строк запроса ``page_queryset`` и позиции соседних страниц"""
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if self.reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (self.current_position is not None) or (self.offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = self.current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (self.current_position is not None) or (self.offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = self.current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
@@ -0,0 +1,263 @@
+"""Быстрый вывод списков: сериализатор как плоский план чтения из values()
+
+План строится один раз на класс сериализатора и выборку полей: каждое
+выводимое поле превращается в путь ORM и функцию преобразования значения,
+вложенные сериализаторы разворачиваются в те же пути с префиксом. Строки
+читаются через ``values()`` с уже разрешенными JOIN, без создания моделей и
+без обхода атрибутов на каждое поле, а результат совпадает с выводом
+обычного сериализатора.
+
+Поля, которые не читаются из столбцов (свойства модели и
+SerializerMethodField), план берет из ``values_fields`` сериализатора:
+``{'поле': ('путь', ...)}``, значение считает метод ``get_<поле>_values``.
+Если поле объявить нельзя, план недоступен и список выводится сериализатором.
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.settings import api_settings
+
+
+class Unsupported(Exception):
+    pass
+
+
+# Поле не попадает в вывод, как при SkipField в сериализаторе
+SKIP = object()
+
+# Типы, которые значение столбца уже выводит как есть
+PLAIN_TYPES = {
+    serializers.CharField: (models.CharField, models.TextField),
+    serializers.IntegerField: (models.IntegerField,),
+    serializers.BooleanField: (models.BooleanField,),
+}
+
+
+def _missing(field):
+    """Что выводит сериализатор, когда атрибута нет (get_attribute без значения)"""
+    if field.default is not empty:
+        if callable(field.default):
+            raise Unsupported(f"{field.field_name}: вычисляемое значение по умолчанию")
+        return None if field.default is None else field.to_representation(field.default)
+    if field.allow_null:
+        return None
+    if not field.required:
+        return SKIP
+    raise Unsupported(f"{field.field_name}: обязательное поле без атрибута")
+
+
+def _identity(value):
+    return value
+
+
+def _converter(field, model_field):
+    for field_class, model_classes in PLAIN_TYPES.items():
+        if type(field) is field_class and isinstance(model_field, model_classes):
+            return _identity
+    return field.to_representation
+
+
+class _Column:
+    def __init__(self, key, convert, guards):
+        self.key, self.convert, self.guards = key, convert, guards
+
+    def converter(self, request):
+        return self.convert
+
+    def bind(self, request):
+        key, convert, guards = self.key, self.converter(request), self.guards
+
+        def get(row):
+            for guard, outcome in guards:
+                if row[guard] is None:
+                    return outcome
+            value = row[key]
+            return None if value is None else convert(value)
+        return get
+
+
+class _File(_Column):
+    def __init__(self, key, field, model_field, guards):
+        super().__init__(key, None, guards)
+        self.storage = model_field.storage
+        self.use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+
+    def converter(self, request):
+        storage, use_url = self.storage, self.use_url
+
+        # Повторяет FileField.to_representation для имени файла из столбца
+        def convert(name):
+            if not name:
+                return None
+            if not use_url:
+                return name
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+        return convert
+
+
+class _Computed:
+    def __init__(self, keys, compute, convert):
+        self.keys, self.compute, self.convert = keys, compute, convert
+
+    def bind(self, request):
+        keys, compute, convert = self.keys, self.compute, self.convert
+
+        def get(row):
+            value = compute(*[row[key] for key in keys])
+            return value if value is None or convert is None else convert(value)
+        return get
+
+
+class _Constant:
+    def __init__(self, value):
+        self.value = value
+
+    def bind(self, request):
+        value = self.value
+        return lambda row: value
+
+
+class _Nested:
+    def __init__(self, key, entries, guards):
+        self.key, self.entries, self.guards = key, entries, guards
+
+    def bind(self, request):
+        key, guards = self.key, self.guards
+        build = _bind(self.entries, request)
+
+        def get(row):
+            for guard, outcome in guards:
+                if row[guard] is None:
+                    return outcome
+            return None if row[key] is None else build(row)
+        return get
+
+
+def _bind(entries, request):
+    getters = [(name, entry.bind(request)) for name, entry in entries]
+
+    def build(row):
+        result = {}
+        for name, get in getters:
+            value = get(row)
+            if value is not SKIP:
+                result[name] = value
+        return result
+    return build
+
+
+def _walk(model, prefix, attrs, field):
+    """Путь к последнему атрибуту source: (префикс, поле модели, условия на пустые связи)
+
+    Пустой внешний ключ по пути дает то же, что отсутствующий атрибут, пустая
+    обратная связь один-к-одному - None, как в ``rest_framework.fields.get_attribute``.
+    Возвращает None, если атрибута у модели нет совсем.
+    """
+    guards = []
+    for index, attr in enumerate(attrs):
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            if hasattr(model, attr):
+                raise Unsupported(f"{model.__name__}.{attr} не является полем модели")
+            return None
+        if index == len(attrs) - 1:
+            return prefix, model_field, guards
+        if not (model_field.one_to_one or model_field.many_to_one):
+            raise Unsupported(f"{model.__name__}.{attr}: связь с несколькими объектами")
+        if model_field.concrete:
+            if model_field.null:
+                guards.append((prefix + model_field.attname, _missing(field)))
+        else:
+            guards.append((prefix + attr + '__pk', None))
+        prefix, model = prefix + attr + '__', model_field.related_model
+    raise Unsupported(f"{field.field_name}: пустой source")
+
+
+def _compile(serializer, model, prefix='', annotations=()):
+    entries, paths = [], []
+    values_fields = getattr(serializer, 'values_fields', {})
+    for field in serializer._readable_fields:
+        name = field.field_name
+        if name in values_fields:
+            keys = [prefix + path for path in values_fields[name]]
+            compute = getattr(serializer, f'get_{name}_values')
+            convert = None if isinstance(field, serializers.SerializerMethodField) else field.to_representation
+            entries.append((name, _Computed(keys, compute, convert)))
+            paths.extend(keys)
+            continue
+        if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+            raise Unsupported(f"{type(serializer).__name__}.{name}: нет объявления в values_fields")
+        if field.source in annotations:
+            entries.append((name, _Column(field.source, field.to_representation, [])))
+            paths.append(field.source)
+            continue
+
+        walked = _walk(model, prefix, field.source_attrs, field)
+        if walked is None:
+            entries.append((name, _Constant(_missing(field))))
+            continue
+        owner_prefix, model_field, guards = walked
+        attr = field.source_attrs[-1]
+        paths.extend(guard for guard, outcome in guards)
+
+        if isinstance(field, serializers.BaseSerializer):
+            if getattr(field, 'many', False) or not model_field.is_relation or model_field.many_to_many \
+                    or model_field.one_to_many:
+                raise Unsupported(f"{type(serializer).__name__}.{name}: вложенный список")
+            key = owner_prefix + (model_field.attname if model_field.concrete else attr + '__pk')
+            nested, nested_paths = _compile(field, model_field.related_model, owner_prefix + attr + '__')
+            entries.append((name, _Nested(key, nested, guards)))
+            paths.append(key)
+            paths.extend(nested_paths)
+        elif isinstance(field, serializers.PrimaryKeyRelatedField):
+            if field.pk_field is not None or not model_field.concrete:
+                raise Unsupported(f"{type(serializer).__name__}.{name}: ключ без столбца")
+            key = owner_prefix + model_field.attname
+            entries.append((name, _Column(key, _identity, guards)))
+            paths.append(key)
+        elif isinstance(field, (serializers.RelatedField, serializers.ManyRelatedField)) \
+                or model_field.is_relation:
+            raise Unsupported(f"{type(serializer).__name__}.{name}: связь без вложенного сериализатора")
+        elif isinstance(field, serializers.FileField):
+            key = owner_prefix + attr
+            entries.append((name, _File(key, field, model_field, guards)))
+            paths.append(key)
+        else:
+            key = owner_prefix + attr
+            entries.append((name, _Column(key, _converter(field, model_field), guards)))
+            paths.append(key)
+    return entries, paths
+
+
+class ReadPlan:
+    def __init__(self, serializer_class, fields=None, annotations=()):
+        serializer = serializer_class(fields=fields) if fields is not None else serializer_class()
+        self.entries, paths = _compile(serializer, serializer_class.Meta.model, annotations=annotations)
+        self.paths = tuple(dict.fromkeys(paths))
+
+    def render(self, rows, context=None):
+        """Строки ``values(*plan.paths)`` -> список словарей, как ``serializer(many=True).data``"""
+        build = _bind(self.entries, (context or {}).get('request'))
+        return [build(row) for row in rows]
+
+
+@lru_cache(maxsize=256)
+def _read_plan(serializer_class, fields, annotations):
+    try:
+        return ReadPlan(serializer_class, fields, annotations)
+    except Unsupported:
+        return None
+
+
+def read_plan(serializer_class, fields=None, queryset=None):
+    """План чтения для сериализатора и выборки полей или None, если план построить нельзя
+
+    Аннотации ``queryset`` (верхнего уровня) читаются как столбцы.
+    """
+    annotations = tuple(queryset.query.annotations) if queryset is not None else ()
+    return _read_plan(serializer_class, tuple(fields) if fields is not None else None, annotations)
@@ -0,0 +1,125 @@
+"""Чтение из реплики для безопасных запросов к вьюсетам API
+
+``ReplicaMiddleware`` отмечает GET/HEAD/OPTIONS-запросы к вьюсетам с
+``replica_reads = True`` (``ReplicaReadMixin``), и ``ReplicaRouter`` читает
+для них модели приложений из ``replica_apps`` из базы REPLICA_DATABASE.
+Запись всегда идет в основную базу; после первой записи чтение до конца
+запроса тоже идет в основную, чтобы запрос видел то, что записал. Если
+реплика не настроена, все запросы идут в основную базу.
+
+Реплика отстает от основной базы: ETag читается из нее же и согласован с
+данными. Ответы, которые сохраняются в кэш (clients/cache.py), строятся по
+основной базе (``primary_reads``): иначе ответ отставшей реплики остался бы в
+кэше под новым поколением до истечения записи.
+
+Локально реплика - копия основной базы, которую команда ``sync_replica``
+обновляет раз в ``--interval`` секунд, имитируя отставание:
+
+    python manage.py sync_replica --interval 5
+"""
+import contextvars
+import sqlite3
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.permissions import SAFE_METHODS
+
+
+class _Routing:
+    def __init__(self):
+        # Запрос уже писал: дальше читаем из основной базы
+        self.pinned = False
+
+
+_routing = contextvars.ContextVar('replica_routing', default=None)
+
+
+def replica_alias():
+    """Псевдоним реплики или None, если она не настроена"""
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in connections.settings else None
+
+
+@contextmanager
+def replica_reads():
+    """Чтение внутри блока идет в реплику до первой записи
+
+    Внутри ``primary_reads`` или после записи чтение остается в основной базе.
+    """
+    routing = _routing.get()
+    token = _routing.set(routing if routing is not None and routing.pinned else _Routing())
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Чтение внутри блока идет в основную базу, даже если запрос читает из реплики"""
+    routing = _Routing()
+    routing.pinned = True
+    token = _routing.set(routing)
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+def copy_to_replica(using=DEFAULT_DB_ALIAS):
+    """Копирует основную базу SQLite в файл реплики через backup API, не останавливая запись"""
+    alias = replica_alias()
+    if alias is None:
+        raise ImproperlyConfigured("Реплика не настроена: нет базы REPLICA_DATABASE в DATABASES")
+    source = connections[using]
+    source.ensure_connection()
+    target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+    try:
+        source.connection.backup(target)
+    finally:
+        target.close()
+
+
+class ReplicaRouter:
+    replica_apps = {'auth', 'clients', 'general'}
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or routing.pinned or model._meta.app_label not in self.replica_apps:
+            return None
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплика получает схему вместе с данными из основной базы
+        if db == replica_alias():
+            return False
+        return None
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        _routing.set(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if request.method in SAFE_METHODS and getattr(view_class, 'replica_reads', False):
+            _routing.set(_Routing())
+
+    def process_response(self, request, response):
+        _routing.set(None)
+        return response
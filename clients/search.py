@@ -0,0 +1,203 @@
+"""Полнотекстовый поиск по проектам, услугам, отзывам и людям на SQLite FTS5
+
+Индекс ``clients_search`` хранит заголовок и текст каждого документа. rowid
+документа кодирует тип и id объекта (``id * ROWID_BASE + код типа``), поэтому
+обновление и удаление документа - поиск по rowid, без сканирования индекса.
+Индекс поддерживается сигналами сохранения и удаления (документы, удаленные
+каскадом, убираются одним запросом вместе с исходным объектом); пачечные
+операции, которые сигналов не шлют, вызывают ``index_objects`` сами. Полный пересчет:
+
+    python manage.py search_index
+"""
+import re
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.db.models import Q, QuerySet
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+
+from clients.models import Favour, Project, ProjectService, Review
+from general.models import UserProfile
+
+
+SEARCH_TABLE = 'clients_search'
+ROWID_BASE = 8
+
+Source = namedtuple('Source', 'code model id_field title_field body_field')
+
+# Тип документа -> откуда он берется; код типа не меняется, он записан в rowid
+SOURCES = {
+    'project': Source(1, Project, 'id', 'name', 'description'),
+    'favour': Source(2, Favour, 'id', 'name', 'description'),
+    'review': Source(3, Review, 'id', None, 'feedback'),
+    'service': Source(4, ProjectService, 'id', None, 'notes'),
+    'user': Source(5, UserProfile, 'user_id', 'fio', None),
+}
+KINDS = {source.code: kind for kind, source in SOURCES.items()}
+
+CREATE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "title, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+
+
+def create_search_table(using=connection):
+    with using.cursor() as cursor:
+        cursor.execute(CREATE_TABLE_SQL)
+
+
+def match_expression(query):
+    """Запрос пользователя -> выражение MATCH: все слова, каждое как префикс"""
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', query or ''))
+
+
+def _rowid(source, object_id):
+    return object_id * ROWID_BASE + source.code
+
+
+def _fields(source):
+    return [field for field in (source.id_field, source.title_field, source.body_field) if field]
+
+
+def _documents(source, rows):
+    for row in rows:
+        title = (row.get(source.title_field) if source.title_field else None) or ''
+        body = (row.get(source.body_field) if source.body_field else None) or ''
+        yield _rowid(source, row[source.id_field]), title, body
+
+
+def _delete_rowids(rowids, batch_size=500):
+    with connection.cursor() as cursor:
+        for start in range(0, len(rowids), batch_size):
+            batch = rowids[start:start + batch_size]
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(batch))})", batch)
+
+
+def remove_documents(kind, object_ids):
+    source = SOURCES[kind]
+    _delete_rowids([_rowid(source, object_id) for object_id in object_ids])
+
+
+def index_documents(kind, rows):
+    """Записывает документы из словарей с полями источника, заменяя прежние
+
+    Документ без текста удаляется из индекса.
+    """
+    documents, empty = [], []
+    for document in _documents(SOURCES[kind], rows):
+        (documents if document[1] or document[2] else empty).append(document)
+    _delete_rowids([rowid for rowid, title, body in empty])
+    if documents:
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, title, body) VALUES (%s, %s, %s)", documents)
+
+
+def index_objects(model, instances):
+    """Переиндексирует объекты модели, например после bulk_create/bulk_update"""
+    for kind, source in SOURCES.items():
+        if source.model is model:
+            index_documents(kind, [
+                {field: getattr(instance, field) for field in _fields(source)} for instance in instances
+            ])
+
+
+def rebuild_search_index(chunk_size=2000):
+    """Заполняет индекс заново из всех источников, возвращает число документов"""
+    create_search_table()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    count = 0
+    for kind, source in SOURCES.items():
+        chunk = []
+        rows = source.model.objects.order_by().values(*_fields(source))
+        for row in rows.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                index_documents(kind, chunk)
+                count, chunk = count + len(chunk), []
+        index_documents(kind, chunk)
+        count += len(chunk)
+    return count
+
+
+def search(query, kinds=None, limit=20):
+    """Документы по релевантности (bm25, совпадение в заголовке весит больше)"""
+    match = match_expression(query)
+    if not match:
+        return []
+    codes = [SOURCES[kind].code for kind in (kinds or SOURCES)]
+    sql = (
+        f"SELECT rowid, title, snippet({SEARCH_TABLE}, -1, '', '', '…', 12), "
+        f"bm25({SEARCH_TABLE}, 10.0, 1.0) AS rank "
+        f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+        f"AND rowid %% {ROWID_BASE} IN ({', '.join(map(str, codes))}) "
+        "ORDER BY rank LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, limit])
+        rows = cursor.fetchall()
+    return [
+        {'kind': KINDS[rowid % ROWID_BASE], 'id': rowid // ROWID_BASE, 'title': title, 'snippet': snippet,
+         'rank': rank}
+        for rowid, title, snippet, rank in rows
+    ]
+
+
+def search_condition(query, paths):
+    """Q для queryset: объекты, у которых по пути из ``paths`` ({тип: путь}) есть найденный документ"""
+    match = match_expression(query)
+    if not match:
+        return None
+    condition = Q()
+    for kind, path in paths.items():
+        ids = RawSQL(
+            f"SELECT rowid / {ROWID_BASE} FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid %% {ROWID_BASE} = {SOURCES[kind].code}",
+            [match],
+        )
+        condition |= Q(**{f'{path}__in': ids})
+    return condition
+
+
+def _index_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_objects(sender, [instance])
+
+
+def _remove_on_delete(sender, instance, origin=None, **kwargs):
+    source = next(source for source in SOURCES.values() if source.model is sender)
+    rowid = _rowid(source, getattr(instance, source.id_field))
+    if origin is None or origin is instance or isinstance(origin, QuerySet) and origin.model is sender:
+        _delete_rowids([rowid, *_pending(origin, pop=True)])
+    else:
+        # Каскад: документы удаляются одним запросом вместе с исходным объектом
+        _pending(origin).append(rowid)
+
+
+def _remove_cascaded(sender, instance, origin=None, **kwargs):
+    """Удаляет накопленные при каскаде документы, когда удален исходный объект"""
+    if origin is instance or isinstance(origin, QuerySet) and origin.model is sender:
+        _delete_rowids(_pending(origin, pop=True))
+
+
+def _pending(origin, pop=False):
+    if origin is None:
+        return []
+    if pop:
+        return origin.__dict__.pop('_search_rowids', [])
+    return origin.__dict__.setdefault('_search_rowids', [])
+
+
+def create_table_on_migrate(sender, using, **kwargs):
+    # Таблицу создает миграция; здесь - для баз, собранных без миграций (тесты)
+    create_search_table(connections[using])
+
+
+for _kind, _source in SOURCES.items():
+    post_save.connect(_index_on_save, sender=_source.model, dispatch_uid=f'search_index_save_{_kind}')
+    post_delete.connect(_remove_on_delete, sender=_source.model, dispatch_uid=f'search_index_delete_{_kind}')
+# Каскад от пользователя доходит до профиля и проектов, но сам пользователь не индексируется
+post_delete.connect(_remove_cascaded, sender=User, dispatch_uid='search_index_delete_cascaded_user')
@@ -1,15 +1,106 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from clients.models import Client, Project, Favour, Employee, ProjectService, Review
+from clients.metrics import serializer_timer
+from clients.models import Client, Project, Favour, Employee, ProjectService, Review, ProjectStats
 from django.contrib.auth.models import User
 from general.models import UserProfile
 
 
+class EagerLoadingMixin:
+    """Сериализатор сам объявляет связи, которые читает при выводе
+
+    Принимает выборку полей ``fields``/``omit``: лишние поля не выводятся, а
+    ``setup_eager_loading`` с той же выборкой не подгружает ненужные связи и
+    откладывает (defer) невостребованные столбцы. Пути ORM, которые читают
+    SerializerMethodField, перечисляются в ``method_field_paths``.
+
+    Для быстрого вывода списков (clients.readplan) поля, которые не читаются
+    из столбцов, объявляются в ``values_fields`` вместе с методом
+    ``get_<поле>_values``, считающим значение по строке ``values()``.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    method_field_paths = {}
+    values_fields = {}
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        self.sparse_fields = fields
+        self.sparse_omit = omit
+        super().__init__(*args, **kwargs)
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = _select_fields(fields, self.sparse_fields, self.sparse_omit)
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected or field.write_only}
+
+    @classmethod
+    def select_fields(cls, fields=None, omit=None):
+        """Имена выводимых полей по ``fields``/``omit`` или None, если выборки нет"""
+        return _select_fields(cls().fields, fields, omit)
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        select_related, prefetch_related = cls.select_related_fields, cls.prefetch_related_fields
+        if fields is not None:
+            needed = {path.split('__')[0] for path in cls.field_paths(fields)}
+            select_related = [path for path in select_related if path.split('__')[0] in needed]
+            prefetch_related = [path for path in prefetch_related if path.split('__')[0] in needed]
+            deferred = [
+                field.name for field in queryset.model._meta.concrete_fields
+                if not field.primary_key and not field.is_relation and field.name not in needed
+            ]
+            if deferred:
+                queryset = queryset.defer(*deferred)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    @classmethod
+    def field_paths(cls, fields):
+        """Пути ORM, которые читают перечисленные поля сериализатора"""
+        serializer_fields = cls().fields
+        paths = []
+        for name in fields:
+            field = serializer_fields[name]
+            if name in cls.method_field_paths:
+                paths.extend(cls.method_field_paths[name])
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                # Значение берется из столбца внешнего ключа, без JOIN
+                paths.append(field.source.replace('.', '__') + '_id')
+            elif field.source != '*':
+                paths.append(field.source.replace('.', '__'))
+        return paths
+
+
+def _select_fields(fields, selected=None, omit=None):
+    if selected is None and omit is None:
+        return None
+    available = [name for name, field in fields.items() if not field.write_only]
+    unknown = (set(selected or ()) | set(omit or ())) - set(available)
+    if unknown:
+        raise serializers.ValidationError({'fields': [f"Неизвестные поля: {', '.join(sorted(unknown))}"]})
+    omit = set(omit or ())
+    return [name for name in available if (selected is None or name in selected) and name not in omit]
+
+
 # class ClientSerializer(serializers.ModelSerializer):
 #     class Meta:
 #         model = Client
 #         fields = "__all__"
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('user', 'user__userprofile')
+    method_field_paths = {'user_profile': ('user__userprofile__fio',)}
+    values_fields = {'user_profile': ('user__userprofile__id', 'user__userprofile__fio')}
+
     user_username = serializers.CharField(source='user.username', read_only=True)
     user_profile = serializers.SerializerMethodField(read_only=True)
     
@@ -23,23 +114,42 @@ class ClientSerializer(serializers.ModelSerializer):
                 'fio': obj.user.userprofile.fio
             }
         return None
+
+    def get_user_profile_values(self, profile_id, fio):
+        return {'fio': fio} if profile_id is not None else None
     
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectStatsSerializer(serializers.ModelSerializer):
+    values_fields = {'avg_rating': ('rating_sum', 'reviews_count')}
+
+    avg_rating = serializers.FloatField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = ProjectStats
+        fields = ['total_hours', 'cost', 'services_total', 'reviews_count', 'avg_rating']
+
+    def get_avg_rating_values(self, rating_sum, reviews_count):
+        return rating_sum / reviews_count if reviews_count else None
+
+
+class ProjectSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('stats',)
+
     client = ClientSerializer(read_only=True)
+    stats = ProjectStatsSerializer(read_only=True, allow_null=True)
     class Meta:
         model = Project
-        fields = ['id', 'name', 'client', 'client_user', 'deadline', 'budget', 'status', 'description']
+        fields = ['id', 'name', 'client', 'client_user', 'deadline', 'budget', 'status', 'description', 'stats']
 
-class FavourSerializer(serializers.ModelSerializer):
+class FavourSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Favour
         fields = ['id', 'name', 'category', 'description', 'price']
     
 
-class EmployeeSerializer(serializers.ModelSerializer):
+class EmployeeSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Employee
-        fields = ['id', 'user', 'position', 'start_work_date', 'picture'] 
+        fields = ['id', 'user', 'position', 'start_work_date', 'picture', 'picture_thumbnail']
 
 # class ProjectServiceSerializer(serializers.ModelSerializer):
 #     project = ProjectSerializer(read_only=True)
@@ -50,7 +160,9 @@ class EmployeeSerializer(serializers.ModelSerializer):
 #         model = ProjectService
 #         fields = '__all__'
 
-class ProjectServiceSerializer(serializers.ModelSerializer):
+class ProjectServiceSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('project', 'favour', 'employee_user')
+
     project_name = serializers.CharField(source='project.name', read_only=True)
     favour_name = serializers.CharField(source='favour.name', read_only=True)
     employee_username = serializers.CharField(source='employee_user.username', read_only=True, allow_null=True)
@@ -65,7 +177,169 @@ class ProjectServiceSerializer(serializers.ModelSerializer):
         read_only_fields = ('start_date', 'id')
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class InBulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Берет объект из заранее загруженного словаря вместо SELECT на каждый элемент"""
+    in_bulk = None
+
+    def to_internal_value(self, data):
+        if self.in_bulk is None:
+            return super().to_internal_value(data)
+        try:
+            pk = self.to_pk(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in self.in_bulk:
+            self.fail('does_not_exist', pk_value=data)
+        return self.in_bulk[pk]
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            raise TypeError
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        return self.get_queryset().model._meta.pk.to_python(data)
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """Создает и обновляет объекты пачкой
+
+    Внешние ключи всех элементов проверяются одним IN-запросом на связанную
+    модель, элементы с ``id`` обновляются через bulk_update, остальные
+    создаются через bulk_create. Один ``id`` можно указать только в одном
+    элементе.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.load_related(data)
+        attrs = super().to_internal_value(data)
+        self.check_unique_ids(attrs)
+        return attrs
+
+    def check_unique_ids(self, attrs):
+        """Ошибка у каждого повтора ``id``, в том же виде, что и ошибки полей элементов"""
+        first_index, errors = {}, []
+        for index, item in enumerate(attrs):
+            pk = item.get('id')
+            if pk is not None and pk in first_index:
+                errors.append({'id': [f"Объект {pk} уже обновляется элементом {first_index[pk]}"]})
+            else:
+                if pk is not None:
+                    first_index[pk] = index
+                errors.append({})
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+    def load_related(self, data):
+        for field in self.child.fields.values():
+            if field.read_only or not isinstance(field, InBulkPrimaryKeyRelatedField):
+                continue
+            pks = set()
+            for item in data:
+                if not isinstance(item, dict) or item.get(field.field_name) is None:
+                    continue
+                try:
+                    pks.add(field.to_pk(item[field.field_name]))
+                except (TypeError, ValueError, DjangoValidationError):
+                    pass
+            field.in_bulk = field.get_queryset().in_bulk(pks)
+
+    def validate(self, attrs):
+        model = self.child.Meta.model
+        pks = [item['id'] for item in attrs if 'id' in item]
+        self.existing = model.objects.in_bulk(pks)
+        missing = [pk for pk in pks if pk not in self.existing]
+        if missing:
+            raise serializers.ValidationError(f"Объекты не найдены: {missing}")
+        return attrs
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        to_create, to_update, update_fields = [], [], set()
+        for attrs in validated_data:
+            attrs = dict(attrs)
+            pk = attrs.pop('id', None)
+            if pk is None:
+                to_create.append(model(**attrs))
+                continue
+            instance = self.existing[pk]
+            for name, value in attrs.items():
+                setattr(instance, name, value)
+            update_fields.update(attrs)
+            to_update.append(instance)
+
+        created = model.objects.bulk_create(to_create)
+        if to_update and update_fields:
+            model.objects.bulk_update(to_update, sorted(update_fields))
+
+        # Сохраняем порядок элементов запроса
+        created, updated = iter(created), iter(to_update)
+        return [next(updated) if 'id' in attrs else next(created) for attrs in validated_data]
+
+
+class ProjectServiceBulkSerializer(ProjectServiceSerializer):
+    serializer_related_field = InBulkPrimaryKeyRelatedField
+
+    id = serializers.IntegerField(required=False)
+
+    class Meta(ProjectServiceSerializer.Meta):
+        list_serializer_class = BulkListSerializer
+        read_only_fields = ('start_date',)
+
+
+def _money(value):
+    return serializers.DecimalField(max_digits=14, decimal_places=2).to_representation(value)
+
+
+class ProjectDashboardSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('stats',)
+    prefetch_related_fields = ('stats__statuses',)
+
+    # Проект без строки статистики (loaddata, bulk_create без сигналов) выводится как проект без услуг:
+    # поля с source='stats.*' дали бы None, поэтому значения берутся методами
+    cost = serializers.SerializerMethodField()
+    budget_left = serializers.SerializerMethodField()
+    total_hours = serializers.SerializerMethodField()
+    services_total = serializers.SerializerMethodField()
+    services = serializers.SerializerMethodField()
+    reviews_count = serializers.SerializerMethodField()
+    avg_rating = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Project
+        fields = ['id', 'name', 'status', 'deadline', 'budget', 'cost', 'budget_left', 'total_hours',
+                  'services_total', 'services', 'reviews_count', 'avg_rating']
+
+    def stat(self, obj, name, default=0):
+        stats = getattr(obj, 'stats', None)
+        return getattr(stats, name) if stats is not None else default
+
+    def get_cost(self, obj):
+        return _money(self.stat(obj, 'cost'))
+
+    def get_budget_left(self, obj):
+        return _money(obj.budget - self.stat(obj, 'cost'))
+
+    def get_total_hours(self, obj):
+        return _money(self.stat(obj, 'total_hours'))
+
+    def get_services_total(self, obj):
+        return self.stat(obj, 'services_total')
+
+    def get_reviews_count(self, obj):
+        return self.stat(obj, 'reviews_count')
+
+    def get_avg_rating(self, obj):
+        return self.stat(obj, 'avg_rating', None)
+
+    def get_services(self, obj):
+        stats = getattr(obj, 'stats', None)
+        if stats is None:
+            return {}
+        return {row.status: row.count for row in stats.statuses.all() if row.count}
+
+
+class ReviewSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     client_name = serializers.CharField(read_only=True)
     client_email = serializers.CharField(read_only=True)
     project_name = serializers.CharField(read_only=True)
@@ -73,14 +347,16 @@ class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = ['id', 'project', 'project_name', 'client_name', 'client_email', 
-                 'rating', 'feedback', 'created_at', 'picture']
+                 'rating', 'feedback', 'created_at', 'picture', 'picture_thumbnail']
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         fields = ['fio', 'birthday']
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('userprofile',)
+
     userprofile = UserProfileSerializer(read_only=True)
     password = serializers.CharField(write_only=True)
     
@@ -94,4 +370,21 @@ class UserSerializer(serializers.ModelSerializer):
             email=validated_data.get('email', ''),
             password=validated_data['password']
         )
-        return user
\ No newline at end of file
+        return user
+
+class BatchOperationSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False, allow_null=True, default=None)
+
+
+class BatchSerializer(serializers.Serializer):
+    """Пакет запросов к API (clients/batch.py); наибольший размер пакета - ``max_requests`` из контекста"""
+    requests = BatchOperationSerializer(many=True, allow_empty=False)
+    atomic = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        max_requests = self.context.get('max_requests')
+        if max_requests is not None and len(value) > max_requests:
+            raise serializers.ValidationError(f"Не больше {max_requests} запросов в пакете")
+        return value
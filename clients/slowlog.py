@@ -0,0 +1,157 @@
+"""Журнал медленных SQL-запросов с планом выполнения
+
+Запрос дольше SLOW_QUERY_THRESHOLD секунд записывается в лог
+``clients.slowlog`` и, если задан SLOW_QUERY_LOG, строкой JSON в этот файл:
+нормализованный SQL и его форма (хеш), число параметров, время, маршрут
+запроса к API или админке, стек вызова в коде проекта и вывод
+``EXPLAIN QUERY PLAN``. План снимается один раз на форму запроса в процессе.
+По умолчанию порог None и журнал выключен: его включают в настройках
+конкретного развертывания.
+
+Обертка ставится на каждое соединение при его создании. Самые дорогие
+формы запросов по журналу (в том числе из нескольких процессов):
+
+    python manage.py slow_queries --top 10
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+from clients import metrics
+from clients.metrics import current_request, route_name
+
+
+logger = logging.getLogger(__name__)
+
+_write_lock = threading.Lock()
+_plans = {}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """SQL без литералов и с любым числом параметров в IN: одна форма на одинаковые запросы"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def query_shape(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+def explain(connection, sql, params):
+    """Строки EXPLAIN QUERY PLAN; курсор без оберток, чтобы план не попал в счетчики запросов"""
+    if connection.vendor != 'sqlite':
+        return []
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params or ())
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _project_stack(limit=8):
+    """Кадры стека из кода проекта, без Django, DRF и оберток запросов"""
+    wrappers = {__file__, metrics.__file__}
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        f'{os.path.relpath(frame.filename, base_dir)}:{frame.lineno} in {frame.name}'
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir) and 'site-packages' not in frame.filename
+        and frame.filename not in wrappers
+    ]
+    return frames[-limit:]
+
+
+def _write(entry):
+    path = getattr(settings, 'SLOW_QUERY_LOG', None)
+    if not path:
+        return
+    line = json.dumps(entry, ensure_ascii=False) + '\n'
+    with _write_lock, open(path, 'a', encoding='utf-8') as f:
+        f.write(line)
+
+
+def _record(connection, sql, params, duration):
+    normalized = normalize_sql(sql)
+    shape = query_shape(normalized)
+    plan = _plans.get(shape)
+    if plan is None:
+        try:
+            plan = explain(connection, sql, params)
+        except Exception:
+            plan = []
+        _plans[shape] = plan
+    request = current_request()
+    entry = {
+        'time': time.time(),
+        'shape': shape,
+        'sql': normalized,
+        'params': len(params or ()),
+        'duration': duration,
+        'database': connection.alias,
+        'view': route_name(request) if request is not None else None,
+        'method': request.method if request is not None else None,
+        'stack': _project_stack(),
+        'plan': plan,
+    }
+    logger.warning("Медленный запрос %.1f мс [%s] %s: %s | %s",
+                   duration * 1000, shape, entry['view'], normalized, '; '.join(plan))
+    _write(entry)
+
+
+def _log_slow_query(execute, sql, params, many, context):
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD', None)
+    if threshold is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        if duration >= threshold and not many:
+            _record(context['connection'], sql, params, duration)
+
+
+def _install(sender, connection, **kwargs):
+    if _log_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_log_slow_query)
+
+
+connection_created.connect(_install, dispatch_uid='slow_query_log')
+
+
+def read_log(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def top_queries(entries, sort='total', limit=10):
+    """Формы запросов по убыванию суммарного (``total``), наибольшего (``max``) времени или числа"""
+    shapes = defaultdict(lambda: {'count': 0, 'total': 0.0, 'max': 0.0, 'views': defaultdict(int)})
+    for entry in entries:
+        shape = shapes[entry['shape']]
+        shape['count'] += 1
+        shape['total'] += entry['duration']
+        shape['max'] = max(shape['max'], entry['duration'])
+        shape['views'][entry['view'] or '-'] += 1
+        shape.update(shape=entry['shape'], sql=entry['sql'], plan=entry['plan'], stack=entry['stack'])
+    return sorted(shapes.values(), key=lambda shape: shape[sort], reverse=True)[:limit]
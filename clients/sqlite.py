@@ -0,0 +1,57 @@
+"""Профили прагм SQLite, применяемые к каждому новому соединению
+
+Профиль выбирается настройкой SQLITE_PROFILE (app/settings.py берет ее из
+одноименной переменной окружения, по умолчанию ``default``):
+
+- ``default`` - умолчания SQLite: журнал отката, читатели и писатель
+  блокируют друг друга;
+- ``production`` - WAL (читатели не ждут писателя), ожидание блокировки
+  вместо мгновенного "database is locked", ``synchronous = NORMAL``
+  (в WAL fsync только на контрольных точках), отображение файла в память,
+  кэш страниц побольше и временные таблицы в памяти. WAL записывается в
+  заголовок файла базы и остается после закрытия соединения, поэтому
+  профиль включают только при развертывании.
+
+Прагмы задаются на ``connection_created``, поэтому действуют и на
+постоянные соединения (CONN_MAX_AGE), и на соединения потоков и
+асинхронных вьюх. Остальные базы (не SQLite) не затрагиваются.
+Прагмы идут курсором без оберток соединения: обработчики метрик и журнала
+медленных запросов подключаются к тому же сигналу, и прагмы не должны
+попадать в число запросов к базе.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+PROFILES = {
+    'default': {},
+    'production': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'mmap_size': 128 * 1024 * 1024,
+        'cache_size': -20000,  # в КиБ, около 20 МБ
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+def get_pragmas(profile=None):
+    return PROFILES[profile or getattr(settings, 'SQLITE_PROFILE', 'default')]
+
+
+def apply_pragmas(connection, pragmas):
+    cursor = connection.create_cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+def _configure_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection, get_pragmas())
+
+
+connection_created.connect(_configure_connection, dispatch_uid='sqlite_profile')
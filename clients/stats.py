@@ -0,0 +1,270 @@
+"""Поддержка ProjectStats: приращения через F() при сохранении и удалении
+услуг и отзывов, полный пересчет и проверка расхождений"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, QuerySet, Subquery
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from clients.models import Favour, Project, ProjectService, ProjectStats, ProjectStatusStats, Review
+from clients.versions import bump_versions
+
+
+STATS_FIELDS = ('total_hours', 'cost', 'services_total', 'reviews_count', 'rating_sum')
+
+
+def compute_project_stats(project_ids=None):
+    """Считает агрегаты с нуля: {project_id: (поля STATS_FIELDS, {status: count})}"""
+    projects = Project.objects.all() if project_ids is None else Project.objects.filter(pk__in=project_ids)
+    services = ProjectService.objects.all() if project_ids is None else ProjectService.objects.filter(
+        project_id__in=project_ids)
+
+    result = {
+        row.pop('id'): (row, {})
+        for row in projects.with_dashboard().values('id', *STATS_FIELDS)
+    }
+    status_rows = services.order_by().values('project_id', 'status').annotate(count=Count('pk'))
+    for row in status_rows:
+        result[row['project_id']][1][row['status']] = row['count']
+    return result
+
+
+def rebuild_project_stats(project_ids=None):
+    """Пересчитывает статистику всех проектов или только переданных"""
+    computed = compute_project_stats(project_ids)
+    with transaction.atomic():
+        stored = ProjectStats.objects.all()
+        if project_ids is not None:
+            stored = stored.filter(project_id__in=project_ids)
+        stored.delete()
+        ProjectStats.objects.bulk_create([
+            ProjectStats(project_id=project_id, **values)
+            for project_id, (values, statuses) in computed.items()
+        ])
+        ProjectStatusStats.objects.bulk_create([
+            ProjectStatusStats(stats_id=project_id, status=status, count=count)
+            for project_id, (values, statuses) in computed.items()
+            for status, count in statuses.items()
+        ])
+        bump_versions(ProjectStats)
+    return len(computed)
+
+
+def find_stats_drift(project_ids=None):
+    """Возвращает {project_id: {поле: (сохранено, ожидается)}} для разошедшихся проектов"""
+    computed = compute_project_stats(project_ids)
+    stored = ProjectStats.objects.prefetch_related('statuses')
+    if project_ids is not None:
+        stored = stored.filter(project_id__in=project_ids)
+    stored = {stats.project_id: stats for stats in stored}
+
+    drift = {}
+    for project_id, (values, statuses) in computed.items():
+        stats = stored.get(project_id)
+        if stats is None:
+            drift[project_id] = {'stats': (None, 'missing')}
+            continue
+        diff = {
+            name: (getattr(stats, name), value)
+            for name, value in values.items()
+            if getattr(stats, name) != value
+        }
+        stored_statuses = {row.status: row.count for row in stats.statuses.all() if row.count}
+        if stored_statuses != statuses:
+            diff['statuses'] = (stored_statuses, statuses)
+        if diff:
+            drift[project_id] = diff
+    return drift
+
+
+def apply_stats_delta(project_id, statuses=None, **deltas):
+    """Прибавляет приращения к статистике проекта, не читая ее
+
+    Если строки статистики еще нет, проект пересчитывается целиком после
+    фиксации транзакции: к этому моменту каскадное удаление проекта уже
+    завершено, и пересчет не создаст строку для удаленного проекта.
+    """
+    updates = {name: F(name) + value for name, value in deltas.items() if value}
+    statuses = {status: delta for status, delta in (statuses or {}).items() if delta}
+    if not updates and not statuses:
+        return
+
+    stats = ProjectStats.objects.filter(project_id=project_id)
+    found = stats.update(**updates) if updates else stats.exists()
+    if not found:
+        _rebuild_on_commit(project_id)
+        return
+    bump_versions(ProjectStats)
+
+    for status, delta in statuses.items():
+        updated = ProjectStatusStats.objects.filter(stats_id=project_id, status=status).update(
+            count=F('count') + delta)
+        if not updated:
+            if delta < 0:
+                _rebuild_on_commit(project_id)
+                return
+            ProjectStatusStats.objects.create(stats_id=project_id, status=status, count=delta)
+
+
+def _rebuild_on_commit(project_id):
+    transaction.on_commit(lambda: rebuild_project_stats([project_id]))
+
+
+def _deleted_directly(origin, model):
+    """Объект удален сам, а не каскадом
+
+    При каскаде от проекта (или его клиента) статистика удаляется вместе с
+    проектом, а при удалении услуги каталога пересчитывается пачкой.
+    """
+    if isinstance(origin, QuerySet):
+        return origin.model is model
+    return origin is None or isinstance(origin, model)
+
+
+def _decimal(value):
+    # Поля, присвоенные в коде, могут быть float до перечитывания из базы
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def _service_contribution(instance, old=None):
+    if old is not None and old['favour_id'] == instance.favour_id:
+        price = old['favour__price']
+    else:
+        price = instance.favour.price
+    return {
+        'project_id': instance.project_id,
+        'status': instance.status,
+        'hours': _decimal(instance.hours_spent),
+        'cost': _decimal(price),
+    }
+
+
+def _apply_service(contribution, sign):
+    apply_stats_delta(
+        contribution['project_id'],
+        statuses={contribution['status']: sign},
+        total_hours=sign * contribution['hours'],
+        cost=sign * contribution['cost'],
+        services_total=sign,
+    )
+
+
+@receiver(post_save, sender=Project)
+def create_project_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ProjectStats.objects.create(project=instance)
+
+
+@receiver(pre_save, sender=ProjectService)
+def remember_project_service(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    instance._stats_old = (
+        ProjectService.objects
+        .filter(pk=instance.pk)
+        .values('project_id', 'favour_id', 'status', 'hours_spent', 'favour__price')
+        .first()
+    )
+
+
+@receiver(post_save, sender=ProjectService)
+def update_stats_on_service_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = instance.__dict__.pop('_stats_old', None)
+    new = _service_contribution(instance, old)
+    if old is None:
+        _apply_service(new, 1)
+        return
+
+    old = {'project_id': old['project_id'], 'status': old['status'],
+           'hours': old['hours_spent'], 'cost': old['favour__price']}
+    if old['project_id'] != new['project_id']:
+        _apply_service(old, -1)
+        _apply_service(new, 1)
+        return
+    statuses = {}
+    if old['status'] != new['status']:
+        statuses = {old['status']: -1, new['status']: 1}
+    apply_stats_delta(
+        new['project_id'],
+        statuses=statuses,
+        total_hours=new['hours'] - old['hours'],
+        cost=new['cost'] - old['cost'],
+    )
+
+
+@receiver(post_delete, sender=ProjectService)
+def update_stats_on_service_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_directly(origin, ProjectService):
+        _apply_service(_service_contribution(instance), -1)
+
+
+@receiver(pre_save, sender=Review)
+def remember_review(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    instance._stats_old = Review.objects.filter(pk=instance.pk).values('project_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def update_stats_on_review_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = instance.__dict__.pop('_stats_old', None)
+    if old is None:
+        apply_stats_delta(instance.project_id, reviews_count=1, rating_sum=instance.rating)
+    elif old['project_id'] != instance.project_id:
+        apply_stats_delta(old['project_id'], reviews_count=-1, rating_sum=-old['rating'])
+        apply_stats_delta(instance.project_id, reviews_count=1, rating_sum=instance.rating)
+    else:
+        apply_stats_delta(instance.project_id, rating_sum=instance.rating - old['rating'])
+
+
+@receiver(post_delete, sender=Review)
+def update_stats_on_review_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_directly(origin, Review):
+        apply_stats_delta(instance.project_id, reviews_count=-1, rating_sum=-instance.rating)
+
+
+@receiver(pre_save, sender=Favour)
+def remember_favour_price(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    instance._stats_old_price = Favour.objects.filter(pk=instance.pk).values_list('price', flat=True).first()
+
+
+@receiver(post_save, sender=Favour)
+def update_stats_on_favour_price(sender, instance, raw=False, **kwargs):
+    old_price = instance.__dict__.pop('_stats_old_price', None)
+    if raw or old_price is None:
+        return
+    delta = _decimal(instance.price) - old_price
+    if not delta:
+        return
+    usage = (
+        ProjectService.objects
+        .filter(project=OuterRef('project'), favour=instance)
+        .order_by()
+        .values('project')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    ProjectStats.objects.filter(project__project_services__favour=instance).update(
+        cost=F('cost') + delta * Subquery(usage))
+    bump_versions(ProjectStats)
+
+
+@receiver(pre_delete, sender=Favour)
+def remember_favour_projects(sender, instance, **kwargs):
+    instance._stats_projects = list(
+        ProjectService.objects.filter(favour=instance).order_by().values_list('project_id', flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=Favour)
+def rebuild_stats_on_favour_delete(sender, instance, **kwargs):
+    project_ids = instance.__dict__.pop('_stats_projects', None)
+    if project_ids:
+        rebuild_project_stats(project_ids)
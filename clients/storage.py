@@ -0,0 +1,81 @@
+"""Хранилище загруженных изображений с именами по содержимому
+
+Файл сохраняется под SHA-256 своего содержимого (``clients/3f/3f9a...c1.png``):
+хеш считается по кускам, пока файл пишется во временный, поэтому повторная
+загрузка того же изображения не создает копию, а получает имя уже лежащего
+файла. Содержимое под таким именем не меняется, как и у миниатюр с размером
+в имени (``<хеш>_thumb128.webp``), поэтому их можно кешировать бессрочно.
+
+При DEBUG файлы отдает ``media_view`` с этим заголовком. В продакшене
+MEDIA_ROOT отдает веб-сервер, и заголовок задается его правилом, например
+для nginx:
+
+    location /media/ {
+        alias /path/to/media/;
+        location ~ "/[0-9a-f]{64}(_thumb[0-9]+)?[.][a-z]+$" {
+            add_header Cache-Control "public, max-age=31536000, immutable";
+        }
+    }
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+# Имя файла с содержимым по хешу и производные от него (миниатюры)
+CONTENT_ADDRESSED_NAME = re.compile(r'(?:^|/)[0-9a-f]{64}(?:_thumb\d+)?\.\w+$')
+
+
+def is_content_addressed(name):
+    return CONTENT_ADDRESSED_NAME.search(name) is not None
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    def content_name(self, name, digest):
+        """Имя файла по хешу: каталог из upload_to, два знака хеша, хеш и расширение"""
+        directory, filename = posixpath.split(name)
+        ext = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + ext)
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save, занятое имя - тот же файл
+        return name
+
+    def _save(self, name, content):
+        directory = os.path.dirname(self.path(name))
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            name = self.content_name(name, digest.hexdigest())
+            path = self.path(name)
+            if os.path.exists(path):
+                return name
+            if self.directory_permissions_mode is not None:
+                old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+                try:
+                    os.makedirs(os.path.dirname(path), self.directory_permissions_mode, exist_ok=True)
+                finally:
+                    os.umask(old_umask)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+            return name
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+picture_storage = ContentHashStorage()
@@ -1,12 +1,51 @@
-from django.test import TestCase
-from rest_framework.test import APIClient
-from django.contrib.auth.models import User
-from clients.models import Client, Project, Favour, Employee, ProjectService, Review
-from general.models import UserProfile
+import gc
+import hashlib
+import importlib
+import json
+import os
+import tempfile
+import threading
+from base64 import b64encode
 from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, clear_url_caches, resolve
+from django.utils import timezone
+from PIL import Image
 from rest_framework import status
+from rest_framework.test import APIClient
+
+from app import urls as app_urls
+from app.urls import router
+from clients import metrics
+from clients.benchmarks import EndpointQueriesMixin
+from clients.api import ProjectsViewset
+from clients.bootstrap import DATASETS
+from clients.models import Client, Project, Favour, Employee, ProjectService, Review, ProjectStats
+from clients.readplan import read_plan
+from clients.replica import primary_reads, replica_reads
+from clients.search import SEARCH_TABLE
+from clients.serializers import ProjectServiceSerializer, ReviewSerializer
+from clients.slowlog import normalize_sql, read_log
+from clients.stats import find_stats_drift
+from clients.storage import is_content_addressed
+from clients.views import media_view
+from general.models import UserProfile
 
 
 User = get_user_model()
@@ -36,7 +75,7 @@ class ClientViewsetTestCase(TestCase):
         )
 
         r = self.client.get('/api/clients/')
-        data = r.json()
+        data = r.json()['results']
         print(data)
 
         # Проверяем что вернулось 2 клиента
@@ -168,7 +207,7 @@ class ProjectsViewsetTestCase(TestCase):
         )
 
         r = self.client.get('/api/projects/')
-        data = r.json()
+        data = r.json()['results']
         print("Projects data:", data)
 
         assert r.status_code == 200
@@ -215,7 +254,7 @@ class ProjectsViewsetTestCase(TestCase):
             )
             # Проверяем что он доступен через API
             r = self.client.get('/api/projects/')
-            data = r.json()
+            data = r.json()['results']
             assert len(data) == 1
 
     def test_retrieve_project(self):
@@ -305,7 +344,7 @@ class FavourViewsetTestCase(TestCase):
         )
 
         r = self.client.get('/api/favours/')
-        data = r.json()
+        data = r.json()['results']
         print("Favours data:", data)
 
         # Проверяем статус код
@@ -354,7 +393,7 @@ class FavourViewsetTestCase(TestCase):
             )
             # Проверяем что она доступна через API
             r = self.client.get('/api/favours/')
-            data = r.json()
+            data = r.json()['results']
             assert len(data) == 1
 
     def test_retrieve_favour(self):
@@ -456,7 +495,7 @@ class EmployeeViewsetTestCase(TestCase):
         )
 
         r = self.client.get('/api/employees/')
-        data = r.json()
+        data = r.json()['results']
 
         assert r.status_code == 200
         assert len(data) == 1
@@ -578,7 +617,7 @@ class ProjectServiceViewsetTestCase(TestCase):
         )
 
         r = self.client.get('/api/project-services/')
-        data = r.json()
+        data = r.json()['results']
 
         assert r.status_code == 200
         assert len(data) == 1
@@ -603,7 +642,7 @@ class ProjectServiceViewsetTestCase(TestCase):
         
         # Проверяем что доступен через API
         r = self.client.get('/api/project-services/')
-        data = r.json()
+        data = r.json()['results']
         assert len(data) == 1
         assert data[0]['status'] == "in_progress"
 
@@ -708,7 +747,7 @@ class ReviewViewsetTestCase(TestCase):
         )
 
         r = self.client.get('/api/reviews/')
-        data = r.json()
+        data = r.json()['results']
 
         assert r.status_code == 200
         assert len(data) == 1
@@ -808,3 +847,1782 @@ class ReviewViewsetTestCase(TestCase):
         assert r.status_code == 204
         assert Review.objects.count() == initial_count - 1
 
+
+
+class EagerLoadingTestCase(TestCase):
+    """Списки выполняют фиксированное число запросов независимо от числа строк"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        self.favour = Favour.objects.create(name="Разработка", price=1000, category="Разработка")
+        for i in range(5):
+            client_user = User.objects.create_user(username=f'client{i}', password='testpass123')
+            Client.objects.create(user=client_user, sphere="IT", company_name=f"Компания {i}")
+            employee_user = User.objects.create_user(username=f'employee{i}', password='testpass123')
+            Employee.objects.create(user=employee_user, position="Разработчик", start_work_date=date.today())
+            project = Project.objects.create(
+                name=f"Проект {i}",
+                client_user=client_user,
+                deadline=date.today() + timedelta(days=30),
+                budget=10000,
+                status="В работе"
+            )
+            ProjectService.objects.create(project=project, favour=self.favour, employee_user=employee_user)
+            Review.objects.create(project=project, rating=5, feedback="Хорошо")
+
+    def test_list_endpoints_query_count(self):
+        for url in ['/api/clients/', '/api/projects/', '/api/favours/', '/api/employees/',
+                    '/api/project-services/', '/api/reviews/', '/api/users/']:
+            # Версии таблиц для ETag и сами данные
+            with self.assertNumQueries(2):
+                r = self.client.get(url)
+            assert r.status_code == 200
+
+    def test_client_list_includes_related_data(self):
+        r = self.client.get('/api/clients/')
+        data = r.json()['results']
+
+        assert data[0]['user_username'] == 'client0'
+        assert data[0]['user_profile'] == {'fio': None}
+
+    def test_project_service_list_includes_related_names(self):
+        r = self.client.get('/api/project-services/')
+        data = r.json()['results']
+
+        assert data[0]['project_name'] == "Проект 0"
+        assert data[0]['favour_name'] == "Разработка"
+        assert data[0]['employee_username'] == 'employee0'
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        for i in range(5):
+            Favour.objects.create(name=f"Услуга {i}", price=1000, category="Разработка")
+
+    def test_pages_follow_cursor(self):
+        r = self.client.get('/api/favours/?page_size=2')
+        data = r.json()
+
+        assert [f['name'] for f in data['results']] == ["Услуга 0", "Услуга 1"]
+        assert data['previous'] is None
+        assert 'count' not in data
+
+        names = [f['name'] for f in data['results']]
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            names += [f['name'] for f in data['results']]
+        assert names == [f"Услуга {i}" for i in range(5)]
+
+    def test_page_does_not_count_or_offset(self):
+        first = self.client.get('/api/favours/?page_size=2').json()
+
+        with self.assertNumQueries(2) as ctx:
+            self.client.get(first['next'])
+        sql = ctx.captured_queries[-1]['sql']
+
+        assert 'COUNT' not in sql
+        assert 'OFFSET' not in sql
+
+    def test_reviews_ordered_by_created_at(self):
+        client_user = User.objects.create_user(username='clientuser', password='testpass123')
+        project = Project.objects.create(
+            name="Тестовый проект",
+            client_user=client_user,
+            deadline=date.today() + timedelta(days=30),
+            budget=50000.00,
+            status="Завершен"
+        )
+        reviews = [Review.objects.create(project=project, rating=5, feedback=f"Отзыв {i}") for i in range(3)]
+
+        r = self.client.get('/api/reviews/?page_size=2')
+        data = r.json()
+
+        assert [item['id'] for item in data['results']] == [reviews[0].id, reviews[1].id]
+        data = self.client.get(data['next']).json()
+        assert [item['id'] for item in data['results']] == [reviews[2].id]
+
+
+    def walk(self, url):
+        """Все страницы вперед, затем назад от последней; id в порядке выдачи"""
+        forward, pages = [], 0
+        data = self.client.get(url).json()
+        while True:
+            forward += [item['id'] for item in data['results']]
+            pages += 1
+            assert pages <= 50, "курсор зациклился"
+            if not data['next']:
+                break
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.client.get(data['next']).json()
+            assert 'OFFSET' not in ctx.captured_queries[-1]['sql']
+        backward = [item['id'] for item in data['results']]
+        while data['previous']:
+            data = self.client.get(data['previous']).json()
+            backward = [item['id'] for item in data['results']] + backward
+        return forward, backward
+
+    def test_tied_keys_past_offset_cutoff(self):
+        client_user = User.objects.create_user(username='clientuser', password='testpass123')
+        project = Project.objects.create(name="Проект", client_user=client_user, deadline=date.today(),
+                                         budget=1000, status="В работе")
+        Review.objects.bulk_create(Review(project=project, rating=5, feedback="Отзыв") for _ in range(1300))
+        Review.objects.bulk_create(Review(project=project, rating=3, feedback="Отзыв") for _ in range(5))
+        favour = Favour.objects.first()
+        ProjectService.objects.bulk_create(ProjectService(project=project, favour=favour) for _ in range(1100))
+
+        for url, expected in (
+            ('/api/reviews/?ordering=rating&page_size=100',
+             list(Review.objects.order_by('rating', 'id').values_list('id', flat=True))),
+            ('/api/reviews/?ordering=-rating&page_size=100',
+             list(Review.objects.order_by('-rating', '-id').values_list('id', flat=True))),
+            ('/api/project-services/?ordering=start_date&page_size=100',
+             list(ProjectService.objects.order_by('start_date', 'id').values_list('id', flat=True))),
+        ):
+            with self.subTest(url=url):
+                forward, backward = self.walk(url)
+                assert forward == expected
+                assert backward == expected
+
+    def test_invalid_cursor(self):
+        cursor = b64encode(b'p=not-json').decode()
+        assert self.client.get(f'/api/favours/?cursor={cursor}').status_code == 404
+
+class FilterIndexTestCase(TestCase):
+    """Фильтры админки и API идут по индексам, а не полным сканом"""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        assert f'USING INDEX {index_name}' in plan or f'USING COVERING INDEX {index_name}' in plan, plan
+
+    def test_project_filters(self):
+        self.assertUsesIndex(Project.objects.filter(status="В работе"), 'project_status_start_idx')
+        self.assertUsesIndex(
+            Project.objects.filter(status="В работе", start_date__gte=date.today()), 'project_status_start_idx')
+        self.assertUsesIndex(Project.objects.filter(start_date__gte=date.today()), 'project_start_date_idx')
+
+    def test_project_service_filters(self):
+        self.assertUsesIndex(ProjectService.objects.filter(status="completed"), 'service_status_start_idx')
+        self.assertUsesIndex(ProjectService.objects.filter(start_date__gte=date.today()), 'service_start_date_idx')
+        self.assertUsesIndex(
+            ProjectService.objects.filter(project_id=1, status="completed"), 'service_project_status_idx')
+
+    def test_review_filters(self):
+        self.assertUsesIndex(Review.objects.filter(rating=5), 'review_rating_created_idx')
+        self.assertUsesIndex(
+            Review.objects.filter(rating=5, created_at__gte=timezone.now()), 'review_rating_created_idx')
+        self.assertUsesIndex(Review.objects.filter(created_at__gte=timezone.now()), 'review_created_at_id_idx')
+
+
+class ProjectServiceBulkTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        self.client_user = User.objects.create_user(username='clientuser', password='testpass123')
+        Client.objects.create(user=self.client_user, sphere="IT", company_name="Test Client")
+        self.projects = [
+            Project.objects.create(
+                name=f"Проект {i}",
+                client_user=self.client_user,
+                deadline=date.today() + timedelta(days=30),
+                budget=50000.00,
+                status="В работе"
+            )
+            for i in range(3)
+        ]
+        self.favour = Favour.objects.create(name="Разработка сайта", price=50000.00, category="Разработка")
+        self.employee_user = User.objects.create_user(username='employeeuser', password='testpass123')
+        Employee.objects.create(user=self.employee_user, position="Разработчик", start_work_date=date.today())
+
+    def test_bulk_create(self):
+        items = [
+            {"project": project.id, "favour": self.favour.id, "employee_user": self.employee_user.id,
+             "status": "in_progress", "hours_spent": 5}
+            for project in self.projects * 10
+        ]
+
+        # FK проверяются одним запросом на модель, вставка - одним INSERT,
+        # статистика затронутых проектов пересчитывается пачкой, поисковый индекс - одним запросом
+        with self.assertNumQueries(23):
+            r = self.client.post('/api/project-services/bulk/', items, format='json')
+
+        assert r.status_code == 201
+        data = r.json()
+        assert len(data) == 30
+        assert ProjectService.objects.count() == 30
+        assert [item['project'] for item in data] == [item['project'] for item in items]
+        assert data[0]['project_name'] == "Проект 0"
+        assert data[0]['start_date'] == date.today().isoformat()
+
+    def test_bulk_update_and_create(self):
+        service = ProjectService.objects.create(project=self.projects[0], favour=self.favour)
+
+        r = self.client.post('/api/project-services/bulk/', [
+            {"id": service.id, "project": self.projects[0].id, "favour": self.favour.id,
+             "status": "completed", "hours_spent": 12},
+            {"project": self.projects[1].id, "favour": self.favour.id},
+        ], format='json')
+
+        assert r.status_code == 201
+        data = r.json()
+        assert data[0]['id'] == service.id
+        assert data[0]['status'] == "completed"
+        service.refresh_from_db()
+        assert service.status == "completed"
+        assert service.hours_spent == 12
+        assert ProjectService.objects.count() == 2
+
+    def test_bulk_rejects_unknown_foreign_keys(self):
+        r = self.client.post('/api/project-services/bulk/', [
+            {"project": self.projects[0].id, "favour": self.favour.id},
+            {"project": 999999, "favour": self.favour.id},
+        ], format='json')
+
+        assert r.status_code == 400
+        assert 'project' in r.json()[1]
+        assert ProjectService.objects.count() == 0
+
+    def test_bulk_rejects_duplicate_ids(self):
+        service = ProjectService.objects.create(project=self.projects[0], favour=self.favour, hours_spent=1)
+        r = self.client.post('/api/project-services/bulk/', [
+            {"id": service.id, "project": self.projects[0].id, "favour": self.favour.id, "hours_spent": 2},
+            {"project": self.projects[1].id, "favour": self.favour.id},
+            {"id": service.id, "project": self.projects[0].id, "favour": self.favour.id, "hours_spent": 3},
+        ], format='json')
+
+        assert r.status_code == 400
+        errors = r.json()
+        assert errors[0] == {} and errors[1] == {} and 'id' in errors[2]
+        service.refresh_from_db()
+        assert service.hours_spent == 1
+        assert ProjectService.objects.count() == 1
+
+    def test_bulk_rejects_unknown_ids(self):
+        r = self.client.post('/api/project-services/bulk/', [
+            {"id": 999999, "project": self.projects[0].id, "favour": self.favour.id},
+        ], format='json')
+
+        assert r.status_code == 400
+        assert ProjectService.objects.count() == 0
+
+
+class ProjectDashboardTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        self.client_user = User.objects.create_user(username='clientuser', password='testpass123')
+        Client.objects.create(user=self.client_user, sphere="IT", company_name="Test Client")
+        self.project = Project.objects.create(
+            name="Сайт",
+            client_user=self.client_user,
+            deadline=date.today() + timedelta(days=30),
+            budget=100000.00,
+            status="В работе"
+        )
+        self.empty_project = Project.objects.create(
+            name="Пустой",
+            client_user=self.client_user,
+            deadline=date.today() + timedelta(days=30),
+            budget=5000.00,
+            status="Планирование"
+        )
+        design = Favour.objects.create(name="Дизайн", price=20000.00, category="Дизайн")
+        development = Favour.objects.create(name="Разработка", price=50000.00, category="Разработка")
+        ProjectService.objects.create(project=self.project, favour=design, status="completed", hours_spent=10)
+        ProjectService.objects.create(project=self.project, favour=development, status="in_progress", hours_spent=5.5)
+        ProjectService.objects.create(project=self.project, favour=development, status="in_progress", hours_spent=2)
+        Review.objects.create(project=self.project, rating=5, feedback="Отлично")
+        Review.objects.create(project=self.project, rating=4, feedback="Хорошо")
+
+    def test_dashboard_aggregates(self):
+        r = self.client.get('/api/projects/dashboard/')
+
+        assert r.status_code == 200
+        data = {row['id']: row for row in r.json()['results']}
+
+        row = data[self.project.id]
+        assert row['total_hours'] == '17.50'
+        assert row['cost'] == '120000.00'
+        assert row['budget_left'] == '-20000.00'
+        assert row['services_total'] == 3
+        assert row['services'] == {'completed': 1, 'in_progress': 2}
+        assert row['reviews_count'] == 2
+        assert row['avg_rating'] == 4.5
+
+        empty = data[self.empty_project.id]
+        assert empty['total_hours'] == '0.00'
+        assert empty['cost'] == '0.00'
+        assert empty['services'] == {}
+        assert empty['reviews_count'] == 0
+        assert empty['avg_rating'] is None
+
+    def test_dashboard_without_stats_row(self):
+        # Строки статистики нет, например после bulk_create без сигналов
+        ProjectStats.objects.filter(project=self.empty_project).delete()
+
+        r = self.client.get('/api/projects/dashboard/')
+
+        empty = {row['id']: row for row in r.json()['results']}[self.empty_project.id]
+        assert empty['cost'] == '0.00'
+        assert empty['budget_left'] == '5000.00'
+        assert empty['total_hours'] == '0.00'
+        assert empty['services_total'] == 0
+        assert empty['services'] == {}
+        assert empty['reviews_count'] == 0
+        assert empty['avg_rating'] is None
+
+    def test_dashboard_query_count_does_not_grow(self):
+        favour = Favour.objects.first()
+        ProjectService.objects.bulk_create([
+            ProjectService(project=self.empty_project, favour=favour, status=f"status {i % 3}")
+            for i in range(50)
+        ])
+
+        # Список статусов и сама сводка
+        with self.assertNumQueries(2):
+            self.client.get('/api/projects/dashboard/')
+
+
+class ProjectStatsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        self.client_user = User.objects.create_user(username='clientuser', password='testpass123')
+        Client.objects.create(user=self.client_user, sphere="IT", company_name="Test Client")
+        self.project = Project.objects.create(
+            name="Сайт",
+            client_user=self.client_user,
+            deadline=date.today() + timedelta(days=30),
+            budget=100000.00,
+            status="В работе"
+        )
+        self.other_project = Project.objects.create(
+            name="Приложение",
+            client_user=self.client_user,
+            deadline=date.today() + timedelta(days=30),
+            budget=50000.00,
+            status="В работе"
+        )
+        self.design = Favour.objects.create(name="Дизайн", price=20000.00, category="Дизайн")
+        self.development = Favour.objects.create(name="Разработка", price=50000.00, category="Разработка")
+
+    def assertNoDrift(self):
+        assert find_stats_drift() == {}
+
+    def stats(self, project=None):
+        return ProjectStats.objects.get(project=project or self.project)
+
+    def test_service_changes_update_stats(self):
+        service = ProjectService.objects.create(
+            project=self.project, favour=self.design, status="in_progress", hours_spent=4)
+        ProjectService.objects.create(project=self.project, favour=self.development, hours_spent=1.5)
+        self.assertNoDrift()
+        stats = self.stats()
+        assert stats.total_hours == 5.5
+        assert stats.cost == 70000
+        assert stats.services_total == 2
+
+        service.status = "completed"
+        service.hours_spent = 10
+        service.favour = self.development
+        service.save()
+        self.assertNoDrift()
+        assert self.stats().cost == 100000
+
+        service.project = self.other_project
+        service.save()
+        self.assertNoDrift()
+
+        service.delete()
+        self.assertNoDrift()
+        assert self.stats(self.other_project).services_total == 0
+
+    def test_review_changes_update_stats(self):
+        review = Review.objects.create(project=self.project, rating=5, feedback="Отлично")
+        Review.objects.create(project=self.project, rating=3, feedback="Нормально")
+        assert self.stats().avg_rating == 4
+        self.assertNoDrift()
+
+        review.rating = 4
+        review.save()
+        self.assertNoDrift()
+
+        review.project = self.other_project
+        review.save()
+        self.assertNoDrift()
+
+        review.delete()
+        self.assertNoDrift()
+
+    def test_favour_price_change_updates_cost(self):
+        ProjectService.objects.create(project=self.project, favour=self.design)
+        ProjectService.objects.create(project=self.project, favour=self.design)
+
+        self.design.price = 25000
+        self.design.save()
+
+        assert self.stats().cost == 50000
+        self.assertNoDrift()
+
+        self.design.delete()
+        assert self.stats().cost == 0
+        self.assertNoDrift()
+
+    def test_project_delete_cascades(self):
+        ProjectService.objects.create(project=self.project, favour=self.design)
+        Review.objects.create(project=self.project, rating=5, feedback="Отлично")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.delete()
+
+        self.assertNoDrift()
+
+    def test_missing_stats_are_rebuilt(self):
+        ProjectService.objects.create(project=self.project, favour=self.design, hours_spent=3)
+        ProjectStats.objects.filter(project=self.project).delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProjectService.objects.create(project=self.project, favour=self.design, hours_spent=2)
+
+        assert self.stats().total_hours == 5
+        self.assertNoDrift()
+
+    def test_bulk_endpoint_updates_stats(self):
+        self.client.post('/api/project-services/bulk/', [
+            {"project": self.project.id, "favour": self.design.id, "hours_spent": 2},
+            {"project": self.other_project.id, "favour": self.development.id, "status": "completed"},
+        ], format='json')
+
+        self.assertNoDrift()
+        assert self.stats().total_hours == 2
+
+    def test_project_list_includes_stats(self):
+        ProjectService.objects.create(project=self.project, favour=self.design, hours_spent=3)
+
+        with self.assertNumQueries(2):
+            r = self.client.get('/api/projects/')
+        data = {row['id']: row for row in r.json()['results']}
+
+        assert data[self.project.id]['stats']['total_hours'] == '3.00'
+        assert data[self.project.id]['stats']['services_total'] == 1
+
+    def test_command_checks_and_rebuilds(self):
+        ProjectService.objects.create(project=self.project, favour=self.design, hours_spent=3)
+        ProjectStats.objects.filter(project=self.project).update(total_hours=100)
+
+        with self.assertRaises(CommandError):
+            call_command('project_stats', '--check', stdout=StringIO())
+
+        call_command('project_stats', stdout=StringIO())
+        call_command('project_stats', '--check', stdout=StringIO())
+        assert self.stats().total_hours == 3
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        self.favour = Favour.objects.create(name="Дизайн", price=20000.00, category="Дизайн")
+
+    def test_list_not_modified(self):
+        r = self.client.get('/api/employees/')
+        etag = r['ETag']
+        assert etag.startswith('W/"')
+
+        # Только чтение версий таблиц, без запроса к сотрудникам и сериализации
+        with self.assertNumQueries(1):
+            r = self.client.get('/api/employees/', HTTP_IF_NONE_MATCH=etag)
+        assert r.status_code == 304
+        assert r['ETag'] == etag
+
+    def test_list_etag_changes_on_write(self):
+        etag = self.client.get('/api/favours/')['ETag']
+
+        self.client.patch(f'/api/favours/{self.favour.id}/', {"price": 25000}, format='json')
+
+        r = self.client.get('/api/favours/', HTTP_IF_NONE_MATCH=etag)
+        assert r.status_code == 200
+        assert r['ETag'] != etag
+
+        etag = r['ETag']
+        self.favour.delete()
+        assert self.client.get('/api/favours/', HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    def test_detail_not_modified(self):
+        r = self.client.get(f'/api/favours/{self.favour.id}/')
+        etag = r['ETag']
+
+        assert self.client.get(f'/api/favours/{self.favour.id}/', HTTP_IF_NONE_MATCH=etag).status_code == 304
+        other = Favour.objects.create(name="SEO", price=100, category="Маркетинг")
+        assert self.client.get(f'/api/favours/{other.id}/')['ETag'] != etag
+
+    def test_etag_tracks_related_tables(self):
+        client_user = User.objects.create_user(username='clientuser', password='testpass123')
+        Client.objects.create(user=client_user, sphere="IT", company_name="Test Client")
+        etag = self.client.get('/api/clients/')['ETag']
+
+        client_user.userprofile.fio = "Иванов Иван"
+        client_user.userprofile.save()
+
+        r = self.client.get('/api/clients/', HTTP_IF_NONE_MATCH=etag)
+        assert r.status_code == 200
+        assert r.json()['results'][0]['user_profile'] == {'fio': "Иванов Иван"}
+
+    def test_project_etag_follows_stats(self):
+        client_user = User.objects.create_user(username='clientuser', password='testpass123')
+        project = Project.objects.create(
+            name="Сайт",
+            client_user=client_user,
+            deadline=date.today() + timedelta(days=30),
+            budget=100000.00,
+            status="В работе"
+        )
+        etag = self.client.get('/api/projects/')['ETag']
+
+        ProjectService.objects.create(project=project, favour=self.favour, hours_spent=3)
+
+        assert self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+class FavourResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        self.favour = Favour.objects.create(name="Дизайн", price=20000.00, category="Дизайн")
+
+    def test_list_served_from_cache(self):
+        self.client.get('/api/favours/')
+
+        with self.assertNumQueries(0):
+            r = self.client.get('/api/favours/')
+        assert r.status_code == 200
+        assert r.json()['results'][0]['name'] == "Дизайн"
+
+        with self.assertNumQueries(0):
+            r = self.client.get('/api/favours/', HTTP_IF_NONE_MATCH=r['ETag'])
+        assert r.status_code == 304
+
+        assert self.client.get('/api/favours/cache-stats/').json() == {'hits': 2, 'misses': 1}
+
+    def test_retrieve_served_from_cache(self):
+        self.client.get(f'/api/favours/{self.favour.id}/')
+
+        with self.assertNumQueries(0):
+            r = self.client.get(f'/api/favours/{self.favour.id}/')
+        assert r.json()['name'] == "Дизайн"
+
+    def test_query_string_is_part_of_key(self):
+        Favour.objects.create(name="SEO", price=100, category="Маркетинг")
+        assert len(self.client.get('/api/favours/').json()['results']) == 2
+        assert len(self.client.get('/api/favours/?page_size=1').json()['results']) == 1
+
+    def test_writes_invalidate_cache(self):
+        self.client.get('/api/favours/')
+
+        self.client.patch(f'/api/favours/{self.favour.id}/', {"name": "Брендинг"}, format='json')
+        assert self.client.get('/api/favours/').json()['results'][0]['name'] == "Брендинг"
+
+        self.client.post('/api/favours/', {"name": "SEO", "price": 100, "category": "Маркетинг"}, format='json')
+        assert len(self.client.get('/api/favours/').json()['results']) == 2
+
+        Favour.objects.filter(name="SEO").delete()
+        assert len(self.client.get('/api/favours/').json()['results']) == 1
+
+    def test_invalidated_again_after_commit(self):
+        self.client.get('/api/favours/')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.favour.name = "Брендинг"
+            self.favour.save()
+        assert callbacks
+
+
+class UserDirectoryTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.anna = User.objects.create_user(username='anna', email='anna@example.com', password='testpass123')
+        self.anna.userprofile.fio = 'Смирнова Анна'
+        self.anna.userprofile.save()
+        self.boris = User.objects.create_user(username='boris', email='b@example.com', password='testpass123')
+        self.boris.userprofile.delete()
+
+    def get_rows(self, url):
+        r = self.client.get(url)
+        assert r.status_code == 200
+        assert r.streaming
+        return json.loads(b''.join(r.streaming_content))
+
+    def test_directory(self):
+        with self.assertNumQueries(1):
+            rows = self.get_rows('/api/user-directory/')
+        assert rows == [
+            {'id': self.anna.id, 'username': 'anna', 'email': 'anna@example.com',
+             'userprofile': {'fio': 'Смирнова Анна'}},
+            {'id': self.boris.id, 'username': 'boris', 'email': 'b@example.com', 'userprofile': None},
+        ]
+
+    def test_prefix_search(self):
+        assert [row['username'] for row in self.get_rows('/api/user-directory/?q=bor')] == ['boris']
+        assert [row['username'] for row in self.get_rows('/api/user-directory/?q=Смир')] == ['anna']
+        assert self.get_rows('/api/user-directory/?q=nna') == []
+
+    def test_streams_in_chunks(self):
+        User.objects.bulk_create([User(username=f'user{i:03}') for i in range(25)])
+        with patch('clients.views.USER_DIRECTORY_CHUNK_SIZE', 10):
+            r = self.client.get('/api/user-directory/')
+            chunks = list(r.streaming_content)
+        assert len(chunks) > 1
+        assert len(json.loads(b''.join(chunks))) == 27
+
+    def test_users_route_not_shadowed(self):
+        r = self.client.get('/api/users/')
+        assert 'results' in r.json()
+
+
+class SparseFieldsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        self.favour = Favour.objects.create(name="Разработка", price=1000, category="Разработка")
+        self.project = Project.objects.create(
+            name="Сайт",
+            client_user=self.user,
+            deadline=date.today() + timedelta(days=30),
+            budget=10000,
+            status="В работе",
+            description="Длинное описание",
+        )
+        ProjectService.objects.create(project=self.project, favour=self.favour, notes="Длинные заметки")
+
+    def get_with_sql(self, url):
+        with CaptureQueriesContext(connection) as context:
+            r = self.client.get(url)
+        assert r.status_code == 200
+        return r.json()['results'], context.captured_queries[-1]['sql']
+
+    def test_fields_narrow_output_and_columns(self):
+        rows, sql = self.get_with_sql('/api/projects/?fields=id,name')
+        assert rows == [{'id': self.project.id, 'name': "Сайт"}]
+        assert '"description"' not in sql
+        assert 'clients_projectstats' not in sql
+
+    def test_omit(self):
+        rows, sql = self.get_with_sql('/api/project-services/?omit=notes')
+        assert 'notes' not in rows[0]
+        assert rows[0]['project_name'] == "Сайт"
+        assert '"notes"' not in sql
+
+    def test_foreign_key_without_join(self):
+        rows, sql = self.get_with_sql('/api/project-services/?fields=id,project')
+        assert rows == [{'id': rows[0]['id'], 'project': self.project.id}]
+        assert 'JOIN' not in sql
+
+    def test_nested_relation_kept(self):
+        rows, sql = self.get_with_sql('/api/projects/?fields=id,stats')
+        assert rows[0]['stats']['services_total'] == 1
+        assert '"description"' not in sql
+
+    def test_method_field_paths(self):
+        Client.objects.create(user=self.user, sphere="IT")
+        rows, sql = self.get_with_sql('/api/clients/?fields=user_profile')
+        assert rows == [{'user_profile': {'fio': None}}]
+        assert 'general_userprofile' in sql
+
+    def test_unknown_field(self):
+        r = self.client.get('/api/projects/?fields=id,secret')
+        assert r.status_code == 400
+        assert 'secret' in r.json()['fields'][0]
+
+    def test_retrieve(self):
+        r = self.client.get(f'/api/favours/{self.favour.id}/?fields=name')
+        assert r.json() == {'name': "Разработка"}
+
+    def test_writes_ignore_selection(self):
+        r = self.client.patch(f'/api/projects/{self.project.id}/?fields=id', {"name": "Портал"}, format='json')
+        assert r.status_code == 200
+        assert r.json()['name'] == "Портал"
+
+
+class ValuesListTestCase(TestCase):
+    """Списки из плана чтения совпадают с выводом сериализаторов байт в байт"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        favour = Favour.objects.create(name="Разработка", price=1000.5, category="Разработка", description="Код")
+        employee_user = User.objects.create_user(username='employee', email='e@example.com', password='testpass123')
+        employee_user.userprofile.fio = 'Иванов Иван'
+        employee_user.userprofile.save()
+        Employee.objects.create(user=employee_user, position="Разработчик", start_work_date=date.today(),
+                                picture='clients/photo.png')
+        no_profile = User.objects.create_user(username='noprofile', password='testpass123')
+        no_profile.userprofile.delete()
+        Client.objects.create(user=employee_user, sphere="IT", company_name="Компания", picture='clients/logo.png')
+        Client.objects.create(user=no_profile, sphere="Маркетинг")
+        Client.objects.create(user=None, sphere="Торговля")
+
+        for i in range(3):
+            project = Project.objects.create(
+                name=f"Проект {i}",
+                client_user=employee_user,
+                deadline=date.today() + timedelta(days=i),
+                budget=10000.25,
+                status="В работе",
+                description="Описание",
+            )
+            ProjectService.objects.create(project=project, favour=favour, employee_user=employee_user,
+                                          hours_spent=1.5, notes="Заметки")
+            ProjectService.objects.create(project=project, favour=favour, employee_user=None)
+            Review.objects.create(project=project, rating=i + 3, feedback="Хорошо", picture='clients/review.png')
+        Project.objects.filter(name="Проект 2").first().stats.delete()
+
+    def get_both(self, url):
+        with patch('clients.api.ValuesListMixin.values_list', False):
+            expected = self.client.get(url)
+        actual = self.client.get(url)
+        assert actual.status_code == expected.status_code == 200
+        return actual, expected
+
+    def test_same_output(self):
+        for url in ['/api/clients/', '/api/projects/', '/api/favours/', '/api/employees/',
+                    '/api/project-services/', '/api/reviews/', '/api/users/']:
+            with self.subTest(url):
+                actual, expected = self.get_both(url)
+                assert actual.content == expected.content
+
+    def test_same_pages_and_fields(self):
+        for url in ['/api/project-services/?page_size=2', '/api/reviews/?page_size=2',
+                    '/api/projects/?fields=id,stats', '/api/clients/?omit=user_profile,picture',
+                    '/api/project-services/?fields=id,employee_username']:
+            with self.subTest(url):
+                actual, expected = self.get_both(url)
+                assert actual.content == expected.content
+                while actual.json()['next']:
+                    actual, expected = self.get_both(actual.json()['next'])
+                    assert actual.content == expected.content
+
+    def test_reads_values(self):
+        with CaptureQueriesContext(connection) as context:
+            r = self.client.get('/api/project-services/')
+        assert r.status_code == 200
+        sql = context.captured_queries[-1]['sql']
+        assert '"clients_project"."name"' in sql
+        assert '"clients_project"."description"' not in sql
+
+    def test_plan_cached_per_class(self):
+        for prefix, viewset, basename in router.registry:
+            if getattr(viewset, 'values_list', False):
+                assert read_plan(viewset.serializer_class) is not None, prefix
+        assert read_plan(ProjectServiceSerializer) is read_plan(ProjectServiceSerializer)
+        assert read_plan(ProjectServiceSerializer, ['id']) is not read_plan(ProjectServiceSerializer)
+        assert read_plan(ReviewSerializer).paths == (
+            'id', 'project_id', 'rating', 'feedback', 'created_at', 'picture', 'picture_thumbnail')
+
+
+class ReviewClientFieldsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(
+            username='clientuser', email='client@example.com', password='testpass123')
+        self.client_user.userprofile.fio = 'Петров Петр'
+        self.client_user.userprofile.save()
+        self.project = Project.objects.create(
+            name="Портал",
+            client_user=self.client_user,
+            deadline=date.today() + timedelta(days=30),
+            budget=50000.00,
+            status="Завершен"
+        )
+        for i in range(3):
+            Review.objects.create(project=self.project, rating=5, feedback=f"Отзыв {i}")
+
+    def test_list_resolves_names_in_one_query(self):
+        with CaptureQueriesContext(connection) as context:
+            r = self.client.get('/api/reviews/')
+        # Версии таблиц для ETag и сами отзывы
+        assert len(context.captured_queries) == 2
+        for item in r.json()['results']:
+            assert item['project_name'] == "Портал"
+            assert item['client_name'] == 'Петров Петр'
+            assert item['client_email'] == 'client@example.com'
+
+    def test_client_name_falls_back_to_username(self):
+        self.client_user.userprofile.delete()
+        review = Review.objects.first()
+        r = self.client.get(f'/api/reviews/{review.id}/')
+        assert r.json()['client_name'] == 'clientuser'
+
+    def test_etag_follows_client_changes(self):
+        etag = self.client.get('/api/reviews/')['ETag']
+        self.client_user.email = 'new@example.com'
+        self.client_user.save()
+        r = self.client.get('/api/reviews/', HTTP_IF_NONE_MATCH=etag)
+        assert r.status_code == 200
+        assert r.json()['results'][0]['client_email'] == 'new@example.com'
+
+    def test_write_responses_include_names(self):
+        other_user = User.objects.create_user(username='other', email='other@example.com', password='x')
+        Client.objects.create(user=other_user, sphere="IT")
+        other = Project.objects.create(name="Магазин", client_user=other_user, deadline=date.today(),
+                                       budget=1000, status="В работе")
+
+        r = self.client.post('/api/reviews/', {'project': self.project.id, 'rating': 4, 'feedback': "Новый"},
+                             format='json')
+        assert r.status_code == 201
+        assert r.json()['project_name'] == "Портал"
+        assert r.json()['client_name'] == 'Петров Петр'
+        assert r.json()['client_email'] == 'client@example.com'
+
+        r = self.client.patch(f"/api/reviews/{r.json()['id']}/", {'project': other.id}, format='json')
+        assert r.status_code == 200
+        assert r.json()['project'] == other.id
+        assert r.json()['project_name'] == "Магазин"
+        assert r.json()['client_name'] == 'other'
+        assert r.json()['client_email'] == 'other@example.com'
+
+
+class ResourceFilterTestCase(TestCase):
+    """Фильтры и сортировка API сужают выборку в базе и идут по индексам"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(username='clientuser', password='testpass123')
+        self.employee_user = User.objects.create_user(username='employee', password='testpass123')
+        self.design = Favour.objects.create(name="Макет", price=500, category="Дизайн")
+        self.code = Favour.objects.create(name="Разработка", price=1000, category="Разработка")
+        self.projects = [
+            Project.objects.create(
+                name=f"Проект {i}",
+                client_user=self.client_user if i % 2 else self.employee_user,
+                deadline=date(2030, 1, 1) + timedelta(days=i * 10),
+                budget=10000,
+                status=("В работе", "Завершен")[i % 2],
+            )
+            for i in range(4)
+        ]
+        for i, project in enumerate(self.projects):
+            ProjectService.objects.create(
+                project=project, favour=self.code, status=('in_progress', 'completed')[i % 2],
+                employee_user=self.employee_user if i < 2 else None)
+            Review.objects.create(project=project, rating=i + 2, feedback="Отзыв")
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            r = self.client.get(url)
+        assert r.status_code == 200, r.content
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + context.captured_queries[-1]['sql'])
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        return [item['id'] for item in r.json()['results']], plan
+
+    def assertIndexed(self, plan, index_name):
+        assert f'USING INDEX {index_name}' in plan or f'USING COVERING INDEX {index_name}' in plan, plan
+
+    def test_project_filters(self):
+        ids, plan = self.get('/api/projects/?status=Завершен')
+        assert ids == [self.projects[1].id, self.projects[3].id]
+        self.assertIndexed(plan, 'project_status_start_idx')
+
+        ids, plan = self.get(f'/api/projects/?client_user={self.client_user.id}')
+        assert ids == [self.projects[1].id, self.projects[3].id]
+        self.assertIndexed(plan, 'clients_project_client_user_id')
+
+        ids, plan = self.get('/api/projects/?deadline_from=2030-01-11&deadline_to=2030-01-21')
+        assert ids == [self.projects[1].id, self.projects[2].id]
+        self.assertIndexed(plan, 'project_deadline_idx')
+
+    def test_project_service_filters(self):
+        ids, plan = self.get('/api/project-services/?status=completed')
+        assert len(ids) == 2
+        self.assertIndexed(plan, 'service_status_start_idx')
+
+        ids, plan = self.get(f'/api/project-services/?project={self.projects[0].id}')
+        assert len(ids) == 1
+        self.assertIndexed(plan, 'clients_projectservice_project_id')
+
+        ids, plan = self.get(f'/api/project-services/?employee_user={self.employee_user.id}')
+        assert len(ids) == 2
+        self.assertIndexed(plan, 'clients_projectservice_employee_user_id')
+
+    def test_favour_and_review_filters(self):
+        ids, plan = self.get('/api/favours/?category=Дизайн')
+        assert ids == [self.design.id]
+        self.assertIndexed(plan, 'favour_category_idx')
+
+        ids, plan = self.get('/api/reviews/?rating=3')
+        assert len(ids) == 1
+        self.assertIndexed(plan, 'review_rating_created_idx')
+
+        since = (timezone.now() - timedelta(hours=1)).isoformat()
+        ids, plan = self.get(f'/api/reviews/?created_from={since.replace("+", "%2B")}')
+        assert len(ids) == 4
+        self.assertIndexed(plan, 'review_created_at_id_idx')
+
+    def test_ordering(self):
+        ids, plan = self.get('/api/projects/?ordering=-deadline')
+        assert ids == [project.id for project in reversed(self.projects)]
+        self.assertIndexed(plan, 'project_deadline_idx')
+
+        ids, plan = self.get('/api/reviews/?ordering=-rating&page_size=2')
+        assert len(ids) == 2
+
+    def test_ordering_follows_cursor(self):
+        r = self.client.get('/api/projects/?ordering=-deadline&page_size=3')
+        data = r.json()
+        ids = [item['id'] for item in data['results']]
+        ids += [item['id'] for item in self.client.get(data['next']).json()['results']]
+        assert ids == [project.id for project in reversed(self.projects)]
+
+    def test_invalid_parameters(self):
+        r = self.client.get('/api/projects/?ordering=budget')
+        assert r.status_code == 400
+        assert 'budget' in r.json()['ordering'][0]
+
+        r = self.client.get('/api/projects/?deadline_from=завтра')
+        assert r.status_code == 400
+        assert 'deadline_from' in r.json()
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(username='clientuser', password='testpass123')
+        self.client_user.userprofile.fio = 'Соколова Мария'
+        self.client_user.userprofile.save()
+        self.favour = Favour.objects.create(name="Верстка", price=1000, category="Разработка",
+                                            description="Адаптивная верстка лендинга")
+        self.project = Project.objects.create(
+            name="Лендинг для пекарни",
+            client_user=self.client_user,
+            deadline=date.today() + timedelta(days=30),
+            budget=10000,
+            status="В работе",
+            description="Сайт с меню и доставкой",
+        )
+        self.service = ProjectService.objects.create(project=self.project, favour=self.favour,
+                                                     notes="Согласовать макет меню")
+        self.review = Review.objects.create(project=self.project, rating=5, feedback="Доставка работает отлично")
+
+    def search(self, url):
+        r = self.client.get(url)
+        assert r.status_code == 200, r.content
+        return [(item['kind'], item['id']) for item in r.json()]
+
+    def test_ranked_search(self):
+        # Совпадение в названии выше совпадения в тексте
+        assert self.search('/api/search/?q=лендинг') == [('project', self.project.id), ('favour', self.favour.id)]
+        assert set(self.search('/api/search/?q=меню')) == {('project', self.project.id), ('service', self.service.id)}
+        assert self.search('/api/search/?q=Соколов') == [('user', self.client_user.id)]
+        assert self.search('/api/search/?q=доставк отлично') == [('review', self.review.id)]
+
+    def test_kind_and_limit(self):
+        assert self.search('/api/search/?q=меню&kind=service') == [('service', self.service.id)]
+        assert len(self.search('/api/search/?q=меню&limit=1')) == 1
+        assert self.search('/api/search/?q=') == []
+        assert self.client.get('/api/search/?q=меню&kind=secret').status_code == 400
+
+    def test_index_follows_changes(self):
+        self.project.name = "Портал"
+        self.project.save()
+        assert ('project', self.project.id) not in self.search('/api/search/?q=пекарни')
+        assert self.search('/api/search/?q=портал') == [('project', self.project.id)]
+
+        self.review.delete()
+        assert self.search('/api/search/?q=отлично') == []
+
+        ProjectService.objects.filter(pk=self.service.pk).update(notes="Другое")
+        r = self.client.post('/api/project-services/bulk/', [
+            {'id': self.service.id, 'project': self.project.id, 'favour': self.favour.id, 'notes': "Фотосъемка"},
+        ], format='json')
+        assert r.status_code == 201
+        assert self.search('/api/search/?q=фотосъемка') == [('service', self.service.id)]
+
+    def test_cascade_removes_documents(self):
+        self.client_user.delete()
+        for query in ['пекарни', 'меню', 'отлично', 'Соколова']:
+            assert self.search(f'/api/search/?q={query}') == []
+        assert self.search('/api/search/?q=верстка') == [('favour', self.favour.id)]
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        assert self.search('/api/search/?q=меню') == []
+
+        call_command('search_index', stdout=StringIO())
+        assert len(self.search('/api/search/?q=меню')) == 2
+
+    def test_admin_search(self):
+        admin_user = User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.force_login(admin_user)
+        other = Project.objects.create(name="Другой", client_user=admin_user, deadline=date.today(),
+                                       budget=1, status="В работе")
+
+        r = self.client.get('/admin/clients/project/?q=Соколова')
+        assert list(r.context['cl'].result_list) == [self.project]
+        r = self.client.get('/admin/clients/project/?q=admin')
+        assert list(r.context['cl'].result_list) == [other]
+        r = self.client.get('/admin/clients/review/?q=пекарни')
+        assert list(r.context['cl'].result_list) == [self.review]
+        r = self.client.get('/admin/clients/projectservice/?q=!!!')
+        assert list(r.context['cl'].result_list) == []
+
+
+class MediaFixtureMixin:
+    """Временный MEDIA_ROOT на каждый тест и загружаемые PNG"""
+    media_settings = {'THUMBNAIL_WORKERS': 0}
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, **self.media_settings)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def image(self, name='photo.png', size=(800, 600), mode='RGB', color='red'):
+        data = BytesIO()
+        Image.new(mode, size, color).save(data, 'PNG')
+        return SimpleUploadedFile(name, data.getvalue(), content_type='image/png')
+
+
+class ThumbnailTestCase(MediaFixtureMixin, TestCase):
+    media_settings = {'THUMBNAIL_WORKERS': 0, 'THUMBNAIL_SIZE': 64}
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='employee', password='testpass123')
+
+    def create_employee(self, picture):
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post('/api/employees/', {
+                'user': self.user.id, 'position': "Дизайнер", 'start_work_date': date.today().isoformat(),
+                'picture': picture,
+            }, format='multipart')
+        assert r.status_code == 201, r.content
+        return Employee.objects.get(pk=r.json()['id'])
+
+    def test_thumbnail_built_after_upload(self):
+        employee = self.create_employee(self.image())
+        assert employee.picture_thumbnail.name == employee.picture.name.rsplit('.', 1)[0] + '_thumb64.webp'
+        with Image.open(employee.picture_thumbnail.path) as thumbnail:
+            assert thumbnail.size == (64, 48)
+
+        item = self.client.get('/api/employees/').json()['results'][0]
+        assert item['picture_thumbnail'].endswith(employee.picture_thumbnail.url)
+        assert item['picture'].endswith(employee.picture.url)
+
+    def test_replace_and_clear_picture(self):
+        employee = self.create_employee(self.image(mode='RGBA'))
+        old_thumbnail = employee.picture_thumbnail.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.patch(f'/api/employees/{employee.id}/', {'picture': self.image('new.png')},
+                                  format='multipart')
+        assert r.status_code == 200
+        employee.refresh_from_db()
+        assert employee.picture_thumbnail.name not in ('', old_thumbnail)
+        assert employee.picture_thumbnail.name == employee.picture.name.rsplit('.', 1)[0] + '_thumb64.webp'
+
+        employee.picture = None
+        employee.save()
+        employee.refresh_from_db()
+        assert not employee.picture_thumbnail
+
+    def test_built_in_worker_pool(self):
+        with override_settings(THUMBNAIL_WORKERS=2), patch('clients.thumbnails.get_executor') as get_executor:
+            employee = self.create_employee(self.image())
+        get_executor.return_value.submit.assert_called_once()
+        assert not employee.picture_thumbnail
+
+    def test_command_builds_missing(self):
+        employee = self.create_employee(self.image())
+        Employee.objects.filter(pk=employee.pk).update(picture_thumbnail='')
+        call_command('thumbnails', stdout=StringIO())
+        employee.refresh_from_db()
+        assert employee.picture_thumbnail
+
+
+class ContentHashStorageTestCase(MediaFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='client', password='testpass123')
+
+    def create_client(self, picture):
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post('/api/clients/', {'sphere': "IT", 'picture': picture}, format='multipart')
+        assert r.status_code == 201, r.content
+        return Client.objects.get(pk=r.json()['id'])
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, dirs, names in os.walk(self.media_root) for name in names
+        )
+
+    def test_identical_uploads_share_file(self):
+        upload = self.image('Logo.PNG')
+        digest = hashlib.sha256(upload.read()).hexdigest()
+        upload.seek(0)
+
+        first = self.create_client(upload)
+        second = self.create_client(self.image('copy.png'))
+        other = self.create_client(self.image('logo.png', color='blue'))
+
+        assert first.picture.name == f'clients/{digest[:2]}/{digest}.png'
+        assert second.picture.name == first.picture.name
+        assert second.picture_thumbnail.name == first.picture_thumbnail.name
+        assert other.picture.name != first.picture.name
+        assert len(self.stored_files()) == 4, self.stored_files()
+
+    def test_media_immutable_cache_headers(self):
+        def get(name):
+            return media_view(RequestFactory().get('/media/' + name), name)
+
+        picture = self.create_client(self.image('logo.png')).picture
+        r = get(picture.name)
+        assert r.status_code == 200
+        assert r['Cache-Control'] == 'public, max-age=31536000, immutable'
+        assert b''.join(r.streaming_content) == picture.read()
+
+        legacy = default_storage.save('clients/legacy.png', ContentFile(b'old'))
+        r = get(legacy)
+        assert r.status_code == 200
+        assert 'Cache-Control' not in r
+
+    def test_media_served_by_django_only_in_debug(self):
+        def media_route(debug):
+            # Маршруты собираются при импорте app.urls, поэтому модуль перечитывается с нужным DEBUG
+            with override_settings(DEBUG=debug):
+                importlib.reload(app_urls)
+            clear_url_caches()
+            try:
+                return resolve('/media/clients/logo.png').func
+            except Resolver404:
+                return None
+            finally:
+                importlib.reload(app_urls)
+                clear_url_caches()
+
+        # В продакшене /media/ отдает веб-сервер
+        assert media_route(debug=False) is None
+        assert media_route(debug=True) is media_view
+
+    def test_thumbnail_size_in_name(self):
+        client = self.create_client(self.image('logo.png'))
+        old_thumbnail = client.picture_thumbnail.name
+        assert old_thumbnail.endswith('_thumb128.webp') and is_content_addressed(old_thumbnail)
+
+        with override_settings(THUMBNAIL_SIZE=16):
+            call_command('thumbnails', stdout=StringIO())
+            client.refresh_from_db()
+            assert client.picture_thumbnail.name == old_thumbnail.replace('_thumb128', '_thumb16')
+            with Image.open(client.picture_thumbnail.path) as thumbnail:
+                assert max(thumbnail.size) == 16
+            assert not is_content_addressed(client.picture.name.replace('.png', '_thumb.webp'))
+
+
+class AsyncReadTestCase(TestCase):
+    """Асинхронные list/retrieve отдают то же, что синхронные вьюсеты"""
+    setUp = ValuesListTestCase.setUp
+
+    urls = ['clients/', 'projects/', 'favours/', 'employees/', 'project-services/', 'reviews/', 'users/',
+            'project-services/?page_size=2', 'reviews/?page_size=2&ordering=-rating', 'projects/?fields=id,stats',
+            'clients/?omit=user_profile,picture', 'projects/?status=В работе']
+
+    async def get_both(self, url):
+        expected = await sync_to_async(self.client.get)(f'/api/{url}')
+        actual = await AsyncClient().get(f'/api/async/{url}')
+        return actual, expected
+
+    async def test_same_output(self):
+        for url in self.urls:
+            with self.subTest(url):
+                actual, expected = await self.get_both(url)
+                assert actual.status_code == expected.status_code == 200
+                assert actual.content.replace(b'/api/async/', b'/api/') == expected.content
+                assert actual['ETag'] == expected['ETag']
+
+    async def test_retrieve_and_errors(self):
+        review = await Review.objects.afirst()
+        for url in [f'reviews/{review.pk}/', f'projects/{review.project_id}/', 'projects/999999/', 'projects/abc/',
+                    'projects/?deadline_from=завтра', 'projects/?ordering=budget']:
+            with self.subTest(url):
+                actual, expected = await self.get_both(url)
+                assert actual.status_code == expected.status_code
+                assert actual.json() == expected.json()
+
+    async def test_pages_follow_async_links(self):
+        client, ids = AsyncClient(), []
+        url = '/api/async/project-services/?page_size=4'
+        while url:
+            page = (await client.get(url)).json()
+            ids.extend(item['id'] for item in page['results'])
+            url = page['next']
+            assert url is None or '/api/async/project-services/' in url
+        assert ids == [service.id async for service in ProjectService.objects.order_by('id')]
+
+    async def test_not_modified_and_methods(self):
+        client = AsyncClient()
+        response = await client.get('/api/async/reviews/')
+        response = await client.get('/api/async/reviews/', headers={'If-None-Match': response['ETag']})
+        assert response.status_code == 304
+        assert (await client.post('/api/async/reviews/', {})).status_code == 405
+
+    def test_query_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = async_to_sync(AsyncClient().get)('/api/async/project-services/')
+        assert response.status_code == 200
+        # Версии таблиц для ETag и сама страница
+        assert len(ctx.captured_queries) == 2
+
+    async def test_falls_back_to_sync_view(self):
+        with patch('clients.api.ValuesListMixin.values_list', False):
+            actual, expected = await self.get_both('project-services/?page_size=2')
+        assert actual.status_code == 200
+        assert actual.content.replace(b'/api/async/', b'/api/') == expected.content
+
+
+class SQLiteProfileTestCase(TestCase):
+    def pragmas(self, profile):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': os.path.join(directory.name, 'db.sqlite3')},
+                                  alias='profile_test')
+        self.addCleanup(wrapper.close)
+        with override_settings(SQLITE_PROFILE=profile), wrapper.cursor() as cursor:
+            values = {}
+            for name in ('journal_mode', 'busy_timeout', 'synchronous', 'cache_size', 'temp_store', 'mmap_size'):
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+        return values
+
+    def test_production_profile_applied_on_connect(self):
+        assert self.pragmas('production') == {
+            'journal_mode': 'wal', 'busy_timeout': 5000, 'synchronous': 1, 'cache_size': -20000, 'temp_store': 2,
+            'mmap_size': 128 * 1024 * 1024,
+        }
+
+    def test_default_profile_keeps_sqlite_defaults(self):
+        pragmas = self.pragmas('default')
+        assert pragmas['journal_mode'] == 'delete'
+        assert pragmas['synchronous'] == 2
+
+    def test_pragmas_not_counted_as_queries(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': os.path.join(directory.name, 'db.sqlite3')},
+                                  alias='profile_test')
+        self.addCleanup(wrapper.close)
+        wrapper.force_debug_cursor = True
+        stats = metrics.RequestStats()
+        token = metrics._current.set(stats)
+        try:
+            with override_settings(SQLITE_PROFILE='production'):
+                wrapper.ensure_connection()
+        finally:
+            metrics._current.reset(token)
+        assert stats.db_queries == 0
+        assert not wrapper.queries_log
+
+    def test_database_settings(self):
+        database = settings.DATABASES['default']
+        assert database['CONN_HEALTH_CHECKS'] and database['CONN_MAX_AGE']
+        assert connection.transaction_mode == 'IMMEDIATE'
+
+
+class ReplicaRoutingTestCase(TestCase):
+    def test_without_replica_reads_go_to_primary(self):
+        with replica_reads():
+            assert Project.objects.all().db == 'default'
+
+
+class ReplicaTestCase(TransactionTestCase):
+    """Чтение из файла-копии основной базы, обновляемой командой sync_replica"""
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = connections.configure_settings({'default': {}, 'replica': {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.directory.name, 'replica.sqlite3'),
+        }})['replica']
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections.settings['replica']
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='client', password='testpass123')
+        self.first = self.create_project("Первый")
+        self.sync()
+
+    def sync(self):
+        call_command('sync_replica', stdout=StringIO())
+
+    def create_project(self, name):
+        return Project.objects.create(name=name, client_user=self.user, deadline=date.today(), budget=1000,
+                                      status="В работе")
+
+    def names(self, url):
+        response = self.client.get(url)
+        assert response.status_code == 200
+        return [item['name'] for item in response.json()['results']]
+
+    def test_safe_requests_read_lagging_replica(self):
+        second = self.create_project("Второй")
+        assert self.names('/api/projects/') == ["Первый"]
+        assert self.names('/api/async/projects/') == ["Первый"]
+        assert self.client.get(f'/api/projects/{second.id}/').status_code == 404
+
+        self.sync()
+        assert self.names('/api/projects/') == ["Первый", "Второй"]
+        assert self.client.get(f'/api/projects/{second.id}/').status_code == 200
+
+    def test_writes_go_to_primary(self):
+        r = self.client.patch(f'/api/projects/{self.first.id}/', {'status': "Завершен"}, format='json')
+        assert r.status_code == 200
+        assert r.json()['status'] == "Завершен"
+        assert Project.objects.using('default').get(pk=self.first.id).status == "Завершен"
+        assert Project.objects.using('replica').get(pk=self.first.id).status == "В работе"
+
+    def test_cached_responses_read_primary(self):
+        Favour.objects.create(name="Дизайн", price=100, category="Дизайн")
+        self.sync()
+        assert [item['name'] for item in self.client.get('/api/favours/').json()['results']] == ["Дизайн"]
+
+        # Реплика еще не видит новую услугу, но в кэш под новым поколением попадает ответ основной базы
+        Favour.objects.create(name="Верстка", price=200, category="Разработка")
+        for _ in range(2):
+            assert self.names('/api/favours/') == ["Дизайн", "Верстка"]
+            assert [label for pk, label in self.client.get('/api/lookups/favours/').json()] == ["Дизайн", "Верстка"]
+
+        with primary_reads(), replica_reads():
+            assert Favour.objects.all().db == 'default'
+
+    def test_read_after_write_uses_primary(self):
+        with replica_reads():
+            assert Project.objects.all().db == 'replica'
+            assert UserProfile.objects.all().db == 'replica'
+            self.create_project("Второй")
+            assert Project.objects.all().db == 'default'
+            assert Project.objects.count() == 2
+        assert Project.objects.using('replica').count() == 1
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='client', password='testpass123')
+        for i in range(3):
+            Project.objects.create(name=f"Проект {i}", client_user=self.user, deadline=date.today(), budget=1000,
+                                   status="В работе")
+
+    def series(self, route, method='GET'):
+        values = metrics.snapshot().get((route, method))
+        return list(values) if values else [0] * (metrics.BUCKETS_OFFSET + len(metrics.get_buckets()) + 1)
+
+    def test_records_per_route(self):
+        before = self.series('projects-list')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/projects/')
+        after = self.series('projects-list')
+
+        assert after[metrics.COUNT] - before[metrics.COUNT] == 1
+        assert after[metrics.DB_QUERIES] - before[metrics.DB_QUERIES] == len(ctx.captured_queries)
+        assert after[metrics.DB_SECONDS] > before[metrics.DB_SECONDS]
+        assert after[metrics.SERIALIZER_SECONDS] > before[metrics.SERIALIZER_SECONDS]
+        assert after[metrics.DURATION] - before[metrics.DURATION] >= \
+            after[metrics.DB_SECONDS] - before[metrics.DB_SECONDS]
+        assert after[metrics.RESPONSE_BYTES] - before[metrics.RESPONSE_BYTES] == len(response.content)
+        assert sum(after[metrics.BUCKETS_OFFSET:]) - sum(before[metrics.BUCKETS_OFFSET:]) == 1
+
+        project = Project.objects.first()
+        before = self.series('projects-detail', 'PATCH')
+        self.client.patch(f'/api/projects/{project.id}/', {'status': "Завершен"}, format='json')
+        assert self.series('projects-detail', 'PATCH')[metrics.COUNT] - before[metrics.COUNT] == 1
+
+    def test_async_and_streaming_routes(self):
+        before = self.series('async-projects-list')
+        async_to_sync(AsyncClient().get)('/api/async/projects/')
+        after = self.series('async-projects-list')
+        assert after[metrics.COUNT] - before[metrics.COUNT] == 1
+        assert after[metrics.DB_QUERIES] - before[metrics.DB_QUERIES] == 2
+
+        before = self.series('user-directory')
+        response = self.client.get('/api/user-directory/')
+        content = b''.join(response.streaming_content)
+        after = self.series('user-directory')
+        assert after[metrics.RESPONSE_BYTES] - before[metrics.RESPONSE_BYTES] == len(content)
+
+    def test_finished_thread_shard_folded(self):
+        def worker():
+            metrics.record('thread-route', 'GET', 0.01, metrics.RequestStats(), 10)
+
+        shards = len(metrics._shards)
+        for _ in range(3):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+        gc.collect()
+
+        assert len(metrics._shards) == shards
+        values = self.series('thread-route')
+        assert values[metrics.COUNT] == 3 and values[metrics.RESPONSE_BYTES] == 30
+
+    def test_metrics_restricted_to_allowed_networks(self):
+        assert self.client.get('/metrics').status_code == 200
+        assert self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code == 403
+        with override_settings(METRICS_ALLOWED_NETWORKS=['203.0.113.0/24']):
+            assert self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code == 200
+            assert self.client.get('/metrics').status_code == 403
+
+    def test_prometheus_text(self):
+        self.client.get('/api/projects/')
+        self.client.get('/api/nothing-here/')
+        response = self.client.get('/metrics')
+        assert response.status_code == 200
+        assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+        text = response.content.decode()
+        assert '# TYPE http_request_duration_seconds histogram' in text
+        assert 'http_request_duration_seconds_bucket{route="projects-list",method="GET",le="+Inf"}' in text
+        assert 'http_request_db_queries_total{route="projects-list",method="GET"}' in text
+        assert 'http_response_bytes_total{route="<unmatched>",method="GET"}' in text
+        for line in text.splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                float(value)
+
+
+class SlowQueryLogTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = os.path.join(directory.name, 'slow.log')
+
+        self.client = APIClient()
+        user = User.objects.create_user(username='client', password='testpass123')
+        for i in range(3):
+            Project.objects.create(name=f"Проект {i}", client_user=user, deadline=date.today(), budget=1000,
+                                   status="В работе")
+
+    def slow_log(self, threshold=0):
+        return override_settings(SLOW_QUERY_THRESHOLD=threshold, SLOW_QUERY_LOG=self.log)
+
+    def entries(self):
+        return list(read_log(self.log)) if os.path.exists(self.log) else []
+
+    def test_normalize_sql(self):
+        assert normalize_sql(
+            'SELECT "a"."id" FROM "a"\n WHERE ("a"."id" IN (%s, %s, %s) AND "a"."name" = \'x\') LIMIT 21'
+        ) == 'SELECT "a"."id" FROM "a" WHERE ("a"."id" IN (...) AND "a"."name" = ?) LIMIT ?'
+        assert normalize_sql('SELECT * FROM "t2" WHERE "id" IN (%s)') == 'SELECT * FROM "t2" WHERE "id" IN (?)'
+
+    def test_logs_view_stack_and_plan(self):
+        with self.slow_log(), CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/projects/?status=В работе')
+        assert response.status_code == 200
+
+        entries = self.entries()
+        assert len(entries) == len(ctx.captured_queries)
+        assert not any('EXPLAIN' in query['sql'] for query in ctx.captured_queries)
+        entry = next(entry for entry in entries if 'FROM "clients_project"' in entry['sql'])
+        assert entry['view'] == 'projects-list' and entry['method'] == 'GET'
+        assert entry['params'] >= 1 and 'В работе' not in entry['sql']
+        assert any('clients_project' in line for line in entry['plan'])
+        assert entry['stack'] and not any('metrics.py' in frame for frame in entry['stack'])
+
+    def test_command_prints_top_shapes(self):
+        with self.slow_log():
+            for project in Project.objects.all():
+                self.client.get(f'/api/projects/{project.id}/')
+        output = StringIO()
+        with self.slow_log():
+            call_command('slow_queries', '--top', '1', '--sort', 'count', stdout=output)
+        text = output.getvalue()
+        assert 'раз' in text and 'projects-detail x' in text
+        assert 'план: ' in text
+
+    def test_off_by_default(self):
+        assert settings.SLOW_QUERY_THRESHOLD is None
+        with patch('clients.slowlog._record') as record:
+            self.client.get('/api/projects/')
+        record.assert_not_called()
+
+    def test_below_threshold_not_logged(self):
+        with self.slow_log(threshold=60):
+            self.client.get('/api/projects/')
+        with self.slow_log(threshold=None):
+            self.client.get('/api/projects/')
+        assert self.entries() == []
+
+
+class BootstrapTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(username='clientuser', email='c@example.com', password='x')
+        employee_user = User.objects.create_user(username='employeeuser', password='x')
+        employee_user.userprofile.fio = "Петров Петр"
+        employee_user.userprofile.save()
+        self.employee = Employee.objects.create(user=employee_user, position="Дизайнер", start_work_date=date.today())
+        self.favour = Favour.objects.create(name="Дизайн", price=20000, category="Дизайн", description="Длинно")
+        self.project = Project.objects.create(name="Сайт", client_user=self.client_user, deadline=date.today(),
+                                              budget=1000, status="В работе", description="Длинно")
+        self.service = ProjectService.objects.create(project=self.project, favour=self.favour,
+                                                     employee_user=employee_user, hours_spent=2.5)
+
+    def table(self, data, name):
+        return [dict(zip(data[name]['columns'], row)) for row in data[name]['rows']]
+
+    def test_all_datasets_in_fixed_queries(self):
+        with self.assertNumQueries(1 + len(DATASETS)):
+            r = self.client.get('/api/bootstrap/')
+        assert r.status_code == 200
+        data = r.json()
+        assert list(data) == list(DATASETS)
+
+        assert self.table(data, 'projects') == [{
+            'id': self.project.id, 'name': "Сайт", 'status': "В работе",
+            'client_user': self.client_user.id, 'client_user_username': 'clientuser',
+        }]
+        assert self.table(data, 'favours') == [
+            {'id': self.favour.id, 'name': "Дизайн", 'category': "Дизайн", 'price': '20000.00'}]
+        assert self.table(data, 'employees')[0]['fio'] == "Петров Петр"
+        service = self.table(data, 'project-services')[0]
+        assert service['project'] == self.project.id and service['hours_spent'] == '2.50'
+        assert service['employee_user'] == self.employee.user_id
+        assert {'username': 'clientuser', 'email': 'c@example.com'}.items() <= self.table(data, 'users')[0].items()
+        assert 'password' not in data['users']['columns']
+        assert not data['projects']['truncated']
+
+    def test_include(self):
+        with self.assertNumQueries(3):
+            r = self.client.get('/api/bootstrap/?include=favours,projects,favours')
+        assert list(r.json()) == ['favours', 'projects']
+
+        r = self.client.get('/api/bootstrap/?include=favours,nope')
+        assert r.status_code == 400
+        assert 'nope' in r.json()['include'][0]
+
+    def test_not_modified(self):
+        etag = self.client.get('/api/bootstrap/?include=projects,favours')['ETag']
+        with self.assertNumQueries(1):
+            r = self.client.get('/api/bootstrap/?include=favours,projects', HTTP_IF_NONE_MATCH=etag)
+        assert r.status_code == 304
+
+        # Набор без проектов не зависит от их версии, набор с клиентами проектов - зависит
+        favours_etag = self.client.get('/api/bootstrap/?include=favours')['ETag']
+        self.client_user.username = 'renamed'
+        self.client_user.save()
+        assert self.client.get('/api/bootstrap/?include=favours', HTTP_IF_NONE_MATCH=favours_etag).status_code == 304
+        r = self.client.get('/api/bootstrap/?include=projects,favours', HTTP_IF_NONE_MATCH=etag)
+        assert r.status_code == 200
+        assert self.table(r.json(), 'projects')[0]['client_user_username'] == 'renamed'
+
+    def test_row_limit(self):
+        Favour.objects.create(name="SEO", price=100, category="Маркетинг")
+        with override_settings(BOOTSTRAP_ROW_LIMIT=1):
+            data = self.client.get('/api/bootstrap/?include=favours').json()
+        assert data['favours']['rows'] == [[self.favour.id, "Дизайн", "Дизайн", '20000.00']]
+        assert data['favours']['truncated']
+
+
+class LookupTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.named = User.objects.create_user(username='ivanov', password='x')
+        self.named.userprofile.fio = "Иванов Иван"
+        self.named.userprofile.save()
+        self.plain = User.objects.create_user(username='petrov', password='x')
+        self.clients = [Client.objects.create(user=user, sphere="IT") for user in (self.named, self.plain)]
+        self.employees = [
+            Employee.objects.create(user=user, position="Дизайнер", start_work_date=date.today())
+            for user in (self.named, self.plain)
+        ]
+        self.project = Project.objects.create(name="Сайт", client_user=self.named, deadline=date.today(),
+                                              budget=1000, status="В работе")
+        self.favours = [Favour.objects.create(name=name, price=100, category="Дизайн") for name in ("Логотип", "Лендинг")]
+
+    def test_labels_match_str(self):
+        for resource, objects in (('clients', self.clients), ('employees', self.employees),
+                                  ('projects', [self.project]), ('favours', self.favours)):
+            with self.subTest(resource=resource):
+                with self.assertNumQueries(2):
+                    r = self.client.get(f'/api/lookups/{resource}/')
+                assert r.status_code == 200
+                assert r.json() == [[obj.pk, str(obj)] for obj in objects]
+
+        users = self.client.get('/api/lookups/users/').json()
+        assert [self.named.id, "Иванов Иван"] in users and [self.plain.id, 'petrov'] in users
+
+    def test_prefix_and_limit(self):
+        assert self.client.get('/api/lookups/favours/?q=Лен').json() == [[self.favours[1].id, "Лендинг"]]
+        assert self.client.get('/api/lookups/employees/?q=pet').json() == [[self.employees[1].id, "petrov (Дизайнер)"]]
+        assert self.client.get('/api/lookups/favours/?limit=1').json() == [[self.favours[0].id, "Логотип"]]
+        assert self.client.get('/api/lookups/favours/?limit=0').status_code == 400
+        assert self.client.get('/api/lookups/nope/').status_code == 404
+
+    def test_cached_until_change(self):
+        etag = self.client.get('/api/lookups/clients/')['ETag']
+        with self.assertNumQueries(0):
+            r = self.client.get('/api/lookups/clients/')
+        assert r['ETag'] == etag
+        with self.assertNumQueries(0):
+            assert self.client.get('/api/lookups/clients/', HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+        self.plain.userprofile.fio = "Петров Петр"
+        self.plain.userprofile.save()
+        r = self.client.get('/api/lookups/clients/', HTTP_IF_NONE_MATCH=etag)
+        assert r.status_code == 200 and r['ETag'] != etag
+        assert [self.clients[1].id, "Петров Петр"] in r.json()
+
+
+class BatchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.client_user = User.objects.create_user(username='clientuser', password='testpass123')
+        Client.objects.create(user=self.client_user, sphere="IT")
+        self.favour = Favour.objects.create(name="Дизайн", price=20000, category="Дизайн")
+
+    def project_body(self, name="Сайт"):
+        return {"name": name, "client_user": self.client_user.id, "deadline": str(date.today()),
+                "budget": "1000.00", "status": "В работе"}
+
+    def batch(self, requests, **kwargs):
+        return self.client.post('/api/batch/', {"requests": requests, **kwargs}, format='json')
+
+    def test_create_project_with_services(self):
+        r = self.batch([
+            {"method": "POST", "path": "/api/projects/", "body": self.project_body()},
+            {"method": "POST", "path": "/api/project-services/",
+             "body": {"project": "{{0.id}}", "favour": self.favour.id, "hours_spent": 2}},
+            {"method": "GET", "path": "/api/project-services/?project={{0.id}}"},
+            {"method": "GET", "path": "/api/projects/{{0.id}}/"},
+        ], atomic=True)
+        assert r.status_code == 200
+        data = r.json()
+        assert not data['rolled_back']
+        assert [item['status'] for item in data['responses']] == [201, 201, 200, 200]
+
+        project = Project.objects.get(name="Сайт")
+        services = data['responses'][2]['body']['results']
+        assert [service['project'] for service in services] == [project.id]
+        assert data['responses'][3]['body']['stats']['total_hours'] == '2.00'
+        assert data['responses'][3]['headers']['ETag'].startswith('W/"')
+
+    def test_atomic_rolls_back_on_error(self):
+        r = self.batch([
+            {"method": "POST", "path": "/api/projects/", "body": self.project_body()},
+            {"method": "POST", "path": "/api/project-services/", "body": {"project": "{{0.id}}"}},
+            {"method": "DELETE", "path": f"/api/favours/{self.favour.id}/"},
+        ], atomic=True)
+        data = r.json()
+        assert data['rolled_back']
+        assert [item['status'] for item in data['responses']] == [201, 400]
+        assert 'favour' in data['responses'][1]['body']
+        assert not Project.objects.exists()
+        assert Favour.objects.filter(pk=self.favour.pk).exists()
+
+    def test_non_atomic_continues_after_error(self):
+        r = self.batch([
+            {"method": "POST", "path": "/api/projects/", "body": {"name": "Без клиента"}},
+            {"method": "POST", "path": "/api/projects/", "body": self.project_body("Второй")},
+            {"method": "PATCH", "path": "/api/projects/{{1.id}}/", "body": {"status": "Завершен"}},
+        ])
+        data = r.json()
+        assert [item['status'] for item in data['responses']] == [400, 201, 200]
+        assert list(Project.objects.values_list('name', 'status')) == [("Второй", "Завершен")]
+
+    def test_routes_and_references(self):
+        data = self.batch([
+            {"method": "GET", "path": "/api/search/?q=x"},
+            {"method": "GET", "path": "/api/nope/"},
+            {"method": "GET", "path": "/api/projects/{{5.id}}/"},
+            {"method": "GET", "path": "/api/favours/"},
+            {"method": "GET", "path": "/api/favours/{{3.results.0.id}}/"},
+        ]).json()
+        assert [item['status'] for item in data['responses']] == [404, 404, 400, 200, 200]
+        assert data['responses'][4]['body']['name'] == "Дизайн"
+
+    def test_async_routes_rejected(self):
+        data = self.batch([
+            {"method": "GET", "path": "/api/async/projects/"},
+            {"method": "GET", "path": f"/api/async/favours/{self.favour.id}/"},
+            {"method": "GET", "path": "/api/"},
+            {"method": "GET", "path": "/api/projects/dashboard/"},
+        ]).json()
+        assert [item['status'] for item in data['responses']] == [404, 404, 404, 200]
+
+    def test_unhandled_error_keeps_other_responses(self):
+        with patch.object(ProjectsViewset, 'dashboard', side_effect=RuntimeError("сбой")), \
+                self.assertLogs('clients.batch', 'ERROR'):
+            r = self.batch([
+                {"method": "POST", "path": "/api/projects/", "body": self.project_body()},
+                {"method": "GET", "path": "/api/projects/dashboard/"},
+                {"method": "GET", "path": "/api/projects/{{0.id}}/"},
+            ])
+        assert r.status_code == 200
+        assert [item['status'] for item in r.json()['responses']] == [201, 500, 200]
+        assert Project.objects.filter(name="Сайт").exists()
+
+        with patch.object(ProjectsViewset, 'dashboard', side_effect=RuntimeError("сбой")), \
+                self.assertLogs('clients.batch', 'ERROR'):
+            data = self.batch([
+                {"method": "POST", "path": "/api/projects/", "body": self.project_body("Второй")},
+                {"method": "GET", "path": "/api/projects/dashboard/"},
+            ], atomic=True).json()
+        assert data['rolled_back'] and [item['status'] for item in data['responses']] == [201, 500]
+        assert not Project.objects.filter(name="Второй").exists()
+
+    def test_validation(self):
+        assert self.batch([]).status_code == 400
+        assert self.batch([{"method": "TRACE", "path": "/api/favours/"}]).status_code == 400
+        with override_settings(BATCH_MAX_REQUESTS=1):
+            r = self.batch([{"method": "GET", "path": "/api/favours/"}] * 2)
+        assert r.status_code == 400 and 'requests' in r.json()
+
+    def test_csrf_checked_once_for_batch(self):
+        client = APIClient(enforce_csrf_checks=True)
+        client.login(username='testuser', password='testpass123')
+        r = client.post('/api/batch/', {"requests": [
+            {"method": "POST", "path": "/api/projects/", "body": self.project_body()}]}, format='json')
+        assert r.status_code == 403
+        assert not Project.objects.exists()
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetTestCase(EndpointQueriesMixin, TestCase):
+    """Бюджеты запросов из clients/benchmarks.py на каждое действие API, без замеров времени"""
@@ -0,0 +1,131 @@
+"""Миниатюры загруженных изображений клиентов, сотрудников и отзывов
+
+После сохранения объекта с новым изображением миниатюра строится в пуле
+потоков после фиксации транзакции, а не в запросе. Файл миниатюры лежит рядом
+с оригиналом, размер входит в имя (``clients/logo.png`` ->
+``clients/logo_thumb128.webp``), а имя записывается в поле
+``picture_thumbnail`` через update(), без сигналов save. После смены
+THUMBNAIL_SIZE прежние миниатюры не подходят по имени и перестраиваются
+командой ``thumbnails``; файл с именем по хешу оригинала и размеру не
+меняется, поэтому его можно кешировать бессрочно.
+
+Размер (наибольшая сторона) и число потоков задаются настройками
+THUMBNAIL_SIZE и THUMBNAIL_WORKERS; при THUMBNAIL_WORKERS = 0 миниатюра
+строится сразу в том же потоке. Недостающие миниатюры:
+
+    python manage.py thumbnails
+"""
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from PIL import Image, ImageOps
+
+from clients.models import Client, Employee, Review
+from clients.storage import is_content_addressed
+from clients.versions import bump_versions
+
+
+logger = logging.getLogger(__name__)
+
+# Модель -> (поле оригинала, поле миниатюры)
+THUMBNAIL_FIELDS = {
+    Client: ('picture', 'picture_thumbnail'),
+    Employee: ('picture', 'picture_thumbnail'),
+    Review: ('picture', 'picture_thumbnail'),
+}
+
+_executor = None
+
+
+def get_size():
+    return getattr(settings, 'THUMBNAIL_SIZE', 128)
+
+
+def thumbnail_name(name, size=None):
+    root, ext = posixpath.splitext(name)
+    return f'{root}_thumb{size or get_size()}.webp'
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2), thread_name_prefix='thumbnails')
+    return _executor
+
+
+def render_thumbnail(source, size):
+    """Файл изображения -> байты WebP, вписанные в квадрат size x size"""
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        image.thumbnail((size, size))
+        output = BytesIO()
+        image.save(output, 'WEBP', quality=80)
+    return output.getvalue()
+
+
+def build_thumbnail(model, pk, name):
+    """Строит миниатюру для изображения ``name`` объекта и записывает ее имя в модель"""
+    field_name, thumbnail_field_name = THUMBNAIL_FIELDS[model]
+    storage = model._meta.get_field(thumbnail_field_name).storage
+    size = get_size()
+    target = thumbnail_name(name, size)
+    if is_content_addressed(name) and storage.exists(target):
+        # Такое же изображение уже загружали, миниатюра этого размера к нему готова
+        saved = target
+    else:
+        try:
+            with model._meta.get_field(field_name).storage.open(name) as source:
+                data = render_thumbnail(source, size)
+        except (OSError, ValueError):
+            logger.warning("Не удалось построить миниатюру %s", name, exc_info=True)
+            return None
+        if storage.exists(target):
+            storage.delete(target)
+        saved = storage.save(target, ContentFile(data))
+    # Изображение могли заменить, пока строилась миниатюра
+    if model.objects.filter(pk=pk, **{field_name: name}).update(**{thumbnail_field_name: saved}):
+        bump_versions(model)
+    return saved
+
+
+def _build_in_worker(model, pk, name):
+    try:
+        build_thumbnail(model, pk, name)
+    except Exception:
+        logger.exception("Ошибка при построении миниатюры %s", name)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnail(model, pk, name):
+    if getattr(settings, 'THUMBNAIL_WORKERS', 2) == 0:
+        build_thumbnail(model, pk, name)
+    else:
+        get_executor().submit(_build_in_worker, model, pk, name)
+
+
+def _schedule_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    field_name, thumbnail_field_name = THUMBNAIL_FIELDS[sender]
+    name = getattr(instance, field_name).name
+    thumbnail = getattr(instance, thumbnail_field_name).name
+    expected = thumbnail_name(name) if name else ''
+    if thumbnail and thumbnail != expected:
+        # Миниатюра прежнего изображения: до готовности новой клиент покажет оригинал
+        sender.objects.filter(pk=instance.pk).update(**{thumbnail_field_name: ''})
+        setattr(instance, thumbnail_field_name, '')
+    if name and thumbnail != expected:
+        pk = instance.pk
+        transaction.on_commit(lambda: schedule_thumbnail(sender, pk, name))
+
+for _model in THUMBNAIL_FIELDS:
+    post_save.connect(_schedule_on_save, sender=_model, dispatch_uid=f'thumbnail_{_model._meta.label_lower}')
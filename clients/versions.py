@@ -0,0 +1,117 @@
+"""Версии таблиц для условных GET-запросов
+
+Каждое сохранение или удаление отслеживаемой модели увеличивает счетчик ее
+таблицы. ETag ответа строится из счетчиков всех таблиц, которые читает
+сериализатор, поэтому проверка If-None-Match стоит одного запроса к
+TableVersion и не трогает сами таблицы.
+"""
+import hashlib
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from clients.models import Client, Employee, Favour, Project, ProjectService, ProjectStats, Review, TableVersion
+from general.models import UserProfile
+
+
+TRACKED_MODELS = (Client, Project, Favour, Employee, ProjectService, Review, ProjectStats, User, UserProfile)
+
+
+def table_label(model):
+    return model._meta.label_lower
+
+
+def bump_versions(*models):
+    """Увеличивает версии таблиц; вызывается в той же транзакции, что и запись"""
+    for model in models:
+        label = table_label(model)
+        if TableVersion.objects.filter(label=label).update(version=F('version') + 1):
+            continue
+        try:
+            with transaction.atomic():
+                TableVersion.objects.create(label=label, version=1)
+        except IntegrityError:
+            TableVersion.objects.filter(label=label).update(version=F('version') + 1)
+
+
+def _versions_query(models):
+    labels = sorted({table_label(model) for model in models})
+    return labels, TableVersion.objects.filter(label__in=labels).values_list('label', 'version')
+
+
+def get_versions(models):
+    labels, query = _versions_query(models)
+    versions = dict(query)
+    return [(label, versions.get(label, 0)) for label in labels]
+
+
+async def aget_versions(models):
+    labels, query = _versions_query(models)
+    versions = {label: version async for label, version in query}
+    return [(label, versions.get(label, 0)) for label in labels]
+
+
+def _etag(versions, parts):
+    source = ';'.join(f'{label}:{version}' for label, version in versions)
+    source = '|'.join([source, *map(str, parts)])
+    return 'W/"%s"' % hashlib.sha1(source.encode()).hexdigest()[:20]
+
+
+def make_etag(models, *parts):
+    """Слабый ETag из версий таблиц и дополнительных частей (например, pk объекта)"""
+    return _etag(get_versions(models), parts)
+
+
+async def amake_etag(models, *parts):
+    return _etag(await aget_versions(models), parts)
+
+
+def etag_matches(request, etag):
+    """Слабое сравнение ETag с заголовком If-None-Match"""
+    header = request.headers.get('If-None-Match')
+    if not header or not etag:
+        return False
+    etags = {tag.removeprefix('W/') for tag in parse_etags(header)}
+    return '*' in etags or etag.removeprefix('W/') in etags
+
+
+def not_modified(etag):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    return response
+
+
+def related_models(model, paths):
+    """Модели, через которые проходят пути select_related/prefetch_related"""
+    models = {model}
+    for path in paths:
+        current = model
+        for name in path.split('__'):
+            current = current._meta.get_field(name).related_model
+            models.add(current)
+    return models
+
+
+def _bump_on_save(sender, raw=False, **kwargs):
+    if not raw:
+        bump_versions(sender)
+
+
+def _bump_on_delete(sender, instance, origin=None, **kwargs):
+    # При каскадном удалении версия каждой таблицы увеличивается один раз
+    if origin is not None and origin is not instance:
+        bumped = origin.__dict__.setdefault('_bumped_versions', set())
+        if sender in bumped:
+            return
+        bumped.add(sender)
+    bump_versions(sender)
+
+
+for _model in TRACKED_MODELS:
+    post_save.connect(_bump_on_save, sender=_model, dispatch_uid=f'bump_version_save_{table_label(_model)}')
+    post_delete.connect(_bump_on_delete, sender=_model, dispatch_uid=f'bump_version_delete_{table_label(_model)}')
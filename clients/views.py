@@ -1,43 +1,158 @@
-#from django.http import HttpResponse
-#from django.shortcuts import render
-
-#from django.views import View
-#from clients.models import Client, Project
-
-#from django.views.generic import TemplateView
+import json
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views.static import serve
+from rest_framework import serializers
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from general.models import UserProfile
+
+from clients import metrics
+from clients.bootstrap import DATASETS, bootstrap_models, build_bootstrap
+from clients.lookups import LOOKUPS, get_max_limit, lookups_cache
+from clients.replica import replica_reads
+from clients.search import SOURCES, search
+from clients.storage import is_content_addressed
+from clients.versions import etag_matches, make_etag, not_modified
+
+# Сколько строк читается из курсора за раз и отправляется одним куском ответа
+USER_DIRECTORY_CHUNK_SIZE = 2000
+
+
+def _user_directory_rows(users):
+    for row in users.iterator(chunk_size=USER_DIRECTORY_CHUNK_SIZE):
+        profile_id = row.pop('userprofile__id')
+        fio = row.pop('userprofile__fio')
+        row['userprofile'] = {'fio': fio} if profile_id is not None else None
+        yield row
+
+
+def _stream_json_array(rows):
+    """Отдает JSON-массив кусками, не собирая его целиком в памяти"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    chunk = ['[']
+    separator = ''
+    for row in rows:
+        chunk.append(separator + encoder.encode(row))
+        separator = ','
+        if len(chunk) >= USER_DIRECTORY_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
+@api_view(['GET'])
+def user_directory(request):
+    """Справочник пользователей: id, username, email и ФИО из профиля
+
+    ``?q=`` ищет по началу логина, почты или ФИО. Строки читаются из базы
+    порциями и сразу уходят клиенту, поэтому память не растет с числом
+    пользователей.
+    """
+    users = User.objects.values('id', 'username', 'email', 'userprofile__id', 'userprofile__fio').order_by('id')
+    query = request.query_params.get('q', '').strip()
+    if query:
+        users = users.filter(
+            Q(username__istartswith=query) | Q(email__istartswith=query) | Q(userprofile__fio__istartswith=query)
+        )
+    return StreamingHttpResponse(
+        _stream_json_array(_user_directory_rows(users)),
+        content_type='application/json',
+    )
+
+
+SEARCH_MAX_LIMIT = 100
+
 
 @api_view(['GET'])
-def user_list(request):
-    users = User.objects.prefetch_related('userprofile').all()
-    data = []
-    for user in users:
-        data.append({
-            'id': user.id, 
-            'username': user.username, 
-            'email': user.email,
-            'userprofile': {
-                'fio': user.userprofile.fio if hasattr(user, 'userprofile') else None
-            } if hasattr(user, 'userprofile') else None
-        })
-    return Response(data)
+def search_view(request):
+    """Полнотекстовый поиск: ``?q=`` по проектам, услугам, отзывам и людям
+
+    Результаты упорядочены по релевантности. ``?kind=project,review``
+    ограничивает типы документов, ``?limit=`` - число результатов.
+    """
+    kinds = [kind for kind in request.query_params.get('kind', '').split(',') if kind]
+    unknown = sorted(set(kinds) - set(SOURCES))
+    if unknown:
+        raise serializers.ValidationError({'kind': [f"Неизвестные типы: {', '.join(unknown)}"]})
+    limit = serializers.IntegerField(min_value=1, max_value=SEARCH_MAX_LIMIT).run_validation(
+        request.query_params.get('limit', 20))
+    return Response(search(request.query_params.get('q', ''), kinds or None, limit))
+
+
+@api_view(['GET'])
+def bootstrap_view(request):
+    """Справочные таблицы для первой загрузки страницы одним запросом
+
+    ``?include=project-services,projects`` выбирает наборы (clients/bootstrap.py),
+    по умолчанию отдаются все. Ответ с ETag: повторная загрузка без изменений
+    получает 304.
+    """
+    names = [name for name in request.query_params.get('include', '').split(',') if name] or list(DATASETS)
+    unknown = sorted(set(names) - set(DATASETS))
+    if unknown:
+        raise serializers.ValidationError({'include': [f"Неизвестные наборы: {', '.join(unknown)}"]})
+    names = list(dict.fromkeys(names))
+
+    with replica_reads():
+        etag = make_etag(bootstrap_models(names), 'bootstrap', *sorted(names))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        data = build_bootstrap(names)
+    response = Response(data)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
 
 @api_view(['GET'])
-def user_list(request):
-    users = User.objects.prefetch_related('userprofile').all()
-    data = []
-    for user in users:
-        data.append({
-            'id': user.id, 
-            'username': user.username, 
-            'email': user.email,
-            'userprofile': {
-                'fio': user.userprofile.fio
-            } if hasattr(user, 'userprofile') and user.userprofile else None
-        })
-    return Response(data)
+def lookup_view(request, resource):
+    """Пары ``[id, подпись]`` для выпадающего списка (clients/lookups.py)
+
+    ``?q=`` оставляет подписи, начинающиеся с подстроки, ``?limit=`` ограничивает
+    число пар. Ответ кэшируется до изменения данных и отдается с ETag.
+    """
+    lookup = LOOKUPS.get(resource)
+    if lookup is None:
+        raise Http404(f"Неизвестный справочник: {resource}")
+    prefix = request.query_params.get('q', '').strip()
+    max_limit = get_max_limit()
+    limit = serializers.IntegerField(min_value=1, max_value=max_limit).run_validation(
+        request.query_params.get('limit', max_limit))
+
+    def make_response():
+        with replica_reads():
+            etag = make_etag(lookup.models(), 'lookups', resource, prefix, limit)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            pairs = lookup.pairs(prefix, limit)
+        response = Response(pairs)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    return lookups_cache.respond(request, make_response)
+
+
+# Файл с именем по содержимому не меняется: кеш не перепроверяет его год
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def media_view(request, path):
+    """Загруженные файлы при DEBUG; файлы с именем по хешу содержимого кешируются бессрочно"""
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_content_addressed(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
 
+def metrics_view(request):
+    """Метрики запросов процесса для Prometheus (clients/metrics.py)"""
+    if not metrics.allowed(request):
+        raise PermissionDenied
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)